@@ -1,13 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, Header, Request
 from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy import func, case, cast, Integer
+from sqlalchemy import cast, Integer
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import asyncio
 import json
-from . import crud, models, schemas, router as smart_router, utils
+from . import crud, models, schemas, router as smart_router, utils, routing_cache, http_clients, keyword_matcher, sse, auth_cache, db_async, proxy_metrics, request_timing, dashboard_data, stats_rollup, log_count, log_search
 from .database import get_db, SessionLocal
+from .log_writer import log_writer
+from .concurrency import concurrency
+from .circuit_breaker import circuit_breakers
+from .api_key_usage import api_key_usage
+from .loop_monitor import loop_monitor
+from .think_filter import ThinkStreamFilter
+from .stream_stats import StreamStats
 import time
 import logging
 import httpx
@@ -23,6 +30,22 @@ logger = logging.getLogger(__name__)
 router = APIRouter() # Management APIs
 proxy_router = APIRouter() # OpenAI/Anthropic Compatibility APIs
 
+def _upstream_error_status(e: Exception) -> int:
+    """Status code recorded for a failed upstream attempt: the upstream's own status
+    if it answered, 504 for timeouts (so circuit breakers can tell them apart), else 503."""
+    if isinstance(e, httpx.TimeoutException):
+        return 504
+    response = getattr(e, 'response', None)
+    return response.status_code if response is not None else 503
+
+async def _log_upstream_exception(provider, api_key, start_time: float, e: Exception, request_body: str):
+    """Logs an attempt that raised before the upstream response could be logged."""
+    await log_writer.submit(schemas.CallLogCreate(
+        provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=False,
+        status_code=_upstream_error_status(e), response_time_ms=int((time.time() - start_time) * 1000),
+        error_message=str(e) or type(e).__name__, request_body=request_body
+    ))
+
 # Authentication dependency for internal management APIs
 from fastapi.security import OAuth2PasswordBearer
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
@@ -75,114 +98,41 @@ def get_system_status(db: Session = Depends(get_db)):
     return {
         "Groups": [schemas.GroupSimple(id=g.id, name=g.name) for g in crud.get_groups(db)],
         "Models": crud.get_providers_simple(db),
-        "Association": crud.get_concurrency_status(db)
+        "Association": crud.get_concurrency_status(db, live_counts=concurrency.snapshot()),
+        "CircuitBreakers": circuit_breakers.status()
     }
 
-@router.get("/dashboard/stats", response_model=dict)
-def get_dashboard_stats(db: Session = Depends(get_db), admin: str = Depends(get_current_admin)):
-    from datetime import datetime, timedelta
-    
-    # 我們將統計範圍限制在最近 10,000 條記錄（或最近 30 天，這裡維持原邏輯的「最近」概念，但改用 ID 範圍或全表聚合）
-    # 為了性能，我們直接對數據庫進行聚合查詢
-    
-    # 1. 基礎統計 (Summary)
-    summary_query = db.query(
-        func.count(models.CallLog.id).label('total_calls'),
-        func.sum(case((models.CallLog.is_success == True, 1), else_=0)).label('success_calls'),
-        func.sum(models.CallLog.total_tokens).label('total_tokens'),
-        func.sum(models.CallLog.cost).label('total_cost')
-    ).filter(models.CallLog.provider_id.isnot(None)).first()
-    
-    total_calls = summary_query.total_calls or 0
-    success_rate = (summary_query.success_calls / total_calls * 100) if total_calls > 0 else 0
-    api_keys_count = db.query(func.count(models.APIKey.id)).scalar()
-
-    # 2. 模型使用分佈 & 平均響應時間 & 成本 (按模型分組)
-    # 這裡使用 JOIN 以獲取模型名稱
-    model_stats_query = db.query(
-        models.ApiProvider.model,
-        func.count(models.CallLog.id).label('count'),
-        func.avg(models.CallLog.response_time_ms).label('avg_time'),
-        func.sum(models.CallLog.cost).label('total_cost')
-    ).join(models.ApiProvider, models.CallLog.provider_id == models.ApiProvider.id)\
-     .group_by(models.ApiProvider.model).all()
-
-    model_distribution = [{"name": r.model, "value": r.count} for r in model_stats_query if r.model]
-    
-    model_names = sorted([r.model for r in model_stats_query if r.model])
-    model_avg_times = {r.model: round(r.avg_time or 0) for r in model_stats_query}
-    model_costs_map = {r.model: round(r.total_cost or 0, 4) for r in model_stats_query}
+@router.get("/metrics/loop", response_model=dict)
+def get_loop_metrics(admin: str = Depends(get_current_admin)):
+    """
+    Event-loop lag histogram and, if enabled, blocking-call stalls with the
+    stack that caused them.
+    """
+    return loop_monitor.stats()
 
-    # 3. 每日調用次數 (最近 7 天)
-    now = datetime.now(TAIPEI_TZ)
-    start_date = (now - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    # SQLite 的日期處理比較特殊，這裡使用 func.date
-    daily_query = db.query(
-        func.date(models.CallLog.request_timestamp).label('date'),
-        func.count(models.CallLog.id).label('count')
-    ).filter(models.CallLog.request_timestamp >= start_date)\
-     .group_by(func.date(models.CallLog.request_timestamp))\
-     .order_by('date').all()
-
-    daily_counts_map = {r.date: r.count for r in daily_query}
-    sorted_dates = []
-    daily_data = []
-    for i in range(7):
-        d_str = (start_date + timedelta(days=i)).strftime('%Y-%m-%d')
-        sorted_dates.append(d_str)
-        daily_data.append(daily_counts_map.get(d_str, 0))
-
-    # 4. 端點統計 (Endpoint Stats)
-    endpoint_query = db.query(
-        models.ApiProvider.api_endpoint,
-        func.count(models.CallLog.id).label('total'),
-        func.sum(case((models.CallLog.is_success == True, 1), else_=0)).label('success'),
-        func.avg(models.CallLog.response_time_ms).label('avg_time')
-    ).join(models.ApiProvider, models.CallLog.provider_id == models.ApiProvider.id)\
-     .group_by(models.ApiProvider.api_endpoint).all()
-
-    from urllib.parse import urlparse
-    endpoint_names = []
-    endpoint_success_rates = []
-    endpoint_avg_times = []
-    endpoint_total_calls = []
-
-    for r in sorted(endpoint_query, key=lambda x: x.api_endpoint):
-        try:
-            name = urlparse(r.api_endpoint).netloc or r.api_endpoint
-        except:
-            name = r.api_endpoint
-        endpoint_names.append(name)
-        endpoint_total_calls.append(r.total)
-        endpoint_success_rates.append(round((r.success / r.total * 100)) if r.total > 0 else 0)
-        endpoint_avg_times.append(round(r.avg_time or 0))
+@router.get("/log-writer/stats", response_model=dict)
+def get_log_writer_stats(admin: str = Depends(get_current_admin)):
+    """
+    Queue depth, throughput and dropped-record counters of the call log writer.
+    """
+    return log_writer.stats()
 
-    return {
-        "summary": {
-            "total_calls": total_calls,
-            "success_rate": round(success_rate, 1),
-            "total_tokens": int(summary_query.total_tokens or 0),
-            "api_keys": api_keys_count,
-            "total_cost": round(summary_query.total_cost or 0, 4)
-        },
-        "model_distribution": model_distribution,
-        "daily_calls": {"dates": sorted_dates, "values": daily_data},
-        "endpoint_stats": {
-            "names": endpoint_names,
-            "success_rates": endpoint_success_rates,
-            "avg_times": endpoint_avg_times,
-            "total_calls": endpoint_total_calls
-        },
-        "model_stats": {
-            "names": model_names,
-            "avg_times": [model_avg_times.get(m, 0) for m in model_names]
-        },
-        "cost_stats": {
-            "names": model_names,
-            "values": [model_costs_map.get(m, 0) for m in model_names]
-        }
-    }
+@router.get("/dashboard/stats", response_model=dict)
+async def get_dashboard_stats(admin: str = Depends(get_current_admin)):
+    # 所有圖表數據由 dashboard_data 一次算出並短暫快取 (數據來自預先彙總的統計表)
+    return await dashboard_data.get_async()
+
+@router.get("/dashboard/latency", response_model=List[dict])
+async def get_latency_percentiles(window_hours: Optional[float] = None, admin: str = Depends(get_current_admin)):
+    """
+    p50 / p90 / p99 / p99.9 of successful response time and stream TTFT per
+    provider over the last `window_hours` (omit or pass 0 for all time; the
+    dashboard uses 24), merged from the rollup sketches instead of scanning
+    call_logs.
+    """
+    if window_hours is not None and window_hours < 0:
+        raise HTTPException(status_code=400, detail="window_hours must not be negative")
+    return await db_async.run_in_session(stats_rollup.latency_percentiles, window_hours or None)
 
 @router.get("/public/groups", response_model=List[schemas.GroupSimple])
 def get_public_groups(db: Session = Depends(get_db)):
@@ -206,7 +156,7 @@ async def get_api_key_from_bearer(
     request: Request,
     db: Session = Depends(get_db),
     authorization: HTTPAuthorizationCredentials = Depends(auth_scheme)
-) -> models.APIKey:
+) -> auth_cache.CachedAPIKey:
     """
     Validates the API key from the 'Authorization: Bearer <key>' header.
     """
@@ -216,12 +166,13 @@ async def get_api_key_from_bearer(
     if not api_key_str:
         error_detail = "No API key provided."
     else:
-        db_api_key = crud.get_api_key_by_key(db, key=api_key_str)
+        with request_timing.phase("auth"):
+            db_api_key = await auth_cache.lookup_async(api_key_str)
         if not db_api_key or not db_api_key.is_active:
             error_detail = f"Incorrect API key provided or key has been revoked: {api_key_str[:10]}..."
         else:
             # Success
-            crud.update_api_key_last_used(db, db_api_key.id)
+            api_key_usage.touch(db_api_key.id)
             return db_api_key
 
     # Log Authentication Failure
@@ -232,7 +183,7 @@ async def get_api_key_from_bearer(
         except:
             body_str = "Could not read request body"
 
-        crud.create_call_log(db, schemas.CallLogCreate(
+        await log_writer.submit(schemas.CallLogCreate(
             provider_id=None,
             api_key_id=None,
             response_timestamp=datetime.now(TAIPEI_TZ),
@@ -250,13 +201,27 @@ async def get_api_key_from_bearer(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+def _disable_provider_for_quota(db: Session, provider_id: int, details: str):
+    crud.update_provider(db, provider_id, {"is_active": False})
+    crud.create_maintenance_error(db=db, provider_id=provider_id, error_type="INSUFFICIENT_QUOTA", details=details)
+
+async def _resolve_group(api_key: auth_cache.CachedAPIKey, model_name: Optional[str]) -> Optional[str]:
+    """Maps the requested model to one of the key's authorized groups
+    (see model_alias), or None if the key may not use it."""
+    with request_timing.phase("alias"):
+        snapshot = await routing_cache.get_snapshot_async()
+        matched = snapshot.alias_index.resolve(model_name, api_key.group_names)
+    if matched and matched != model_name:
+        logger.info(f"Mapping requested model '{model_name}' to authorized group '{matched}'")
+    return matched
+
 # Dependency to get API key from Anthropic's custom header
 async def get_api_key_from_anthropic_header(
     request: Request,
     db: Session = Depends(get_db),
     x_api_key: Optional[str] = Header(None, alias="x-api-key"),
     authorization: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))
-) -> models.APIKey:
+) -> auth_cache.CachedAPIKey:
     """
     Validates the API key from 'x-api-key' header OR 'Authorization: Bearer' header.
     """
@@ -268,12 +233,13 @@ async def get_api_key_from_anthropic_header(
     if not api_key_str:
         error_detail = "No API key provided."
     else:
-        db_api_key = crud.get_api_key_by_key(db, key=api_key_str)
+        with request_timing.phase("auth"):
+            db_api_key = await auth_cache.lookup_async(api_key_str)
         if not db_api_key or not db_api_key.is_active:
             error_detail = f"Invalid API key: {api_key_str[:10]}..."
         else:
             # Success
-            crud.update_api_key_last_used(db, db_api_key.id)
+            api_key_usage.touch(db_api_key.id)
             return db_api_key
 
     # Log Authentication Failure
@@ -284,7 +250,7 @@ async def get_api_key_from_anthropic_header(
         except:
             body_str = "Could not read request body"
 
-        crud.create_call_log(db, schemas.CallLogCreate(
+        await log_writer.submit(schemas.CallLogCreate(
             provider_id=None,
             api_key_id=None,
             response_timestamp=datetime.now(TAIPEI_TZ),
@@ -367,37 +333,40 @@ async def sync_providers(request: schemas.ModelImportRequest, db: Session = Depe
         elif request.filter_mode == 'Exclude':
             models_list = [m for m in models_list if m.get('id') and keyword not in m.get('id').lower()]
 
-    imported = 0
-    for model_info in models_list:
-        model_id = model_info.get('id')
-        if not model_id: continue
-        
-        target_endpoint = f"{v1_base_url}/chat/completions"
-        existing = db.query(models.ApiProvider).filter(
-            models.ApiProvider.api_endpoint == target_endpoint,
-            models.ApiProvider.api_key == request.api_key,
-            models.ApiProvider.model == model_id
-        ).first()
-        
-        if existing: continue
+    def import_missing(db: Session) -> int:
+        imported = 0
+        for model_info in models_list:
+            model_id = model_info.get('id')
+            if not model_id: continue
+            
+            target_endpoint = f"{v1_base_url}/chat/completions"
+            existing = db.query(models.ApiProvider).filter(
+                models.ApiProvider.api_endpoint == target_endpoint,
+                models.ApiProvider.api_key == request.api_key,
+                models.ApiProvider.model == model_id
+            ).first()
         
-        formatted_name = request.alias if request.alias else model_id.replace('/', '.')
-        # For NVIDIA and other model-specific providers, ensure the endpoint includes the model if necessary,
-        # but the primary fix requested is ensuring 'model' field (model_id) is used correctly.
-        provider_data = schemas.ApiProviderCreate(
-            name=formatted_name,
-            api_endpoint=target_endpoint,
-            api_key=request.api_key,
-            model=model_id, # Ensure this is the raw model_id from the provider
-            price_per_million_tokens=0,
-            input_price_per_million_tokens=0,
-            output_price_per_million_tokens=0,
-            type=request.default_type,
-            is_active=True
-        )
-        crud.create_provider(db, provider_data)
-        imported += 1
+            if existing: continue
         
+            formatted_name = request.alias if request.alias else model_id.replace('/', '.')
+            # For NVIDIA and other model-specific providers, ensure the endpoint includes the model if necessary,
+            # but the primary fix requested is ensuring 'model' field (model_id) is used correctly.
+            provider_data = schemas.ApiProviderCreate(
+                name=formatted_name,
+                api_endpoint=target_endpoint,
+                api_key=request.api_key,
+                model=model_id, # Ensure this is the raw model_id from the provider
+                price_per_million_tokens=0,
+                input_price_per_million_tokens=0,
+                output_price_per_million_tokens=0,
+                type=request.default_type,
+                is_active=True
+            )
+            crud.create_provider(db, provider_data)
+            imported += 1
+        return imported
+
+    imported = await db_async.run_sync(import_missing, db)
     return {"detail": f"Synced {imported} models", "count": imported}
 
 # Endpoints for Groups
@@ -414,6 +383,16 @@ def read_groups(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
     total = crud.count_groups(db)
     return {"items": groups, "total": total}
 
+@router.patch("/groups/{group_id}", response_model=schemas.Group)
+def update_group(group_id: int, group: schemas.GroupUpdate, db: Session = Depends(get_db), admin: str = Depends(get_current_admin)):
+    if not crud.get_group(db, group_id):
+        raise HTTPException(status_code=404, detail="Group not found")
+    if group.name:
+        existing = crud.get_group_by_name(db, name=group.name)
+        if existing and existing.id != group_id:
+            raise HTTPException(status_code=400, detail="Group with this name already exists")
+    return crud.update_group(db, group_id, group.dict(exclude_unset=True))
+
 @router.delete("/groups/{group_id}")
 def delete_group(group_id: int, db: Session = Depends(get_db), admin: str = Depends(get_current_admin)):
     db_group = crud.delete_group(db, group_id)
@@ -456,30 +435,17 @@ def update_group_providers(group_id: int, providers_data: List[dict], db: Sessio
             crud.add_provider_to_group(db, provider_id=p['id'], group_id=group_id, priority=p.get('priority', 99), commit=False)
     
     db.commit()
+    routing_cache.invalidate()
     return {"detail": "Group providers updated"}
 
 @proxy_router.post("/v1/chat/completions")
-async def chat(request: schemas.ChatRequest, db: Session = Depends(get_db), api_key: models.APIKey = Depends(get_api_key_from_bearer)):
+async def chat(request: schemas.ChatRequest, db: Session = Depends(get_db), api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)):
     
     # --- Permission Check ---
     # The user now sends a group name as the "model".
     # Check if the requested group name is in the list of groups associated with the API key.
-    authorized_group_names = {group.name for group in api_key.groups}
-    
-    # Matching logic: allow exact match or match after removing prefix (e.g., 'gemini' matches 'google/gemini')
-    matched_group_name = None
-    if request.model in authorized_group_names:
-        matched_group_name = request.model
-    else:
-        # Try to find a group that ends with /requested_model or matches common variations
-        for name in authorized_group_names:
-            if (name.endswith(f"/{request.model}") or
-                request.model.endswith(f"/{name}") or
-                name == request.model.replace("claude-", "anthropic/") or
-                name == request.model.replace("gpt-", "openai/")):
-                matched_group_name = name
-                logger.info(f"Mapping requested model '{request.model}' to authorized group '{matched_group_name}'")
-                break
+    authorized_group_names = api_key.group_names
+    matched_group_name = await _resolve_group(api_key, request.model)
     
     if not matched_group_name:
         group_names = ", ".join(list(authorized_group_names))
@@ -487,7 +453,7 @@ async def chat(request: schemas.ChatRequest, db: Session = Depends(get_db), api_
         logger.warning(f"API Key {api_key.key[:5]}... {error_msg}")
         
         # Log Permission Error
-        crud.create_call_log(db, schemas.CallLogCreate(
+        await log_writer.submit(schemas.CallLogCreate(
             provider_id=None,
             api_key_id=api_key.id,
             response_timestamp=datetime.now(TAIPEI_TZ),
@@ -512,40 +478,27 @@ async def chat(request: schemas.ChatRequest, db: Session = Depends(get_db), api_
     if request.stream:
         async def stream_generator():
             excluded_provider_ids = []
-            in_think_block = False
             while True:
                 provider = None
-                failure_keywords = []
                 
-                # Use a temporary session to select a provider and get keywords, then close it.
-                db_session = SessionLocal()
-                try:
-                    provider, group_id = smart_router.select_provider(db_session, request, excluded_provider_ids=excluded_provider_ids)
-                    if provider:
-                        failure_keywords = [kw.keyword.lower() for kw in crud.get_all_active_error_keywords(db_session)]
-                finally:
-                    db_session.close()
+                provider, group_id = await smart_router.select_provider_async(request, excluded_provider_ids=excluded_provider_ids)
 
                 if not provider:
                     logger.error("All providers failed for streaming request.")
                     error_info = "All suitable providers failed or are unavailable."
                     
                     # Log 503 Error
-                    log_db = SessionLocal()
-                    try:
-                        crud.create_call_log(log_db, schemas.CallLogCreate(
-                            provider_id=None,
-                            api_key_id=api_key.id,
-                            response_timestamp=datetime.now(TAIPEI_TZ),
-                            is_success=False,
-                            status_code=503,
-                            response_time_ms=0,
-                            error_message=f"Service Error: {error_info}",
-                            request_body=json.dumps(request.dict()),
-                            response_body=error_info
-                        ))
-                    finally:
-                        log_db.close()
+                    await log_writer.submit(schemas.CallLogCreate(
+                        provider_id=None,
+                        api_key_id=api_key.id,
+                        response_timestamp=datetime.now(TAIPEI_TZ),
+                        is_success=False,
+                        status_code=503,
+                        response_time_ms=0,
+                        error_message=f"Service Error: {error_info}",
+                        request_body=json.dumps(request.dict()),
+                        response_body=error_info
+                    ))
 
                     error_message = {"error": {"message": error_info}}
                     yield f"data: {json.dumps(error_message)}\n\n"
@@ -555,14 +508,16 @@ async def chat(request: schemas.ChatRequest, db: Session = Depends(get_db), api_
                 start_time = time.time()
                 full_response_text = ""
                 stream_usage = {}  # To capture usage from the final chunk
+                # Incremental failure keyword scan; state carries across chunks
+                with request_timing.phase("keywords"):
+                    keyword_scanner = (await keyword_matcher.get_matcher_async()).scanner()
+                # Strips <think> blocks from delta.content across events
+                think_filter = ThinkStreamFilter()
+                # TTFT and inter-token gaps
+                stream_stats = StreamStats(start_time)
                 
                 # Increment active calls
-                log_db_init = SessionLocal()
-                try:
-                    if group_id:
-                        crud.increment_active_calls(log_db_init, provider.id, group_id)
-                finally:
-                    log_db_init.close()
+                concurrency.increment(provider.id, group_id)
 
                 try:
                     api_url = provider.api_endpoint
@@ -573,124 +528,105 @@ async def chat(request: schemas.ChatRequest, db: Session = Depends(get_db), api_
                     payload['model'] = provider.model
                     payload['stream'] = True
 
-                    async with httpx.AsyncClient(timeout=300) as client:
-                        async with client.stream("POST", api_url, headers=headers, json=payload) as response:
-                            if response.status_code >= 400:
-                                error_body = await response.aread()
-                                error_message = error_body.decode('utf-8', 'ignore')
-                                end_time = time.time()
-                                status_code = response.status_code
-
-                                if status_code == 429:
-                                    logger.warning(f"Provider {provider.name} (ID: {provider.id}) failed with 429 Too Many Requests. Marking as failed and retrying.")
-                                else:
-                                    logger.warning(f"Provider {provider.name} (ID: {provider.id}) failed with status code {status_code}: {error_message}")
-                                
-                                # Use a temporary session to log the error
-                                log_db = SessionLocal()
-                                try:
-                                    crud.create_call_log(log_db, schemas.CallLogCreate(
-                                        provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=False,
-                                        status_code=status_code, response_time_ms=int((end_time - start_time) * 1000), error_message=error_message,
-                                        request_body=json.dumps(request.dict()), response_body=error_message
-                                    ))
-                                finally:
-                                    log_db.close()
+                    client = http_clients.get_client(api_url)
+                    async with client.stream("POST", api_url, headers=headers, json=payload, timeout=300) as response:
+                        request_timing.add("connect", (time.time() - start_time) * 1000)
+                        if response.status_code >= 400:
+                            error_body = await response.aread()
+                            error_message = error_body.decode('utf-8', 'ignore')
+                            end_time = time.time()
+                            status_code = response.status_code
+
+                            if status_code == 429:
+                                logger.warning(f"Provider {provider.name} (ID: {provider.id}) failed with 429 Too Many Requests. Marking as failed and retrying.")
+                            else:
+                                logger.warning(f"Provider {provider.name} (ID: {provider.id}) failed with status code {status_code}: {error_message}")
                                 
-                                excluded_provider_ids.append(provider.id)
-                                logger.info(f"Adding provider ID {provider.id} to exclusion list. Retrying stream.")
-                                continue
-
-                            async for chunk in response.aiter_bytes():
-                                chunk_raw = chunk.decode('utf-8', errors='ignore')
-                                chunk_text_lower = chunk_raw.lower()
-                                full_response_text += chunk_text_lower
-                                for keyword in failure_keywords:
-                                    if keyword in full_response_text:
-                                        raise ValueError(f"Failure keyword found: '{keyword}'")
+                            # Queue the failure log (written in batches by the log writer)
+                            await log_writer.submit(schemas.CallLogCreate(
+                                provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=False,
+                                status_code=status_code, response_time_ms=int((end_time - start_time) * 1000), error_message=error_message,
+                                request_body=json.dumps(request.dict()), response_body=error_message
+                            ))
                                 
-                                # Try to extract usage from SSE data chunks
-                                for sse_line in chunk_raw.split('\n'):
-                                    if sse_line.startswith('data: ') and sse_line.strip() != 'data: [DONE]':
-                                        try:
-                                            sse_data = json.loads(sse_line[6:])
-                                            if 'usage' in sse_data and sse_data['usage']:
-                                                stream_usage = sse_data['usage']
-                                        except (json.JSONDecodeError, KeyError):
-                                            pass
-
-                                # Basic <think> tag filtering for streaming
-                                if "<think>" in chunk_raw:
-                                    in_think_block = True
-                                    parts = chunk_raw.split("<think>")
-                                    if parts[0]: yield parts[0].encode('utf-8')
-                                    continue
+                            excluded_provider_ids.append(provider.id)
+                            logger.info(f"Adding provider ID {provider.id} to exclusion list. Retrying stream.")
+                            continue
+
+                        # Re-frame the upstream bytes into complete SSE events
+                        first_event = True
+                        async for event in sse.aiter_events(response.aiter_bytes()):
+                            if first_event:
+                                first_event = False
+                                first_event_time = time.time()
+                                proxy_metrics.observe_ttfb(provider.id, first_event_time - start_time)
+                                request_timing.add("ttfb", (first_event_time - start_time) * 1000)
+                            stream_stats.feed(event)
+                            event_text = event.text()
+                            event_text_lower = event_text.lower()
+                            full_response_text += event_text_lower
+                            keyword = keyword_scanner.feed(event_text_lower)
+                            if keyword:
+                                raise ValueError(f"Failure keyword found: '{keyword}'")
                                 
-                                if "</think>" in chunk_raw:
-                                    in_think_block = False
-                                    parts = chunk_raw.split("</think>")
-                                    if len(parts) > 1 and parts[1]: yield parts[1].encode('utf-8')
-                                    continue
-
-                                if not in_think_block:
-                                    yield chunk
+                            # Only the usage chunk needs to be decoded
+                            if event.has_field(b'usage'):
+                                sse_data = event.json()
+                                if isinstance(sse_data, dict) and sse_data.get('usage'):
+                                    stream_usage = sse_data['usage']
+
+                            filtered = think_filter.process(event)
+                            if filtered:
+                                yield filtered
+
+                        # Upstream ended without [DONE]: release any held-back text
+                        tail = think_filter.finish()
+                        if tail:
+                            yield tail
                             
-                            end_time = time.time()
-                            # Calculate cost from stream usage if available
-                            stream_prompt_tokens = stream_usage.get('prompt_tokens')
-                            stream_completion_tokens = stream_usage.get('completion_tokens')
-                            stream_total_tokens = stream_usage.get('total_tokens')
-                            stream_cost = None
+                        end_time = time.time()
+                        if not first_event:
+                            request_timing.add("stream", (end_time - first_event_time) * 1000)
+                        # Calculate cost from stream usage if available
+                        stream_prompt_tokens = stream_usage.get('prompt_tokens')
+                        stream_completion_tokens = stream_usage.get('completion_tokens')
+                        stream_total_tokens = stream_usage.get('total_tokens')
+                        stream_cost = None
                             
-                            # Need to re-fetch provider from DB since the original object may be detached
-                            log_db = SessionLocal()
-                            try:
-                                if stream_prompt_tokens is not None or stream_total_tokens is not None:
-                                    db_provider = crud.get_provider(log_db, provider.id)
-                                    if db_provider:
-                                        stream_cost = crud.calculate_cost(db_provider, stream_prompt_tokens, stream_completion_tokens, stream_total_tokens)
-                                
-                                crud.create_call_log(log_db, schemas.CallLogCreate(
-                                    provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=True,
-                                    status_code=response.status_code, response_time_ms=int((end_time - start_time) * 1000),
-                                    error_message=None,
-                                    prompt_tokens=stream_prompt_tokens, completion_tokens=stream_completion_tokens,
-                                    total_tokens=stream_total_tokens, cost=stream_cost,
-                                    request_body=json.dumps(request.dict()), response_body=full_response_text
-                                ))
-                            finally:
-                                log_db.close()
-                            logger.info(f"--- Streaming Response Finished (Provider ID: {provider.id}) ---")
-                            logger.info(f"Full response text: {full_response_text[:500]}..." if len(full_response_text) > 500 else f"Full response text: {full_response_text}")
-                            break
+                        if stream_prompt_tokens is not None or stream_total_tokens is not None:
+                            stream_cost = crud.calculate_cost(provider, stream_prompt_tokens, stream_completion_tokens, stream_total_tokens)
+
+                        await log_writer.submit(schemas.CallLogCreate(
+                            provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=True,
+                            status_code=response.status_code, response_time_ms=int((end_time - start_time) * 1000),
+                            error_message=None,
+                            prompt_tokens=stream_prompt_tokens, completion_tokens=stream_completion_tokens,
+                            total_tokens=stream_total_tokens, cost=stream_cost,
+                            request_body=json.dumps(request.dict()), response_body=full_response_text,
+                            **stream_stats.summary(stream_completion_tokens, end_time)
+                        ))
+                        logger.info(f"--- Streaming Response Finished (Provider ID: {provider.id}) ---")
+                        logger.info(f"Full response text: {full_response_text[:500]}..." if len(full_response_text) > 500 else f"Full response text: {full_response_text}")
+                        break
 
                 except (httpx.RequestError, ValueError) as e:
                     end_time = time.time()
-                    status_code = 503
+                    status_code = _upstream_error_status(e)
                     logger.warning(f"Provider {provider.name} (ID: {provider.id}) failed during stream: {e}")
                     
-                    # Use a temporary session to log the exception
-                    log_db = SessionLocal()
-                    try:
-                        crud.create_call_log(log_db, schemas.CallLogCreate(
-                            provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=False,
-                            status_code=status_code, response_time_ms=int((end_time - start_time) * 1000), error_message=str(e),
-                            request_body=json.dumps(request.dict()), response_body=full_response_text
-                        ))
-                    finally:
-                        log_db.close()
+                    # Queue the exception log (written in batches by the log writer)
+                    await log_writer.submit(schemas.CallLogCreate(
+                        provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=False,
+                        status_code=status_code, response_time_ms=int((end_time - start_time) * 1000), error_message=str(e),
+                        request_body=json.dumps(request.dict()), response_body=full_response_text
+                    ))
                     
                     excluded_provider_ids.append(provider.id)
                     logger.info(f"Adding provider ID {provider.id} to exclusion list. Retrying stream.")
                     continue
                 finally:
                     # Decrement active calls
-                    log_db_end = SessionLocal()
-                    try:
-                        if group_id:
-                            crud.decrement_active_calls(log_db_end, provider.id, group_id)
-                    finally:
-                        log_db_end.close()
+                    concurrency.decrement(provider.id, group_id)
 
         return StreamingResponse(stream_generator(), media_type="text/event-stream")
 
@@ -699,11 +635,11 @@ async def chat(request: schemas.ChatRequest, db: Session = Depends(get_db), api_
         excluded_provider_ids = []
         while True:
             # The select_provider function now looks up providers by the group name in request.model
-            provider, group_id = smart_router.select_provider(db, request, excluded_provider_ids=excluded_provider_ids)
+            provider, group_id = await smart_router.select_provider_async(request, excluded_provider_ids=excluded_provider_ids)
             if not provider:
                 error_info = "All suitable providers failed or are unavailable."
                 # Log 503 Error
-                crud.create_call_log(db, schemas.CallLogCreate(
+                await log_writer.submit(schemas.CallLogCreate(
                     provider_id=None,
                     api_key_id=api_key.id,
                     response_timestamp=datetime.now(TAIPEI_TZ),
@@ -720,8 +656,7 @@ async def chat(request: schemas.ChatRequest, db: Session = Depends(get_db), api_
             start_time = time.time()
             
             # Increment active calls
-            if group_id:
-                crud.increment_active_calls(db, provider.id, group_id)
+            concurrency.increment(provider.id, group_id)
 
             try:
                 api_url = provider.api_endpoint
@@ -731,44 +666,42 @@ async def chat(request: schemas.ChatRequest, db: Session = Depends(get_db), api_
                 # Ensure we use the provider's actual model ID, not the group name or alias
                 payload['model'] = provider.model
                 payload['stream'] = False
-                failure_keywords = [kw.keyword.lower() for kw in crud.get_all_active_error_keywords(db)]
+                with request_timing.phase("keywords"):
+                    failure_matcher = await keyword_matcher.get_matcher_async()
 
-                async with httpx.AsyncClient(timeout=300) as client:
-                    response = await client.post(api_url, headers=headers, json=payload)
-                    response.raise_for_status()
+                client = http_clients.get_client(api_url)
+                response = await client.post(api_url, headers=headers, json=payload, timeout=300)
+                response.raise_for_status()
                 
                 response_json = response.json()
                 if not response_json or not response_json.get("choices"):
                     raise ValueError("Empty or null response from provider")
 
-                response_text = str(response_json).lower()
-                for keyword in failure_keywords:
-                    if keyword in response_text:
+                if failure_matcher:
+                    keyword = failure_matcher.search(str(response_json).lower())
+                    if keyword:
                         raise ValueError(f"Failure keyword found: '{keyword}'")
 
                 # Success case
                 end_time = time.time()
                 usage = response_json.get("usage", {})
                 cost = crud.calculate_cost(provider, usage.get("prompt_tokens"), usage.get("completion_tokens"), usage.get("total_tokens"))
-                try:
-                    crud.create_call_log(db, schemas.CallLogCreate(
-                        provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=True,
-                        status_code=response.status_code, response_time_ms=int((end_time - start_time) * 1000),
-                        prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"),
-                        total_tokens=usage.get("total_tokens"), cost=cost,
-                        request_body=json.dumps(request.dict()), response_body=json.dumps(response_json)
-                    ))
-                except Exception as log_err:
-                    logger.error(f"Failed to create success call log: {log_err}")
-                    db.rollback()
+                await log_writer.submit(schemas.CallLogCreate(
+                    provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=True,
+                    status_code=response.status_code, response_time_ms=int((end_time - start_time) * 1000),
+                    prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"),
+                    total_tokens=usage.get("total_tokens"), cost=cost,
+                    request_body=json.dumps(request.dict()), response_body=json.dumps(response_json)
+                ))
                 logger.info(f"--- Non-streaming Response Success (Provider ID: {provider.id}) ---")
                 logger.info(f"Response JSON: {json.dumps(response_json)}")
                 # Sanitize response to remove non-standard fields and <think> tags
-                return utils.sanitize_openai_response(response_json)
+                with request_timing.phase("post"):
+                    return utils.sanitize_openai_response(response_json)
 
             except (httpx.RequestError, httpx.HTTPStatusError, ValueError) as e:
                 end_time = time.time()
-                status_code = e.response.status_code if hasattr(e, 'response') and e.response is not None else 503
+                status_code = _upstream_error_status(e)
                 response_body = e.response.text if hasattr(e, 'response') and e.response is not None else None
                 
                 if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429:
@@ -776,30 +709,23 @@ async def chat(request: schemas.ChatRequest, db: Session = Depends(get_db), api_
                 else:
                     logger.warning(f"Provider {provider.name} (ID: {provider.id}) failed: {e}")
                 
-                try:
-                    crud.create_call_log(db, schemas.CallLogCreate(
-                        provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=False,
-                        status_code=status_code, response_time_ms=int((end_time - start_time) * 1000), error_message=str(e),
-                        request_body=json.dumps(request.dict()), response_body=response_body
-                    ))
-                except Exception as log_err:
-                    logger.error(f"Failed to create failure call log: {log_err}")
-                    db.rollback()
+                await log_writer.submit(schemas.CallLogCreate(
+                    provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=False,
+                    status_code=status_code, response_time_ms=int((end_time - start_time) * 1000), error_message=str(e),
+                    request_body=json.dumps(request.dict()), response_body=response_body
+                ))
 
                 error_str = str(e).lower()
                 if "insufficient" in error_str and "quota" in error_str:
                     logger.warning(f"Provider {provider.name} (ID: {provider.id}) disabled due to insufficient quota.")
-                    provider.is_active = False
-                    db.commit()
-                    crud.create_maintenance_error(db=db, provider_id=provider.id, error_type="INSUFFICIENT_QUOTA", details=str(e))
+                    await db_async.run_in_session(_disable_provider_for_quota, provider.id, str(e))
 
                 excluded_provider_ids.append(provider.id)
                 logger.info(f"Adding provider ID {provider.id} to exclusion list. Retrying.")
                 continue
             finally:
                 # Decrement active calls
-                if group_id:
-                    crud.decrement_active_calls(db, provider.id, group_id)
+                concurrency.decrement(provider.id, group_id)
 
 @router.post("/import-models/")
 async def import_models(request: schemas.ModelImportRequest, admin: str = Depends(get_current_admin)):
@@ -864,6 +790,7 @@ async def import_models(request: schemas.ModelImportRequest, admin: str = Depend
             
             if deactivated_count > 0:
                 db.commit()
+                routing_cache.invalidate()
                 logger.info(f"Deactivated {deactivated_count} models that are no longer available at {target_endpoint}")
 
             imported_count = 0
@@ -931,20 +858,20 @@ async def import_models(request: schemas.ModelImportRequest, admin: str = Depend
     return StreamingResponse(progress_stream(), media_type="text/event-stream")
 
 @proxy_router.get("/v1/models", response_model=schemas.ModelListResponse)
-def get_models_list(db: Session = Depends(get_db), api_key: models.APIKey = Depends(get_api_key_from_bearer)):
+def get_models_list(db: Session = Depends(get_db), api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)):
     """
     Returns a list of models available to the authenticated API key,
     formatted to be compatible with the OpenAI API.
     """
     # Per user request, this endpoint should return the names of the groups the key has access to.
-    authorized_groups = {group.name for group in api_key.groups}
+    authorized_groups = api_key.group_names
 
     data = [schemas.ModelResponse(id=group_name) for group_name in sorted(list(authorized_groups))]
     
     return schemas.ModelListResponse(data=data)
 
 @proxy_router.post("/v1/responses")
-async def responses_proxy(request: schemas.ChatRequest, db: Session = Depends(get_db), api_key: models.APIKey = Depends(get_api_key_from_bearer)):
+async def responses_proxy(request: schemas.ChatRequest, db: Session = Depends(get_db), api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)):
     """
     OpenAI compatible endpoint /v1/responses.
     Internally redirects to /v1/chat/completions logic.
@@ -952,7 +879,7 @@ async def responses_proxy(request: schemas.ChatRequest, db: Session = Depends(ge
     return await chat(request, db, api_key)
 
 @proxy_router.post("/v1/messages")
-async def messages_proxy(request: schemas.AnthropicChatRequest, db: Session = Depends(get_db), api_key: models.APIKey = Depends(get_api_key_from_anthropic_header)):
+async def messages_proxy(request: schemas.AnthropicChatRequest, db: Session = Depends(get_db), api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_anthropic_header)):
     """
     Anthropic compatible endpoint /v1/messages.
     Converts Anthropic request to OpenAI format, calls internal chat logic,
@@ -1000,29 +927,26 @@ async def messages_proxy(request: schemas.AnthropicChatRequest, db: Session = De
             yield f"data: {json.dumps({'type': 'message_start', 'message': {'id': 'msg_start', 'type': 'message', 'role': 'assistant', 'content': [], 'model': request.model, 'usage': {'input_tokens': 0, 'output_tokens': 0}}})}\n\n"
             yield f"data: {json.dumps({'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}})}\n\n"
 
-            async for line in openai_response.body_iterator:
-                if isinstance(line, bytes):
-                    line = line.decode('utf-8')
-                
-                if line.startswith("data: "):
-                    data_str = line[6:].strip()
-                    if data_str == "[DONE]":
-                        break
-                    
-                    try:
-                        data = json.loads(data_str)
-                        delta = data.get("choices", [{}])[0].get("delta", {})
-                        if "content" in delta:
-                            content = delta["content"]
-                            # Basic filtering of <think> tags in stream
-                            content = utils.filter_think_tag_from_chunk(content)
-                            if content:
-                                yield f"data: {json.dumps({'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': content}})}\n\n"
-                    except:
-                        continue
+            output_tokens = 0
+            async for event in sse.aiter_events(openai_response.body_iterator):
+                # Keep consuming after [DONE] so the chat generator can log the call
+                if event.is_done:
+                    continue
+                data = event.json()
+                if not isinstance(data, dict):
+                    continue
+
+                if data.get("usage"):
+                    output_tokens = data["usage"].get("completion_tokens") or output_tokens
+                choices = data.get("choices") or [{}]
+                delta = choices[0].get("delta") or {}
+                # <think> blocks were already removed by the chat stream's ThinkStreamFilter
+                content = delta.get("content")
+                if content:
+                    yield f"data: {json.dumps({'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': content}})}\n\n"
 
             yield f"data: {json.dumps({'type': 'content_block_stop', 'index': 0})}\n\n"
-            yield f"data: {json.dumps({'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None}, 'usage': {'output_tokens': 0}})}\n\n"
+            yield f"data: {json.dumps({'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None}, 'usage': {'output_tokens': output_tokens}})}\n\n"
             yield f"data: {json.dumps({'type': 'message_stop'})}\n\n"
 
         return StreamingResponse(anthropic_stream_generator(), media_type="text/event-stream")
@@ -1053,7 +977,7 @@ async def messages_proxy(request: schemas.AnthropicChatRequest, db: Session = De
     return anthropic_response
 
 @proxy_router.post("/v1/completions")
-async def completions(request: schemas.CompletionRequest, db: Session = Depends(get_db), api_key: models.APIKey = Depends(get_api_key_from_bearer)):
+async def completions(request: schemas.CompletionRequest, db: Session = Depends(get_db), api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)):
     """
     OpenAI legacy completions API.
     """
@@ -1063,80 +987,117 @@ async def completions(request: schemas.CompletionRequest, db: Session = Depends(
     while True:
         # Create a dummy ChatRequest for provider selection
         dummy_request = schemas.ChatRequest(model=request.model, messages=[], stream=request.stream)
-        provider, group_id = smart_router.select_provider(db, dummy_request, excluded_provider_ids=excluded_provider_ids)
+        provider, group_id = await smart_router.select_provider_async(dummy_request, excluded_provider_ids=excluded_provider_ids)
         if not provider:
             raise HTTPException(status_code=503, detail="All suitable providers failed or are unavailable.")
 
         start_time = time.time()
-        if group_id:
-            crud.increment_active_calls(db, provider.id, group_id)
+        concurrency.increment(provider.id, group_id)
         try:
             api_url = provider.api_endpoint.replace("/chat/completions", "/completions") if "/chat/completions" in provider.api_endpoint else provider.api_endpoint
             headers = {"Authorization": f"Bearer {provider.api_key}", "Content-Type": "application/json"}
             payload = request.dict(exclude_unset=True)
             payload['model'] = provider.model
             
-            async with httpx.AsyncClient(timeout=300) as client:
-                response = await client.post(api_url, headers=headers, json=payload)
-                response.raise_for_status()
+            client = http_clients.get_client(api_url)
+            response = await client.post(api_url, headers=headers, json=payload, timeout=300)
+            response.raise_for_status()
             
             response_json = response.json()
             # Log success
-            crud.create_call_log(db, schemas.CallLogCreate(
+            await log_writer.submit(schemas.CallLogCreate(
                 provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ), is_success=True,
                 status_code=response.status_code, response_time_ms=int((time.time() - start_time) * 1000),
                 response_body=json.dumps(response_json)
             ))
             return response_json
         except Exception as e:
+            logger.warning(f"Provider {provider.name} (ID: {provider.id}) failed: {e}")
+            await _log_upstream_exception(provider, api_key, start_time, e, f"Completions: model={request.model}")
             excluded_provider_ids.append(provider.id)
             continue
         finally:
-            if group_id:
-                crud.decrement_active_calls(db, provider.id, group_id)
+            concurrency.decrement(provider.id, group_id)
 
 @proxy_router.post("/v1/embeddings")
-async def embeddings(request: schemas.EmbeddingRequest, db: Session = Depends(get_db), api_key: models.APIKey = Depends(get_api_key_from_bearer)):
+async def embeddings(request: schemas.EmbeddingRequest, db: Session = Depends(get_db), api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)):
     """
     OpenAI Embeddings API.
     """
     excluded_provider_ids = []
     while True:
         dummy_request = schemas.ChatRequest(model=request.model, messages=[])
-        provider, group_id = smart_router.select_provider(db, dummy_request, excluded_provider_ids=excluded_provider_ids)
+        provider, group_id = await smart_router.select_provider_async(dummy_request, excluded_provider_ids=excluded_provider_ids)
         if not provider:
             raise HTTPException(status_code=503, detail="No provider found for embeddings.")
 
         start_time = time.time()
-        if group_id:
-            crud.increment_active_calls(db, provider.id, group_id)
+        concurrency.increment(provider.id, group_id)
         try:
             api_url = provider.api_endpoint.replace("/chat/completions", "/embeddings") if "/chat/completions" in provider.api_endpoint else provider.api_endpoint
             headers = {"Authorization": f"Bearer {provider.api_key}", "Content-Type": "application/json"}
             payload = request.dict(exclude_unset=True)
             payload['model'] = provider.model
             
-            async with httpx.AsyncClient(timeout=60) as client:
-                response = await client.post(api_url, headers=headers, json=payload)
-                response.raise_for_status()
+            client = http_clients.get_client(api_url)
+            response = await client.post(api_url, headers=headers, json=payload, timeout=60)
+            response.raise_for_status()
             
             return response.json()
         except Exception as e:
+            logger.warning(f"Provider {provider.name} (ID: {provider.id}) failed: {e}")
+            await _log_upstream_exception(provider, api_key, start_time, e, f"Embeddings: model={request.model}")
             excluded_provider_ids.append(provider.id)
             continue
         finally:
-            if group_id:
-                crud.decrement_active_calls(db, provider.id, group_id)
+            concurrency.decrement(provider.id, group_id)
 
 # --- Management APIs for Logs, Keys, Keywords, Settings ---
 
 @router.get("/logs/", response_model=schemas.CallLogResponse)
-def read_call_logs(skip: int = 0, limit: int = 100, filter_success: Optional[bool] = None, db: Session = Depends(get_db), admin: str = Depends(get_current_admin)):
+def read_call_logs(skip: int = 0, limit: int = 100, filter_success: Optional[bool] = None,
+                   before_id: Optional[int] = None, after_id: Optional[int] = None,
+                   provider_id: Optional[int] = None, api_key_id: Optional[int] = None,
+                   status_code: Optional[int] = None, start_time: Optional[datetime] = None,
+                   end_time: Optional[datetime] = None, min_latency_ms: Optional[int] = None,
+                   db: Session = Depends(get_db), admin: str = Depends(get_current_admin)):
     # 這裡返回的 logs 將會根據 schemas.CallLogSummary 進行序列化
     # 確保不包含任何 details 或 body 欄位，從而避免 SQLAlchemy 觸發延遲加載
-    logs = crud.get_call_logs(db, skip=skip, limit=limit, filter_success=filter_success)
-    total = crud.count_call_logs(db, filter_success=filter_success)
-    return {"items": logs, "total": total}
+    # 翻頁請使用 before_id / after_id (keyset)，skip 只在沒有游標時生效
+    filters = schemas.CallLogFilters(
+        is_success=filter_success, provider_id=provider_id, api_key_id=api_key_id,
+        status_code=status_code, start_time=start_time, end_time=end_time, min_latency_ms=min_latency_ms
+    )
+    logs = crud.get_call_logs(db, skip=skip, limit=limit, filters=filters, before_id=before_id, after_id=after_id)
+    total, is_estimate = log_count.count(db, filters)
+    # 頁面不滿 limit 代表該方向已到盡頭：往較新翻 (after_id) 時沒有更新的，否則沒有更舊的
+    short_page = len(logs) < limit
+    return {
+        "items": logs,
+        "total": total,
+        "total_is_estimate": is_estimate,
+        "next_before_id": logs[-1].id if logs and not (short_page and after_id is None) else None,
+        "prev_after_id": logs[0].id if logs and not (short_page and after_id is not None) else None,
+    }
+
+@router.get("/logs/search", response_model=schemas.CallLogSearchResponse)
+def search_call_logs(q: str, limit: int = 20, offset: int = 0, db: Session = Depends(get_db), admin: str = Depends(get_current_admin)):
+    # 全文檢索請求/回應內容與錯誤訊息 (FTS5)，依相關度排序並附上命中片段
+    if not log_search.enabled():
+        raise HTTPException(status_code=503, detail="Full-text log search is disabled")
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search query is empty")
+    try:
+        hits = log_search.search(db, q, limit=min(limit, 100), offset=offset)
+    except log_search.SearchUnavailable:
+        raise HTTPException(status_code=503, detail="Full-text log index is unavailable")
+    logs = {log.id: log for log in crud.get_call_logs_by_ids(db, [hit["id"] for hit in hits])}
+    items = [
+        schemas.CallLogSearchHit(**schemas.CallLogSummary.model_validate(logs[hit["id"]]).model_dump(),
+                                 rank=hit["rank"], snippet=hit["snippet"])
+        for hit in hits if hit["id"] in logs
+    ]
+    return {"items": items}
 
 @router.get("/logs/{log_id}", response_model=schemas.CallLog)
 def read_call_log(log_id: int, db: Session = Depends(get_db), admin: str = Depends(get_current_admin)):
@@ -1158,7 +1119,7 @@ def read_call_log(log_id: int, db: Session = Depends(get_db), admin: str = Depen
 
 @router.get("/keys/", response_model=List[schemas.APIKey])
 def read_api_keys(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), admin: str = Depends(get_current_admin)):
-    return crud.get_api_keys(db, skip=skip, limit=limit)
+    return crud.get_api_keys(db, skip=skip, limit=limit, live_last_used=api_key_usage.snapshot())
 
 @router.post("/keys/", response_model=schemas.APIKey)
 def create_api_key(api_key: schemas.APIKeyCreate, db: Session = Depends(get_db), admin: str = Depends(get_current_admin)):
@@ -1202,7 +1163,7 @@ def update_setting(setting: schemas.SettingCreate, db: Session = Depends(get_db)
     return crud.update_setting(db, setting.key, setting.value)
 
 @proxy_router.post("/v1/images/generations")
-async def image_generation(request: schemas.ImageGenerationRequest, db: Session = Depends(get_db), api_key: models.APIKey = Depends(get_api_key_from_bearer)):
+async def image_generation(request: schemas.ImageGenerationRequest, db: Session = Depends(get_db), api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)):
     """
     OpenAI Image Generation API.
     """
@@ -1211,33 +1172,36 @@ async def image_generation(request: schemas.ImageGenerationRequest, db: Session
         # Use 'dall-e-3' or similar if model not specified
         model_name = request.model or "dall-e-3"
         dummy_request = schemas.ChatRequest(model=model_name, messages=[])
-        provider, group_id = smart_router.select_provider(db, dummy_request, excluded_provider_ids=excluded_provider_ids)
+        provider, group_id = await smart_router.select_provider_async(dummy_request, excluded_provider_ids=excluded_provider_ids)
         if not provider:
             raise HTTPException(status_code=503, detail="No provider found for image generation.")
 
+        start_time = time.time()
+        concurrency.increment(provider.id, group_id)
         try:
             api_url = provider.api_endpoint.replace("/chat/completions", "/images/generations") if "/chat/completions" in provider.api_endpoint else provider.api_endpoint
             headers = {"Authorization": f"Bearer {provider.api_key}", "Content-Type": "application/json"}
             payload = request.dict(exclude_unset=True)
             payload['model'] = provider.model
             
-            async with httpx.AsyncClient(timeout=120) as client:
-                response = await client.post(api_url, headers=headers, json=payload)
-                response.raise_for_status()
+            client = http_clients.get_client(api_url)
+            response = await client.post(api_url, headers=headers, json=payload, timeout=120)
+            response.raise_for_status()
             
             return response.json()
         except Exception as e:
+            logger.warning(f"Provider {provider.name} (ID: {provider.id}) failed: {e}")
+            await _log_upstream_exception(provider, api_key, start_time, e, f"Image Generation: model={model_name}")
             excluded_provider_ids.append(provider.id)
             continue
         finally:
-            if group_id:
-                crud.decrement_active_calls(db, provider.id, group_id)
+            concurrency.decrement(provider.id, group_id)
 
 @proxy_router.post("/v1/images/edits")
 async def image_edit(
     request: Request,
     db: Session = Depends(get_db),
-    api_key: models.APIKey = Depends(get_api_key_from_bearer)
+    api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)
 ):
     """
     OpenAI Image Edit API - handles multipart/form-data with image uploads.
@@ -1249,28 +1213,19 @@ async def image_edit(
     model_name = form_data.get("model", "dall-e-2")
     
     # Permission check
-    authorized_group_names = {group.name for group in api_key.groups}
-    matched_group_name = None
-    if model_name in authorized_group_names:
-        matched_group_name = model_name
-    else:
-        for name in authorized_group_names:
-            if name.endswith(f"/{model_name}") or model_name.endswith(f"/{name}"):
-                matched_group_name = name
-                break
+    matched_group_name = await _resolve_group(api_key, model_name)
     
     if not matched_group_name:
         raise HTTPException(status_code=403, detail=f"API key not authorized for model: {model_name}")
 
     while True:
         dummy_request = schemas.ChatRequest(model=matched_group_name, messages=[])
-        provider, group_id = smart_router.select_provider(db, dummy_request, excluded_provider_ids=excluded_provider_ids)
+        provider, group_id = await smart_router.select_provider_async(dummy_request, excluded_provider_ids=excluded_provider_ids)
         if not provider:
             raise HTTPException(status_code=503, detail="No provider found for image edit.")
 
         start_time = time.time()
-        if group_id:
-            crud.increment_active_calls(db, provider.id, group_id)
+        concurrency.increment(provider.id, group_id)
 
         try:
             api_url = provider.api_endpoint.replace("/chat/completions", "/images/edits") if "/chat/completions" in provider.api_endpoint else provider.api_endpoint
@@ -1288,20 +1243,17 @@ async def image_edit(
                 else:
                     data[key] = value
 
-            async with httpx.AsyncClient(timeout=120) as client:
-                response = await client.post(api_url, headers=headers, data=data, files=files)
+            client = http_clients.get_client(api_url)
+            response = await client.post(api_url, headers=headers, data=data, files=files, timeout=120)
 
             end_time = time.time()
-            try:
-                crud.create_call_log(db, schemas.CallLogCreate(
-                    provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
-                    is_success=response.status_code < 400, status_code=response.status_code,
-                    response_time_ms=int((end_time - start_time) * 1000),
-                    request_body=f"Image Edit: model={model_name}",
-                    response_body=f"Status: {response.status_code}"
-                ))
-            except:
-                db.rollback()
+            await log_writer.submit(schemas.CallLogCreate(
+                provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
+                is_success=response.status_code < 400, status_code=response.status_code,
+                response_time_ms=int((end_time - start_time) * 1000),
+                request_body=f"Image Edit: model={model_name}",
+                response_body=f"Status: {response.status_code}"
+            ))
 
             if response.status_code >= 400:
                 excluded_provider_ids.append(provider.id)
@@ -1315,18 +1267,18 @@ async def image_edit(
 
         except Exception as e:
             logger.error(f"Image edit error with provider {provider.name}: {e}")
+            await _log_upstream_exception(provider, api_key, start_time, e, f"Image Edit: model={model_name}")
             excluded_provider_ids.append(provider.id)
             continue
         finally:
-            if group_id:
-                crud.decrement_active_calls(db, provider.id, group_id)
+            concurrency.decrement(provider.id, group_id)
 
 
 @proxy_router.post("/v1/audio/transcriptions")
 async def audio_transcription(
     request: Request,
     db: Session = Depends(get_db),
-    api_key: models.APIKey = Depends(get_api_key_from_bearer)
+    api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)
 ):
     """
     OpenAI Audio Transcription API - handles multipart/form-data with audio file uploads.
@@ -1338,28 +1290,19 @@ async def audio_transcription(
     model_name = form_data.get("model", "whisper-1")
     
     # Permission check
-    authorized_group_names = {group.name for group in api_key.groups}
-    matched_group_name = None
-    if model_name in authorized_group_names:
-        matched_group_name = model_name
-    else:
-        for name in authorized_group_names:
-            if name.endswith(f"/{model_name}") or model_name.endswith(f"/{name}"):
-                matched_group_name = name
-                break
+    matched_group_name = await _resolve_group(api_key, model_name)
     
     if not matched_group_name:
         raise HTTPException(status_code=403, detail=f"API key not authorized for model: {model_name}")
 
     while True:
         dummy_request = schemas.ChatRequest(model=matched_group_name, messages=[])
-        provider, group_id = smart_router.select_provider(db, dummy_request, excluded_provider_ids=excluded_provider_ids)
+        provider, group_id = await smart_router.select_provider_async(dummy_request, excluded_provider_ids=excluded_provider_ids)
         if not provider:
             raise HTTPException(status_code=503, detail="No provider found for audio transcription.")
 
         start_time = time.time()
-        if group_id:
-            crud.increment_active_calls(db, provider.id, group_id)
+        concurrency.increment(provider.id, group_id)
 
         try:
             api_url = provider.api_endpoint.replace("/chat/completions", "/audio/transcriptions") if "/chat/completions" in provider.api_endpoint else provider.api_endpoint
@@ -1377,20 +1320,17 @@ async def audio_transcription(
                 else:
                     data[key] = value
 
-            async with httpx.AsyncClient(timeout=300) as client:
-                response = await client.post(api_url, headers=headers, data=data, files=files)
+            client = http_clients.get_client(api_url)
+            response = await client.post(api_url, headers=headers, data=data, files=files, timeout=300)
 
             end_time = time.time()
-            try:
-                crud.create_call_log(db, schemas.CallLogCreate(
-                    provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
-                    is_success=response.status_code < 400, status_code=response.status_code,
-                    response_time_ms=int((end_time - start_time) * 1000),
-                    request_body=f"Audio Transcription: model={model_name}",
-                    response_body=f"Status: {response.status_code}"
-                ))
-            except:
-                db.rollback()
+            await log_writer.submit(schemas.CallLogCreate(
+                provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
+                is_success=response.status_code < 400, status_code=response.status_code,
+                response_time_ms=int((end_time - start_time) * 1000),
+                request_body=f"Audio Transcription: model={model_name}",
+                response_body=f"Status: {response.status_code}"
+            ))
 
             if response.status_code >= 400:
                 excluded_provider_ids.append(provider.id)
@@ -1404,17 +1344,17 @@ async def audio_transcription(
 
         except Exception as e:
             logger.error(f"Audio transcription error with provider {provider.name}: {e}")
+            await _log_upstream_exception(provider, api_key, start_time, e, f"Audio Transcription: model={model_name}")
             excluded_provider_ids.append(provider.id)
             continue
         finally:
-            if group_id:
-                crud.decrement_active_calls(db, provider.id, group_id)
+            concurrency.decrement(provider.id, group_id)
 
 @proxy_router.post("/v1/images/variations")
 async def image_variation(
     request: Request,
     db: Session = Depends(get_db),
-    api_key: models.APIKey = Depends(get_api_key_from_bearer)
+    api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)
 ):
     """
     OpenAI Image Variations API - handles multipart/form-data with image uploads.
@@ -1423,27 +1363,18 @@ async def image_variation(
     form_data = await request.form()
     model_name = form_data.get("model", "dall-e-2")
 
-    authorized_group_names = {group.name for group in api_key.groups}
-    matched_group_name = None
-    if model_name in authorized_group_names:
-        matched_group_name = model_name
-    else:
-        for name in authorized_group_names:
-            if name.endswith(f"/{model_name}") or model_name.endswith(f"/{name}"):
-                matched_group_name = name
-                break
+    matched_group_name = await _resolve_group(api_key, model_name)
     if not matched_group_name:
         raise HTTPException(status_code=403, detail=f"API key not authorized for model: {model_name}")
 
     while True:
         dummy_request = schemas.ChatRequest(model=matched_group_name, messages=[])
-        provider, group_id = smart_router.select_provider(db, dummy_request, excluded_provider_ids=excluded_provider_ids)
+        provider, group_id = await smart_router.select_provider_async(dummy_request, excluded_provider_ids=excluded_provider_ids)
         if not provider:
             raise HTTPException(status_code=503, detail="No provider found for image variations.")
 
         start_time = time.time()
-        if group_id:
-            crud.increment_active_calls(db, provider.id, group_id)
+        concurrency.increment(provider.id, group_id)
         try:
             api_url = provider.api_endpoint.replace("/chat/completions", "/images/variations") if "/chat/completions" in provider.api_endpoint else provider.api_endpoint
             headers = {"Authorization": f"Bearer {provider.api_key}"}
@@ -1458,20 +1389,17 @@ async def image_variation(
                 else:
                     data[key] = value
 
-            async with httpx.AsyncClient(timeout=120) as client:
-                response = await client.post(api_url, headers=headers, data=data, files=files)
+            client = http_clients.get_client(api_url)
+            response = await client.post(api_url, headers=headers, data=data, files=files, timeout=120)
 
             end_time = time.time()
-            try:
-                crud.create_call_log(db, schemas.CallLogCreate(
-                    provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
-                    is_success=response.status_code < 400, status_code=response.status_code,
-                    response_time_ms=int((end_time - start_time) * 1000),
-                    request_body=f"Image Variations: model={model_name}",
-                    response_body=f"Status: {response.status_code}"
-                ))
-            except:
-                db.rollback()
+            await log_writer.submit(schemas.CallLogCreate(
+                provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
+                is_success=response.status_code < 400, status_code=response.status_code,
+                response_time_ms=int((end_time - start_time) * 1000),
+                request_body=f"Image Variations: model={model_name}",
+                response_body=f"Status: {response.status_code}"
+            ))
 
             if response.status_code >= 400:
                 excluded_provider_ids.append(provider.id)
@@ -1483,18 +1411,18 @@ async def image_variation(
             )
         except Exception as e:
             logger.error(f"Image variations error with provider {provider.name}: {e}")
+            await _log_upstream_exception(provider, api_key, start_time, e, f"Image Variations: model={model_name}")
             excluded_provider_ids.append(provider.id)
             continue
         finally:
-            if group_id:
-                crud.decrement_active_calls(db, provider.id, group_id)
+            concurrency.decrement(provider.id, group_id)
 
 
 @proxy_router.post("/v1/audio/translations")
 async def audio_translation(
     request: Request,
     db: Session = Depends(get_db),
-    api_key: models.APIKey = Depends(get_api_key_from_bearer)
+    api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)
 ):
     """
     OpenAI Audio Translation API - handles multipart/form-data with audio file uploads.
@@ -1503,27 +1431,18 @@ async def audio_translation(
     form_data = await request.form()
     model_name = form_data.get("model", "whisper-1")
 
-    authorized_group_names = {group.name for group in api_key.groups}
-    matched_group_name = None
-    if model_name in authorized_group_names:
-        matched_group_name = model_name
-    else:
-        for name in authorized_group_names:
-            if name.endswith(f"/{model_name}") or model_name.endswith(f"/{name}"):
-                matched_group_name = name
-                break
+    matched_group_name = await _resolve_group(api_key, model_name)
     if not matched_group_name:
         raise HTTPException(status_code=403, detail=f"API key not authorized for model: {model_name}")
 
     while True:
         dummy_request = schemas.ChatRequest(model=matched_group_name, messages=[])
-        provider, group_id = smart_router.select_provider(db, dummy_request, excluded_provider_ids=excluded_provider_ids)
+        provider, group_id = await smart_router.select_provider_async(dummy_request, excluded_provider_ids=excluded_provider_ids)
         if not provider:
             raise HTTPException(status_code=503, detail="No provider found for audio translation.")
 
         start_time = time.time()
-        if group_id:
-            crud.increment_active_calls(db, provider.id, group_id)
+        concurrency.increment(provider.id, group_id)
         try:
             api_url = provider.api_endpoint.replace("/chat/completions", "/audio/translations") if "/chat/completions" in provider.api_endpoint else provider.api_endpoint
             headers = {"Authorization": f"Bearer {provider.api_key}"}
@@ -1538,20 +1457,17 @@ async def audio_translation(
                 else:
                     data[key] = value
 
-            async with httpx.AsyncClient(timeout=300) as client:
-                response = await client.post(api_url, headers=headers, data=data, files=files)
+            client = http_clients.get_client(api_url)
+            response = await client.post(api_url, headers=headers, data=data, files=files, timeout=300)
 
             end_time = time.time()
-            try:
-                crud.create_call_log(db, schemas.CallLogCreate(
-                    provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
-                    is_success=response.status_code < 400, status_code=response.status_code,
-                    response_time_ms=int((end_time - start_time) * 1000),
-                    request_body=f"Audio Translation: model={model_name}",
-                    response_body=f"Status: {response.status_code}"
-                ))
-            except:
-                db.rollback()
+            await log_writer.submit(schemas.CallLogCreate(
+                provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
+                is_success=response.status_code < 400, status_code=response.status_code,
+                response_time_ms=int((end_time - start_time) * 1000),
+                request_body=f"Audio Translation: model={model_name}",
+                response_body=f"Status: {response.status_code}"
+            ))
 
             if response.status_code >= 400:
                 excluded_provider_ids.append(provider.id)
@@ -1563,18 +1479,18 @@ async def audio_translation(
             )
         except Exception as e:
             logger.error(f"Audio translation error with provider {provider.name}: {e}")
+            await _log_upstream_exception(provider, api_key, start_time, e, f"Audio Translation: model={model_name}")
             excluded_provider_ids.append(provider.id)
             continue
         finally:
-            if group_id:
-                crud.decrement_active_calls(db, provider.id, group_id)
+            concurrency.decrement(provider.id, group_id)
 
 
 @proxy_router.post("/v1/audio/speech")
 async def audio_speech(
     request: Request,
     db: Session = Depends(get_db),
-    api_key: models.APIKey = Depends(get_api_key_from_bearer)
+    api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)
 ):
     """
     OpenAI Text-to-Speech API - JSON request, returns audio binary.
@@ -1582,48 +1498,36 @@ async def audio_speech(
     body = await request.json()
     model_name = body.get("model", "tts-1")
 
-    authorized_group_names = {group.name for group in api_key.groups}
-    matched_group_name = None
-    if model_name in authorized_group_names:
-        matched_group_name = model_name
-    else:
-        for name in authorized_group_names:
-            if name.endswith(f"/{model_name}") or model_name.endswith(f"/{name}"):
-                matched_group_name = name
-                break
+    matched_group_name = await _resolve_group(api_key, model_name)
     if not matched_group_name:
         raise HTTPException(status_code=403, detail=f"API key not authorized for model: {model_name}")
 
     excluded_provider_ids = []
     while True:
         dummy_request = schemas.ChatRequest(model=matched_group_name, messages=[])
-        provider, group_id = smart_router.select_provider(db, dummy_request, excluded_provider_ids=excluded_provider_ids)
+        provider, group_id = await smart_router.select_provider_async(dummy_request, excluded_provider_ids=excluded_provider_ids)
         if not provider:
             raise HTTPException(status_code=503, detail="No provider found for text-to-speech.")
 
         start_time = time.time()
-        if group_id:
-            crud.increment_active_calls(db, provider.id, group_id)
+        concurrency.increment(provider.id, group_id)
         try:
             api_url = provider.api_endpoint.replace("/chat/completions", "/audio/speech") if "/chat/completions" in provider.api_endpoint else provider.api_endpoint
             headers = {"Authorization": f"Bearer {provider.api_key}", "Content-Type": "application/json"}
             payload = dict(body)
             payload["model"] = provider.model
 
-            async with httpx.AsyncClient(timeout=120) as client:
-                response = await client.post(api_url, headers=headers, json=payload)
+            client = http_clients.get_client(api_url)
+            response = await client.post(api_url, headers=headers, json=payload, timeout=120)
 
             end_time = time.time()
-            try:
-                crud.create_call_log(db, schemas.CallLogCreate(
-                    provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
-                    is_success=response.status_code < 400, status_code=response.status_code,
-                    response_time_ms=int((end_time - start_time) * 1000),
-                    request_body=f"Audio Speech: model={model_name}",
-                    response_body=f"Status: {response.status_code}"
-                ))
-            except:
-                db.rollback()
+            await log_writer.submit(schemas.CallLogCreate(
+                provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
+                is_success=response.status_code < 400, status_code=response.status_code,
+                response_time_ms=int((end_time - start_time) * 1000),
+                request_body=f"Audio Speech: model={model_name}",
+                response_body=f"Status: {response.status_code}"
+            ))
 
             if response.status_code >= 400:
                 excluded_provider_ids.append(provider.id)
@@ -1636,18 +1540,18 @@ async def audio_speech(
             )
         except Exception as e:
             logger.error(f"Audio speech error with provider {provider.name}: {e}")
+            await _log_upstream_exception(provider, api_key, start_time, e, f"Audio Speech: model={model_name}")
             excluded_provider_ids.append(provider.id)
             continue
         finally:
-            if group_id:
-                crud.decrement_active_calls(db, provider.id, group_id)
+            concurrency.decrement(provider.id, group_id)
 
 
 @proxy_router.post("/v1/moderations")
 async def moderations(
     request: Request,
     db: Session = Depends(get_db),
-    api_key: models.APIKey = Depends(get_api_key_from_bearer)
+    api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)
 ):
     """
     OpenAI Moderations API - JSON request for content moderation.
@@ -1655,48 +1559,36 @@ async def moderations(
     body = await request.json()
     model_name = body.get("model", "text-moderation-latest")
 
-    authorized_group_names = {group.name for group in api_key.groups}
-    matched_group_name = None
-    if model_name in authorized_group_names:
-        matched_group_name = model_name
-    else:
-        for name in authorized_group_names:
-            if name.endswith(f"/{model_name}") or model_name.endswith(f"/{name}"):
-                matched_group_name = name
-                break
+    matched_group_name = await _resolve_group(api_key, model_name)
     if not matched_group_name:
         raise HTTPException(status_code=403, detail=f"API key not authorized for model: {model_name}")
 
     excluded_provider_ids = []
     while True:
         dummy_request = schemas.ChatRequest(model=matched_group_name, messages=[])
-        provider, group_id = smart_router.select_provider(db, dummy_request, excluded_provider_ids=excluded_provider_ids)
+        provider, group_id = await smart_router.select_provider_async(dummy_request, excluded_provider_ids=excluded_provider_ids)
         if not provider:
             raise HTTPException(status_code=503, detail="No provider found for moderations.")
 
         start_time = time.time()
-        if group_id:
-            crud.increment_active_calls(db, provider.id, group_id)
+        concurrency.increment(provider.id, group_id)
         try:
             api_url = provider.api_endpoint.replace("/chat/completions", "/moderations") if "/chat/completions" in provider.api_endpoint else provider.api_endpoint
             headers = {"Authorization": f"Bearer {provider.api_key}", "Content-Type": "application/json"}
             payload = dict(body)
             payload["model"] = provider.model
 
-            async with httpx.AsyncClient(timeout=60) as client:
-                response = await client.post(api_url, headers=headers, json=payload)
+            client = http_clients.get_client(api_url)
+            response = await client.post(api_url, headers=headers, json=payload, timeout=60)
 
             end_time = time.time()
-            try:
-                crud.create_call_log(db, schemas.CallLogCreate(
-                    provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
-                    is_success=response.status_code < 400, status_code=response.status_code,
-                    response_time_ms=int((end_time - start_time) * 1000),
-                    request_body=f"Moderations: model={model_name}",
-                    response_body=f"Status: {response.status_code}"
-                ))
-            except:
-                db.rollback()
+            await log_writer.submit(schemas.CallLogCreate(
+                provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
+                is_success=response.status_code < 400, status_code=response.status_code,
+                response_time_ms=int((end_time - start_time) * 1000),
+                request_body=f"Moderations: model={model_name}",
+                response_body=f"Status: {response.status_code}"
+            ))
 
             if response.status_code >= 400:
                 excluded_provider_ids.append(provider.id)
@@ -1708,11 +1600,11 @@ async def moderations(
             )
         except Exception as e:
             logger.error(f"Moderations error with provider {provider.name}: {e}")
+            await _log_upstream_exception(provider, api_key, start_time, e, f"Moderations: model={model_name}")
             excluded_provider_ids.append(provider.id)
             continue
         finally:
-            if group_id:
-                crud.decrement_active_calls(db, provider.id, group_id)
+            concurrency.decrement(provider.id, group_id)
 
 
 @proxy_router.api_route("/v1/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
@@ -1720,7 +1612,7 @@ async def generic_proxy(
     path: str,
     request: Request,
     db: Session = Depends(get_db),
-    api_key: models.APIKey = Depends(get_api_key_from_bearer)
+    api_key: auth_cache.CachedAPIKey = Depends(get_api_key_from_bearer)
 ):
     """
     Generic proxy for any other OpenAI-compatible endpoints not explicitly defined above.
@@ -1750,17 +1642,7 @@ async def generic_proxy(
     if not model_name:
         raise HTTPException(status_code=400, detail="Model name is required for routing in this proxy.")
 
-    authorized_group_names = {group.name for group in api_key.groups}
-    matched_group_name = None
-    if model_name in authorized_group_names:
-        matched_group_name = model_name
-    else:
-        for name in authorized_group_names:
-            if (name.endswith(f"/{model_name}") or model_name.endswith(f"/{name}") or
-                name == model_name.replace("claude-", "anthropic/") or
-                name == model_name.replace("gpt-", "openai/")):
-                matched_group_name = name
-                break
+    matched_group_name = await _resolve_group(api_key, model_name)
 
     if not matched_group_name:
         raise HTTPException(status_code=403, detail=f"API key not authorized for model: {model_name}")
@@ -1768,13 +1650,12 @@ async def generic_proxy(
     excluded_provider_ids = []
     while True:
         dummy_request = schemas.ChatRequest(model=matched_group_name, messages=[])
-        provider, group_id = smart_router.select_provider(db, dummy_request, excluded_provider_ids=excluded_provider_ids)
+        provider, group_id = await smart_router.select_provider_async(dummy_request, excluded_provider_ids=excluded_provider_ids)
         if not provider:
             raise HTTPException(status_code=503, detail="No available providers found for this request.")
 
         start_time = time.time()
-        if group_id:
-            crud.increment_active_calls(db, provider.id, group_id)
+        concurrency.increment(provider.id, group_id)
 
         try:
             if "/v1/" in provider.api_endpoint:
@@ -1787,57 +1668,54 @@ async def generic_proxy(
             headers_to_send = {k: v for k, v in request.headers.items() if k.lower() not in ["host", "authorization", "content-length"]}
             headers_to_send["Authorization"] = f"Bearer {provider.api_key}"
 
-            async with httpx.AsyncClient(timeout=300) as client:
-                if "multipart/form-data" in content_type:
-                    form_data = await request.form()
-                    data = {}
-                    files = []
-                    for key, value in form_data.items():
-                        if key == "model":
-                            data[key] = provider.model
-                        elif hasattr(value, "filename"):
-                            content = await value.read()
-                            files.append((key, (value.filename, content, value.content_type)))
-                        else:
-                            data[key] = value
-                    headers_to_send = {k: v for k, v in headers_to_send.items() if k.lower() != "content-type"}
-                    response = await client.request(method, target_url, headers=headers_to_send, data=data, files=files)
-                else:
-                    body = await request.body()
-                    if "application/json" in content_type:
-                        try:
-                            j = json.loads(body)
-                            if "model" in j:
-                                j["model"] = provider.model
-                            body = json.dumps(j).encode('utf-8')
-                        except:
-                            pass
-                    response = await client.request(method, target_url, headers=headers_to_send, content=body)
+            client = http_clients.get_client(target_url)
+            if "multipart/form-data" in content_type:
+                form_data = await request.form()
+                data = {}
+                files = []
+                for key, value in form_data.items():
+                    if key == "model":
+                        data[key] = provider.model
+                    elif hasattr(value, "filename"):
+                        content = await value.read()
+                        files.append((key, (value.filename, content, value.content_type)))
+                    else:
+                        data[key] = value
+                headers_to_send = {k: v for k, v in headers_to_send.items() if k.lower() != "content-type"}
+                response = await client.request(method, target_url, headers=headers_to_send, data=data, files=files, timeout=300)
+            else:
+                body = await request.body()
+                if "application/json" in content_type:
+                    try:
+                        j = json.loads(body)
+                        if "model" in j:
+                            j["model"] = provider.model
+                        body = json.dumps(j).encode('utf-8')
+                    except:
+                        pass
+                response = await client.request(method, target_url, headers=headers_to_send, content=body, timeout=300)
 
-                end_time = time.time()
-                try:
-                    crud.create_call_log(db, schemas.CallLogCreate(
-                        provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
-                        is_success=response.status_code < 400, status_code=response.status_code,
-                        response_time_ms=int((end_time - start_time) * 1000),
-                        request_body=f"Generic Proxy: {path}",
-                        response_body=f"Status: {response.status_code}"
-                    ))
-                except:
-                    db.rollback()
+            end_time = time.time()
+            await log_writer.submit(schemas.CallLogCreate(
+                provider_id=provider.id, api_key_id=api_key.id, response_timestamp=datetime.now(TAIPEI_TZ),
+                is_success=response.status_code < 400, status_code=response.status_code,
+                response_time_ms=int((end_time - start_time) * 1000),
+                request_body=f"Generic Proxy: {path}",
+                response_body=f"Status: {response.status_code}"
+            ))
 
-                return Response(
-                    content=response.content, status_code=response.status_code,
-                    headers={k: v for k, v in response.headers.items() if k.lower() not in ["content-length", "content-encoding", "transfer-encoding"]}
-                )
+            return Response(
+                content=response.content, status_code=response.status_code,
+                headers={k: v for k, v in response.headers.items() if k.lower() not in ["content-length", "content-encoding", "transfer-encoding"]}
+            )
 
         except Exception as e:
             logger.error(f"Generic proxy error with provider {provider.name}: {e}")
+            await _log_upstream_exception(provider, api_key, start_time, e, f"Generic Proxy: {path}")
             excluded_provider_ids.append(provider.id)
             continue
         finally:
-            if group_id:
-                crud.decrement_active_calls(db, provider.id, group_id)
+            concurrency.decrement(provider.id, group_id)
 
 
 # --- Remote Public Management APIs (Auth via API Key) ---
@@ -0,0 +1,105 @@
+"""Coalesced `last_used_at` tracking for API keys.
+
+Every authenticated request used to run an UPDATE + COMMIT on `api_keys` just
+to bump the key's timestamp, and since all keys share that table the writes
+serialized under SQLite. Auth now only records the time in memory; a
+background task writes the latest value per key in one batched UPDATE every
+few seconds, and once more on shutdown. The API Keys page and `/api/keys/`
+read the in-memory value, so they stay exact between flushes.
+
+Tunable through environment variables:
+    API_KEY_LAST_USED_FLUSH_INTERVAL   seconds between batched writes (default 10)
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import pytz
+
+from . import crud, db_async
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+TAIPEI_TZ = pytz.timezone('Asia/Taipei')
+
+API_KEY_LAST_USED_FLUSH_INTERVAL = float(os.getenv("API_KEY_LAST_USED_FLUSH_INTERVAL", "10"))
+
+
+class LastUsedTracker:
+    def __init__(self, flush_interval: float = API_KEY_LAST_USED_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._last_used: Dict[int, float] = {}  # api_key_id -> epoch seconds
+        self._dirty: Dict[int, float] = {}      # not yet written to the database
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+
+    def touch(self, api_key_id: int):
+        """Records that the key was just used."""
+        now = time.time()
+        with self._lock:
+            self._last_used[api_key_id] = now
+            self._dirty[api_key_id] = now
+
+    def get(self, api_key_id: int) -> Optional[datetime]:
+        """Latest use seen by this process, as a naive Taipei-local datetime
+        like the values read back from the database."""
+        ts = self._last_used.get(api_key_id)
+        if ts is None:
+            return None
+        return datetime.fromtimestamp(ts, TAIPEI_TZ).replace(tzinfo=None)
+
+    def snapshot(self) -> Dict[int, datetime]:
+        with self._lock:
+            items = list(self._last_used.items())
+        return {k: datetime.fromtimestamp(ts, TAIPEI_TZ).replace(tzinfo=None) for k, ts in items}
+
+    def start(self):
+        """Starts the periodic flush task on the running event loop."""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await db_async.run_sync(self.flush)
+
+    def flush(self):
+        """Writes the pending timestamps in one transaction."""
+        with self._lock:
+            if not self._dirty:
+                return
+            pending, self._dirty = self._dirty, {}
+        db = SessionLocal()
+        try:
+            crud.set_api_keys_last_used(db, {
+                api_key_id: datetime.fromtimestamp(ts, TAIPEI_TZ) for api_key_id, ts in pending.items()
+            })
+        except Exception as e:
+            logger.error(f"Failed to persist API key last_used_at: {e}")
+            # Put them back unless a newer use was recorded meanwhile
+            with self._lock:
+                for api_key_id, ts in pending.items():
+                    if self._dirty.get(api_key_id, 0) < ts:
+                        self._dirty[api_key_id] = ts
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await db_async.run_sync(self.flush)
+
+
+api_key_usage = LastUsedTracker()
@@ -0,0 +1,106 @@
+"""In-process cache of API key authentication results.
+
+Every proxy request used to look its key up with `crud.get_api_key_by_key` and
+then lazy-load `api_key.groups` to build the set of authorized group names -
+two queries per request for data that changes only when an admin edits a key
+or a group. The cache maps the key string to a detached `CachedAPIKey`
+(id, name, active flag, frozen set of group names), so a warm lookup costs no
+queries at all.
+
+Entries expire after AUTH_CACHE_TTL seconds as a safety net; the API key and
+group CRUD functions call `invalidate()` so edits take effect immediately.
+Unknown keys are cached as well (as None), so a client retrying with a bad key
+does not hit the database on every attempt.
+
+Tunable through environment variables:
+    AUTH_CACHE_TTL            seconds an entry stays valid (default 60)
+    AUTH_CACHE_MAX_ENTRIES    entries kept before the cache is reset (default 10000)
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from sqlalchemy.orm import Session, selectinload
+
+from . import models, db_async
+
+logger = logging.getLogger(__name__)
+
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+
+@dataclass(frozen=True)
+class CachedAPIKey:
+    """Detached copy of an APIKey row with its authorized group names."""
+    id: int
+    key: str
+    name: Optional[str]
+    is_active: bool
+    group_names: FrozenSet[str]
+
+
+_lock = threading.Lock()
+_entries: Dict[str, Tuple[Optional[CachedAPIKey], float]] = {}
+_version = 0
+
+
+def invalidate():
+    """Drops every cached entry. Call after committing API key or group changes."""
+    global _version
+    with _lock:
+        _version += 1
+        _entries.clear()
+
+
+def _load(db: Session, key: str) -> Optional[CachedAPIKey]:
+    db_api_key = (
+        db.query(models.APIKey)
+        .options(selectinload(models.APIKey.groups))
+        .filter(models.APIKey.key == key)
+        .first()
+    )
+    if db_api_key is None:
+        return None
+    return CachedAPIKey(
+        id=db_api_key.id,
+        key=db_api_key.key,
+        name=db_api_key.name,
+        is_active=bool(db_api_key.is_active),
+        group_names=frozenset(g.name for g in db_api_key.groups),
+    )
+
+
+def lookup(db: Session, key: str) -> Optional[CachedAPIKey]:
+    """Returns the cached record for `key` (None if no such key), loading it
+    with `db` on a miss. Inactive keys are returned as-is; callers check
+    `is_active`."""
+    now = time.monotonic()
+    entry = _entries.get(key)
+    if entry is not None and entry[1] > now:
+        return entry[0]
+
+    with _lock:
+        target_version = _version
+    record = _load(db, key)
+
+    with _lock:
+        # Skip storing if the keys changed while we were loading
+        if _version == target_version:
+            if len(_entries) >= AUTH_CACHE_MAX_ENTRIES:
+                logger.info(f"Auth cache reached {AUTH_CACHE_MAX_ENTRIES} entries; resetting.")
+                _entries.clear()
+            _entries[key] = (record, now + AUTH_CACHE_TTL)
+    return record
+
+
+async def lookup_async(key: str) -> Optional[CachedAPIKey]:
+    """Like lookup(), for async callers: a cache hit returns immediately, a
+    miss is loaded on the database thread pool with its own session."""
+    entry = _entries.get(key)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+    return await db_async.run_in_session(lookup, key)
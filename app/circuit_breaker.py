@@ -0,0 +1,185 @@
+"""Per-provider circuit breakers.
+
+The failure window only skips a provider while it has enough recent failures,
+so a dead upstream keeps receiving real traffic (and burning full timeouts)
+every time those failures age out. A breaker sits on top of it:
+
+    closed      normal operation; consecutive failures are counted
+    open        the provider is skipped by the router until the cool-down ends
+    half_open   a limited number of trial requests are let through; a success
+                closes the breaker, a failure re-opens it with a longer cool-down
+
+The breaker trips after CIRCUIT_FAILURE_THRESHOLD consecutive failures,
+immediately on a 429 (if CIRCUIT_TRIP_ON_429), or after
+CIRCUIT_TIMEOUT_THRESHOLD consecutive timeouts. Outcomes are reported from the
+call log writer, so every logged attempt feeds the breaker.
+
+Tunable through environment variables:
+    CIRCUIT_FAILURE_THRESHOLD      consecutive failures before opening (default 5)
+    CIRCUIT_TIMEOUT_THRESHOLD      consecutive timeouts before opening (default 2)
+    CIRCUIT_TRIP_ON_429            "true" to open on the first 429 (default true)
+    CIRCUIT_OPEN_SECONDS           first cool-down in seconds (default 30)
+    CIRCUIT_MAX_OPEN_SECONDS       cool-down cap after repeated trips (default 600)
+    CIRCUIT_HALF_OPEN_MAX_CALLS    concurrent trial requests in half-open (default 1)
+    CIRCUIT_PROBE_TIMEOUT          seconds before an unanswered trial is given up (default 300)
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_TIMEOUT_THRESHOLD = int(os.getenv("CIRCUIT_TIMEOUT_THRESHOLD", "2"))
+CIRCUIT_TRIP_ON_429 = os.getenv("CIRCUIT_TRIP_ON_429", "true").lower() in ("1", "true", "yes")
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_MAX_OPEN_SECONDS = float(os.getenv("CIRCUIT_MAX_OPEN_SECONDS", "600"))
+CIRCUIT_HALF_OPEN_MAX_CALLS = int(os.getenv("CIRCUIT_HALF_OPEN_MAX_CALLS", "1"))
+CIRCUIT_PROBE_TIMEOUT = float(os.getenv("CIRCUIT_PROBE_TIMEOUT", "300"))
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+REASON_ERROR = "error"
+REASON_RATE_LIMITED = "rate_limited"
+REASON_TIMEOUT = "timeout"
+
+
+def classify_status(status_code: Optional[int]) -> Optional[str]:
+    """Maps a logged status code to a failure reason, or None when the upstream
+    answered normally (client errors such as 400 say nothing about its health)."""
+    if status_code is None:
+        return REASON_ERROR
+    if status_code == 429:
+        return REASON_RATE_LIMITED
+    if status_code in (408, 504):
+        return REASON_TIMEOUT
+    if status_code >= 500 or status_code in (401, 403):
+        return REASON_ERROR
+    return None
+
+
+class _Breaker:
+    __slots__ = ("state", "consecutive_failures", "consecutive_timeouts", "trips",
+                 "opened_at", "open_seconds", "trials", "last_failure_reason")
+
+    def __init__(self):
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.consecutive_timeouts = 0
+        self.trips = 0
+        self.opened_at = 0.0
+        self.open_seconds = 0.0
+        self.trials: List[float] = []  # start times of in-flight half-open trials
+        self.last_failure_reason: Optional[str] = None
+
+
+class CircuitBreakerRegistry:
+    def __init__(self):
+        self._breakers: Dict[int, _Breaker] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, provider_id: int) -> bool:
+        """Whether the router may send a request to the provider now. In
+        half-open this reserves one of the trial slots."""
+        breaker = self._breakers.get(provider_id)
+        if breaker is None or breaker.state == STATE_CLOSED:
+            return True
+        now = time.time()
+        with self._lock:
+            if breaker.state == STATE_OPEN:
+                if now - breaker.opened_at < breaker.open_seconds:
+                    return False
+                breaker.state = STATE_HALF_OPEN
+                breaker.trials = []
+                logger.info(f"Circuit for provider {provider_id} is half-open; allowing trial requests.")
+            if breaker.state == STATE_HALF_OPEN:
+                # Forget trials that never reported back (e.g. the client went away)
+                breaker.trials = [t for t in breaker.trials if now - t < CIRCUIT_PROBE_TIMEOUT]
+                if len(breaker.trials) >= CIRCUIT_HALF_OPEN_MAX_CALLS:
+                    return False
+                breaker.trials.append(now)
+            return True
+
+    def record_success(self, provider_id: int):
+        breaker = self._breakers.get(provider_id)
+        if breaker is None:
+            return
+        with self._lock:
+            if breaker.state != STATE_CLOSED:
+                logger.info(f"Circuit for provider {provider_id} closed after a successful trial.")
+            breaker.state = STATE_CLOSED
+            breaker.consecutive_failures = 0
+            breaker.consecutive_timeouts = 0
+            breaker.trips = 0
+            breaker.trials = []
+
+    def record_failure(self, provider_id: int, reason: str = REASON_ERROR):
+        with self._lock:
+            breaker = self._breakers.get(provider_id)
+            if breaker is None:
+                breaker = self._breakers[provider_id] = _Breaker()
+            breaker.consecutive_failures += 1
+            breaker.consecutive_timeouts = breaker.consecutive_timeouts + 1 if reason == REASON_TIMEOUT else 0
+            breaker.last_failure_reason = reason
+
+            if breaker.state == STATE_HALF_OPEN:
+                self._trip(provider_id, breaker, f"trial request failed ({reason})")
+            elif breaker.state == STATE_CLOSED:
+                if reason == REASON_RATE_LIMITED and CIRCUIT_TRIP_ON_429:
+                    self._trip(provider_id, breaker, "rate limited (429)")
+                elif breaker.consecutive_timeouts >= CIRCUIT_TIMEOUT_THRESHOLD:
+                    self._trip(provider_id, breaker, f"{breaker.consecutive_timeouts} consecutive timeouts")
+                elif breaker.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+                    self._trip(provider_id, breaker, f"{breaker.consecutive_failures} consecutive failures")
+
+    def record_status(self, provider_id: int, is_success: bool, status_code: Optional[int]):
+        """Feeds a logged call outcome into the provider's breaker."""
+        if provider_id is None:
+            return
+        reason = None if is_success else classify_status(status_code)
+        if reason is None:
+            self.record_success(provider_id)
+        else:
+            self.record_failure(provider_id, reason)
+
+    def _trip(self, provider_id: int, breaker: _Breaker, why: str):
+        breaker.trips += 1
+        breaker.state = STATE_OPEN
+        breaker.opened_at = time.time()
+        breaker.open_seconds = min(CIRCUIT_OPEN_SECONDS * (2 ** (breaker.trips - 1)), CIRCUIT_MAX_OPEN_SECONDS)
+        breaker.trials = []
+        logger.warning(f"Circuit for provider {provider_id} opened for {breaker.open_seconds:.0f}s: {why}.")
+
+    def reset(self, provider_id: int = None):
+        with self._lock:
+            if provider_id is None:
+                self._breakers.clear()
+            else:
+                self._breakers.pop(provider_id, None)
+
+    def status(self) -> List[dict]:
+        """State of every provider that has reported a failure."""
+        now = time.time()
+        with self._lock:
+            items = list(self._breakers.items())
+            result = []
+            for provider_id, b in items:
+                retry_after = None
+                if b.state == STATE_OPEN:
+                    retry_after = round(max(0.0, b.opened_at + b.open_seconds - now), 1)
+                result.append({
+                    "provider_id": provider_id,
+                    "state": b.state,
+                    "consecutive_failures": b.consecutive_failures,
+                    "trips": b.trips,
+                    "last_failure_reason": b.last_failure_reason,
+                    "retry_after_seconds": retry_after,
+                })
+        return result
+
+
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,125 @@
+"""Live per provider-group concurrency counters.
+
+`active_calls` used to be an UPDATE + COMMIT on provider_group_association at
+the start and end of every attempt. The counters now live in process memory,
+keyed by (provider_id, group_id), and a background task persists a snapshot
+every few seconds so the column stays roughly in sync for anything reading the
+table directly. `/api/status` and the router read the in-memory values.
+
+Tunable through environment variables:
+    ACTIVE_CALLS_PERSIST_INTERVAL   seconds between snapshot writes (default 5)
+"""
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict, Tuple
+
+from . import crud, db_async
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_CALLS_PERSIST_INTERVAL = float(os.getenv("ACTIVE_CALLS_PERSIST_INTERVAL", "5"))
+
+
+class ConcurrencyTracker:
+    def __init__(self, persist_interval: float = ACTIVE_CALLS_PERSIST_INTERVAL):
+        self.persist_interval = persist_interval
+        self._counts: Dict[Tuple[int, int], int] = {}
+        # Same counters summed per provider, for O(1) lookups while routing
+        self._provider_totals: Dict[int, int] = {}
+        # Counters are updated on the event loop but read from sync endpoints
+        # running in the threadpool, so guard them with a plain lock.
+        self._lock = threading.Lock()
+        self._version = 0
+        self._persisted_version = 0
+        self._task: asyncio.Task | None = None
+
+    def increment(self, provider_id: int, group_id: int):
+        if not group_id:
+            return
+        key = (provider_id, group_id)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._provider_totals[provider_id] = self._provider_totals.get(provider_id, 0) + 1
+            self._version += 1
+
+    def decrement(self, provider_id: int, group_id: int):
+        if not group_id:
+            return
+        key = (provider_id, group_id)
+        with self._lock:
+            current = self._counts.get(key, 0)
+            if current <= 1:
+                self._counts.pop(key, None)
+            else:
+                self._counts[key] = current - 1
+            if current > 0:
+                total = self._provider_totals.get(provider_id, 0)
+                if total <= 1:
+                    self._provider_totals.pop(provider_id, None)
+                else:
+                    self._provider_totals[provider_id] = total - 1
+                self._version += 1
+
+    def get(self, provider_id: int, group_id: int) -> int:
+        return self._counts.get((provider_id, group_id), 0)
+
+    def total_for_provider(self, provider_id: int) -> int:
+        """Active calls for a provider across all of its groups."""
+        return self._provider_totals.get(provider_id, 0)
+
+    def snapshot(self) -> Dict[Tuple[int, int], int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._provider_totals.clear()
+            self._version += 1
+
+    def start(self):
+        """Starts the periodic persistence task on the running event loop."""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Nothing can be in flight once the process stops
+        self.reset()
+        await db_async.run_sync(self.persist)
+
+    def persist(self):
+        """Writes the current counters to provider_group_association if they
+        changed since the last write."""
+        with self._lock:
+            version = self._version
+            if version == self._persisted_version:
+                return
+            counts = dict(self._counts)
+        db = SessionLocal()
+        try:
+            crud.set_active_calls(db, counts)
+            self._persisted_version = version
+        except Exception as e:
+            logger.error(f"Failed to persist active call counters: {e}")
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            await db_async.run_sync(self.persist)
+
+
+concurrency = ConcurrencyTracker()
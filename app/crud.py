@@ -1,7 +1,11 @@
 from sqlalchemy.orm import Session
 from typing import List
-from . import models, schemas
+from . import models, schemas, routing_cache, keyword_matcher, auth_cache, stats_rollup, log_search
 from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy import func
+from datetime import datetime
+import pytz
+import re
 
 def get_provider(db: Session, provider_id: int):
     return db.query(models.ApiProvider).filter(models.ApiProvider.id == provider_id).first()
@@ -56,6 +60,7 @@ def create_provider(db: Session, provider: schemas.ApiProviderCreate):
     db.add(db_provider)
     db.commit()
     db.refresh(db_provider)
+    routing_cache.invalidate()
     return db_provider
 
 def update_provider(db: Session, provider_id: int, provider_data: dict):
@@ -70,13 +75,17 @@ def update_provider(db: Session, provider_id: int, provider_data: dict):
         return get_provider(db, provider_id)
     db.query(models.ApiProvider).filter(models.ApiProvider.id == provider_id).update(filtered_data)
     db.commit()
+    routing_cache.invalidate()
     return get_provider(db, provider_id)
 
 def delete_provider(db: Session, provider_id: int):
     db_provider = get_provider(db, provider_id)
     if db_provider:
+        # 其呼叫日誌的 provider_id 會被清空，彙總也一併移除，避免儀表板沿用已刪除的供應商
+        stats_rollup.delete_for_providers(db, [provider_id])
         db.delete(db_provider)
         db.commit()
+        routing_cache.invalidate()
     return db_provider
 
 def delete_providers_by_key(db: Session, api_key: str):
@@ -94,6 +103,7 @@ def delete_providers_by_key(db: Session, api_key: str):
     db.query(models.CallLog).filter(
         models.CallLog.provider_id.in_(provider_ids)
     ).delete(synchronize_session=False)
+    stats_rollup.delete_for_providers(db, provider_ids)
 
     # Delete associations from groups
     db.query(models.ProviderGroupAssociation).filter(
@@ -106,14 +116,42 @@ def delete_providers_by_key(db: Session, api_key: str):
         db.delete(provider)
 
     db.commit()
+    routing_cache.invalidate()
     return deleted_count
 
-def get_call_logs(db: Session, skip: int = 0, limit: int = 100, filter_success: bool | None = None):
+def _to_local_naive(ts: datetime) -> datetime:
+    """Call log timestamps are stored as naive Taipei local time."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(pytz.timezone('Asia/Taipei'))
+    return ts.replace(tzinfo=None)
+
+def filter_call_logs(query, filters: schemas.CallLogFilters | None):
+    """Applies the list filters; every condition is on an indexed column."""
+    if filters is None:
+        return query
+    CallLog = models.CallLog
+    if filters.is_success is not None:
+        query = query.filter(CallLog.is_success == filters.is_success)
+    if filters.provider_id is not None:
+        query = query.filter(CallLog.provider_id == filters.provider_id)
+    if filters.api_key_id is not None:
+        query = query.filter(CallLog.api_key_id == filters.api_key_id)
+    if filters.status_code is not None:
+        query = query.filter(CallLog.status_code == filters.status_code)
+    if filters.start_time is not None:
+        query = query.filter(CallLog.request_timestamp >= _to_local_naive(filters.start_time))
+    if filters.end_time is not None:
+        query = query.filter(CallLog.request_timestamp < _to_local_naive(filters.end_time))
+    if filters.min_latency_ms is not None:
+        query = query.filter(CallLog.response_time_ms >= filters.min_latency_ms)
+    return query
+
+def _call_log_summary_query(db: Session):
     from sqlalchemy.orm import joinedload, load_only
     # 進一步優化查詢性能：
     # 1. 使用 load_only 只查詢列表顯示所需的欄位，徹底排除遺留的大文本 Body
     # 2. 同時使用 joinedload 預加載 Provider 和 API Key，並限制它們加載的欄位 (避免 N+1)
-    query = db.query(models.CallLog).options(
+    return db.query(models.CallLog).options(
         load_only(
             models.CallLog.id,
             models.CallLog.provider_id,
@@ -126,7 +164,8 @@ def get_call_logs(db: Session, skip: int = 0, limit: int = 100, filter_success:
             models.CallLog.completion_tokens,
             models.CallLog.total_tokens,
             models.CallLog.cost,
-            models.CallLog.error_message
+            models.CallLog.error_message,
+            models.CallLog.requested_model
         ),
         joinedload(models.CallLog.provider).load_only(
             models.ApiProvider.id,
@@ -138,11 +177,34 @@ def get_call_logs(db: Session, skip: int = 0, limit: int = 100, filter_success:
             models.APIKey.id,
             models.APIKey.key
         )
-    ).order_by(models.CallLog.id.desc())
+    )
+
+def get_call_logs(db: Session, skip: int = 0, limit: int = 100, filter_success: bool | None = None,
+                  filters: schemas.CallLogFilters | None = None, before_id: int | None = None, after_id: int | None = None):
+    """Newest-first page of call logs. With `before_id` / `after_id` the page
+    is the `limit` logs just older / newer than that id (keyset pagination,
+    constant cost at any depth); otherwise `skip` is used as an offset."""
+    query = _call_log_summary_query(db)
     if filter_success is not None:
         query = query.filter(models.CallLog.is_success == filter_success)
+    query = filter_call_logs(query, filters)
+
+    if after_id is not None:
+        # Walk forward from the cursor, then flip back to newest-first
+        logs = query.filter(models.CallLog.id > after_id).order_by(models.CallLog.id.asc()).limit(limit).all()
+        return logs[::-1]
+    query = query.order_by(models.CallLog.id.desc())
+    if before_id is not None:
+        return query.filter(models.CallLog.id < before_id).limit(limit).all()
     return query.offset(skip).limit(limit).all()
 
+def get_call_logs_by_ids(db: Session, log_ids: List[int]):
+    """Summary rows for the given ids, in the order of `log_ids`."""
+    if not log_ids:
+        return []
+    logs = {log.id: log for log in _call_log_summary_query(db).filter(models.CallLog.id.in_(log_ids))}
+    return [logs[i] for i in log_ids if i in logs]
+
 def get_call_log(db: Session, log_id: int):
     from sqlalchemy.orm import joinedload
     return db.query(models.CallLog).options(
@@ -151,42 +213,81 @@ def get_call_log(db: Session, log_id: int):
         joinedload(models.CallLog.api_key)
     ).filter(models.CallLog.id == log_id).first()
 
-def count_call_logs(db: Session, filter_success: bool | None = None):
-    query = db.query(models.CallLog)
+def count_call_logs(db: Session, filter_success: bool | None = None, filters: schemas.CallLogFilters | None = None,
+                    cap: int | None = None):
+    """Exact count of matching logs; with `cap`, counting stops after `cap` + 1
+    rows so the cost is bounded (the result then means "more than cap")."""
+    query = db.query(models.CallLog.id)
     if filter_success is not None:
         query = query.filter(models.CallLog.is_success == filter_success)
-    return query.count()
+    query = filter_call_logs(query, filters)
+    if cap is None:
+        return query.count()
+    return db.query(func.count()).select_from(query.limit(cap + 1).subquery()).scalar()
+
+def estimate_call_log_count(db: Session) -> int:
+    """Approximate number of call logs from the id range: two rowid lookups
+    instead of a table scan. Overestimates by the number of deleted logs."""
+    low, high = db.query(func.min(models.CallLog.id), func.max(models.CallLog.id)).one()
+    if high is None:
+        return 0
+    return high - low + 1
 
 def get_error_keywords(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.ErrorMaintenance).order_by(models.ErrorMaintenance.id.desc()).offset(skip).limit(limit).all()
 
-def create_call_log(db: Session, log: schemas.CallLogCreate):
+_REQUESTED_MODEL = re.compile(r'"model"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+def requested_model_from_body(request_body: str | None) -> str | None:
+    """Model name in a logged request body. The bodies are JSON written by the
+    proxy with `model` near the front, so a regex search avoids parsing
+    (possibly huge) message lists; quotes inside message strings are escaped
+    and cannot match."""
+    if not request_body:
+        return None
+    match = _REQUESTED_MODEL.search(request_body)
+    return match.group(1) if match else None
+
+def create_call_logs_batch(db: Session, logs: List[schemas.CallLogCreate]):
+    """Inserts a batch of call logs (with details) in a single transaction and
+    applies the provider call counters as one aggregated UPDATE per provider,
+    plus the dashboard rollups (see stats_rollup).
+    Used by the background log writer; failures are recorded in the failure
+    window at submit time, not here."""
+    if not logs:
+        return
+    counters = {}
+    db_logs = []
     try:
-        if log.provider_id:
-            provider = get_provider(db, log.provider_id)
-            if provider:
-                provider.total_calls += 1
-            if log.is_success:
-                provider.successful_calls += 1
-
-        # Extract body data to save in separate table via relationship
-        log_data = log.dict()
-        req_body = log_data.pop('request_body', None)
-        resp_body = log_data.pop('response_body', None)
-
-        db_log = models.CallLog(**log_data)
-        
-        # Create detail record associated with the log
-        # SQLAlchemy will automatically link the IDs
-        db_log.details = models.CallLogDetail(
-            request_body=req_body,
-            response_body=resp_body
-        )
-        
-        db.add(db_log)
+        for log in logs:
+            log_data = log.dict()
+            req_body = log_data.pop('request_body', None)
+            resp_body = log_data.pop('response_body', None)
+            if log_data.get('requested_model') is None:
+                log_data['requested_model'] = requested_model_from_body(req_body)
+            db_log = models.CallLog(**log_data)
+            db_log.details = models.CallLogDetail(
+                request_body=req_body,
+                response_body=resp_body
+            )
+            db.add(db_log)
+            db_logs.append(db_log)
+
+            if log.provider_id:
+                total, success = counters.get(log.provider_id, (0, 0))
+                counters[log.provider_id] = (total + 1, success + (1 if log.is_success else 0))
+
+        for provider_id, (total, success) in counters.items():
+            db.query(models.ApiProvider).filter(models.ApiProvider.id == provider_id).update({
+                models.ApiProvider.total_calls: func.coalesce(models.ApiProvider.total_calls, 0) + total,
+                models.ApiProvider.successful_calls: func.coalesce(models.ApiProvider.successful_calls, 0) + success
+            }, synchronize_session=False)
+
+        stats_rollup.apply_logs(db, logs)
+        if log_search.enabled():
+            db.flush()
+            log_search.index_logs(db, [db_log.id for db_log in db_logs])
         db.commit()
-        db.refresh(db_log)
-        return db_log
     except Exception as e:
         db.rollback()
         raise e
@@ -202,11 +303,13 @@ def create_error_keyword(db: Session, keyword: schemas.ErrorKeywordCreate):
     db.add(db_keyword)
     db.commit()
     db.refresh(db_keyword)
+    keyword_matcher.invalidate()
     return db_keyword
 
 def update_error_keyword(db: Session, keyword_id: int, keyword_data: dict):
     db.query(models.ErrorMaintenance).filter(models.ErrorMaintenance.id == keyword_id).update(keyword_data)
     db.commit()
+    keyword_matcher.invalidate()
     return get_error_keyword(db, keyword_id)
 
 def delete_error_keyword(db: Session, keyword_id: int):
@@ -214,6 +317,7 @@ def delete_error_keyword(db: Session, keyword_id: int):
     if db_keyword:
         db.delete(db_keyword)
         db.commit()
+        keyword_matcher.invalidate()
     return db_keyword
 
 def update_keyword_trigger_time(db: Session, keyword_id: int):
@@ -224,22 +328,6 @@ def update_keyword_trigger_time(db: Session, keyword_id: int):
     db.query(models.ErrorMaintenance).filter(models.ErrorMaintenance.id == keyword_id).update({"last_triggered": datetime.now(TAIPEI_TZ)})
     db.commit()
 
-
-from datetime import datetime, timedelta
-import pytz
-
-TAIPEI_TZ = pytz.timezone('Asia/Taipei')
-
-def count_recent_failures_for_provider(db: Session, provider_id: int, minutes: int = 5) -> int:
-    """Counts the number of failed calls for a specific provider within the last N minutes."""
-    time_threshold = datetime.now(TAIPEI_TZ) - timedelta(minutes=minutes)
-    failure_count = db.query(models.CallLog).filter(
-        models.CallLog.provider_id == provider_id,
-        models.CallLog.is_success == False,
-        models.CallLog.request_timestamp >= time_threshold
-    ).count()
-    return failure_count
-
 # CRUD for Groups
 def get_group(db: Session, group_id: int):
     return db.query(models.Group).filter(models.Group.id == group_id).first()
@@ -293,12 +381,24 @@ def count_groups(db: Session):
     return db.query(models.Group).count()
 
 def create_group(db: Session, group: schemas.GroupCreate):
-    db_group = models.Group(name=group.name)
+    db_group = models.Group(name=group.name, routing_strategy=group.routing_strategy or "priority")
     db.add(db_group)
     db.commit()
     db.refresh(db_group)
+    routing_cache.invalidate()
     return db_group
 
+def update_group(db: Session, group_id: int, group_data: dict):
+    allowed_fields = {'name', 'routing_strategy'}
+    filtered_data = {k: v for k, v in group_data.items() if k in allowed_fields and v is not None}
+    if not filtered_data:
+        return get_group(db, group_id)
+    db.query(models.Group).filter(models.Group.id == group_id).update(filtered_data)
+    db.commit()
+    routing_cache.invalidate()
+    auth_cache.invalidate()
+    return get_group(db, group_id)
+
 def delete_group(db: Session, group_id: int):
     db_group = get_group(db, group_id)
     if db_group:
@@ -315,6 +415,8 @@ def delete_group(db: Session, group_id: int):
 
         db.delete(db_group)
         db.commit()
+        routing_cache.invalidate()
+        auth_cache.invalidate()
     return db_group
 
 def add_provider_to_group(db: Session, provider_id: int, group_id: int, priority: int = 1, commit: bool = True):
@@ -331,6 +433,7 @@ def add_provider_to_group(db: Session, provider_id: int, group_id: int, priority
     db.execute(stmt)
     if commit:
         db.commit()
+        routing_cache.invalidate()
     return get_provider(db, provider_id)
 
 def remove_provider_from_group(db: Session, provider_id: int, group_id: int):
@@ -339,6 +442,7 @@ def remove_provider_from_group(db: Session, provider_id: int, group_id: int):
         models.ProviderGroupAssociation.group_id == group_id
     ).delete(synchronize_session=False)
     db.commit()
+    routing_cache.invalidate()
     return result > 0
 
 def calculate_cost(provider: models.ApiProvider, prompt_tokens: int, completion_tokens: int, total_tokens: int) -> float | None:
@@ -382,7 +486,12 @@ def get_api_key(db: Session, api_key_id: int):
 def get_api_key_by_key(db: Session, key: str):
     return db.query(models.APIKey).filter(models.APIKey.key == key).first()
 
-def get_api_keys(db: Session, skip: int = 0, limit: int = 100):
+def get_api_keys(db: Session, skip: int = 0, limit: int = 100, live_last_used: dict = None):
+    """Lists API keys with their call counts. `live_last_used_at` on each key
+    is the in-memory last-use time from `live_last_used` ({api_key_id:
+    datetime}) if there is one, else the persisted column, which is only
+    written every few seconds. The column itself is left alone, so reading
+    never dirties the session."""
     from sqlalchemy import func
 
     # Subquery to count call logs for each API key
@@ -401,10 +510,12 @@ def get_api_keys(db: Session, skip: int = 0, limit: int = 100):
 
     results = query.offset(skip).limit(limit).all()
 
-    # Process results to add call_count to each APIKey object
+    # Process results to add call_count and live_last_used_at (plain attributes, not columns) to each APIKey object
+    live_last_used = live_last_used or {}
     api_keys_with_counts = []
     for api_key, call_count in results:
         api_key.call_count = call_count if call_count is not None else 0
+        api_key.live_last_used_at = live_last_used.get(api_key.id, api_key.last_used_at)
         api_keys_with_counts.append(api_key)
 
     return api_keys_with_counts
@@ -427,6 +538,7 @@ def create_api_key(db: Session, api_key_data: schemas.APIKeyCreate):
     db.add(db_api_key)
     db.commit()
     db.refresh(db_api_key)
+    auth_cache.invalidate()
     return db_api_key
 
 def update_api_key(db: Session, api_key_id: int, api_key_update: schemas.APIKeyUpdate):
@@ -454,6 +566,7 @@ def update_api_key(db: Session, api_key_id: int, api_key_update: schemas.APIKeyU
 
     db.commit()
     db.refresh(db_api_key)
+    auth_cache.invalidate()
     return db_api_key
 
 def delete_api_key(db: Session, api_key_id: int):
@@ -461,14 +574,19 @@ def delete_api_key(db: Session, api_key_id: int):
     if db_api_key:
         db.delete(db_api_key)
         db.commit()
+        auth_cache.invalidate()
     return db_api_key
 
-def update_api_key_last_used(db: Session, api_key_id: int):
-    from datetime import datetime
-    import pytz
+def set_api_keys_last_used(db: Session, last_used: dict):
+    """Writes coalesced last_used_at values ({api_key_id: datetime}) with one
+    executemany UPDATE in a single transaction."""
+    if not last_used:
+        return
+    from sqlalchemy import bindparam
 
-    TAIPEI_TZ = pytz.timezone('Asia/Taipei')
-    db.query(models.APIKey).filter(models.APIKey.id == api_key_id).update({"last_used_at": datetime.now(TAIPEI_TZ)})
+    table = models.APIKey.__table__
+    stmt = table.update().where(table.c.id == bindparam("key_id")).values(last_used_at=bindparam("used_at"))
+    db.execute(stmt, [{"key_id": k, "used_at": v} for k, v in last_used.items()])
     db.commit()
 
 # CRUD for Settings
@@ -483,6 +601,7 @@ def update_setting(db: Session, key: str, value: str):
     )
     db.execute(stmt)
     db.commit()
+    routing_cache.invalidate()
     return get_setting(db, key)
 
 # Concurrency Management
@@ -491,25 +610,24 @@ def reset_all_active_calls(db: Session):
     db.query(models.ProviderGroupAssociation).update({models.ProviderGroupAssociation.active_calls: 0})
     db.commit()
 
-def increment_active_calls(db: Session, provider_id: int, group_id: int):
-    """Increments active_calls for a specific provider-group association."""
+def set_active_calls(db: Session, counts: dict):
+    """Persists a snapshot of the in-memory concurrency counters.
+    `counts` maps (provider_id, group_id) to active calls; associations not in
+    the snapshot are set to 0."""
     db.query(models.ProviderGroupAssociation).filter(
-        models.ProviderGroupAssociation.provider_id == provider_id,
-        models.ProviderGroupAssociation.group_id == group_id
-    ).update({models.ProviderGroupAssociation.active_calls: models.ProviderGroupAssociation.active_calls + 1})
-    db.commit()
-
-def decrement_active_calls(db: Session, provider_id: int, group_id: int):
-    """Decrements active_calls for a specific provider-group association."""
-    db.query(models.ProviderGroupAssociation).filter(
-        models.ProviderGroupAssociation.provider_id == provider_id,
-        models.ProviderGroupAssociation.group_id == group_id,
-        models.ProviderGroupAssociation.active_calls > 0
-    ).update({models.ProviderGroupAssociation.active_calls: models.ProviderGroupAssociation.active_calls - 1})
+        models.ProviderGroupAssociation.active_calls != 0
+    ).update({models.ProviderGroupAssociation.active_calls: 0}, synchronize_session=False)
+    for (provider_id, group_id), active in counts.items():
+        db.query(models.ProviderGroupAssociation).filter(
+            models.ProviderGroupAssociation.provider_id == provider_id,
+            models.ProviderGroupAssociation.group_id == group_id
+        ).update({models.ProviderGroupAssociation.active_calls: active}, synchronize_session=False)
     db.commit()
 
-def get_concurrency_status(db: Session) -> List[schemas.ProviderConcurrencyStatus]:
-    """Returns the current active_calls for all provider-group associations."""
+def get_concurrency_status(db: Session, live_counts: dict = None) -> List[schemas.ProviderConcurrencyStatus]:
+    """Returns the current active_calls for all provider-group associations.
+    If `live_counts` (the in-memory counters) is given it takes precedence over
+    the periodically persisted column."""
     results = db.query(
         models.ProviderGroupAssociation.provider_id,
         models.ProviderGroupAssociation.group_id,
@@ -520,7 +638,7 @@ def get_concurrency_status(db: Session) -> List[schemas.ProviderConcurrencyStatu
         schemas.ProviderConcurrencyStatus(
             provider_id=r.provider_id,
             group_id=r.group_id,
-            active_calls=r.active_calls
+            active_calls=live_counts.get((r.provider_id, r.group_id), 0) if live_counts is not None else (r.active_calls or 0)
         ) for r in results
     ]
 
@@ -0,0 +1,115 @@
+"""Single data source for the dashboards.
+
+`get()` builds every dashboard series in one structure from a handful of
+GROUP BY queries over the rollup tables (see stats_rollup) and caches it for
+DASHBOARD_CACHE_TTL seconds, so several admins, the API and the NiceGUI
+page refreshing at once cost one set of queries. `/api/dashboard/stats`
+returns the structure as is and the NiceGUI dashboard renders its charts
+from it.
+
+Tunable through environment variables:
+    DASHBOARD_CACHE_TTL    seconds a computed result is reused (default 15)
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models, stats_rollup, db_async
+from .database import SessionLocal
+
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "15"))
+
+_lock = threading.Lock()
+_data: Optional[dict] = None
+_expires = 0.0
+
+
+def build(db: Session) -> dict:
+    totals = stats_rollup.totals(db)
+    total_calls = totals["calls"]
+    success_rate = (totals["successes"] / total_calls * 100) if total_calls > 0 else 0
+    api_keys_count = db.query(func.count(models.APIKey.id)).scalar()
+
+    model_rows = stats_rollup.by_model(db)
+    endpoint_rows = stats_rollup.by_endpoint(db)
+    stream_rows = stats_rollup.stream_stats_by_provider(db)
+    model_names = [r["model"] for r in model_rows]
+
+    return {
+        "summary": {
+            "total_calls": total_calls,
+            "success_calls": totals["successes"],
+            "success_rate": round(success_rate, 1),
+            "total_tokens": totals["total_tokens"],
+            "api_keys": api_keys_count,
+            "total_cost": round(totals["cost"], 4)
+        },
+        "model_distribution": [{"name": r["model"], "value": r["calls"]} for r in model_rows],
+        "daily_calls": stats_rollup.daily_calls(db, days=7),
+        "endpoint_stats": {
+            "names": [r["name"] for r in endpoint_rows],
+            "success_rates": [r["success_rate"] for r in endpoint_rows],
+            "avg_times": [r["avg_time_ms"] for r in endpoint_rows],
+            "total_calls": [r["calls"] for r in endpoint_rows]
+        },
+        "model_stats": {
+            "names": model_names,
+            "avg_times": [r["avg_time_ms"] for r in model_rows]
+        },
+        "cost_stats": {
+            "names": model_names,
+            "values": [r["cost"] for r in model_rows]
+        },
+        # TTFT / inter-token gaps / throughput of successful streams per provider
+        "stream_stats": {
+            "names": [r["name"] for r in stream_rows],
+            "streams": [r["streams"] for r in stream_rows],
+            "ttft_ms": [r["ttft_ms"] for r in stream_rows],
+            "inter_token_mean_ms": [r["inter_token_mean_ms"] for r in stream_rows],
+            "inter_token_p95_ms": [r["inter_token_p95_ms"] for r in stream_rows],
+            "tokens_per_second": [r["tokens_per_second"] for r in stream_rows]
+        },
+        # Tail latency per provider over the last day, merged from the rollup sketches
+        "latency_percentiles": stats_rollup.latency_percentiles(db, window_hours=24),
+        "generated_at": time.time(),
+    }
+
+
+def invalidate():
+    """Drops the cached result, e.g. when an admin explicitly refreshes."""
+    global _expires
+    with _lock:
+        _expires = 0.0
+
+
+def get() -> dict:
+    """Returns the dashboard data, recomputing it if the cached copy expired."""
+    global _data, _expires
+    data = _data
+    if data is not None and time.monotonic() < _expires:
+        return data
+
+    with _lock:
+        if _data is not None and time.monotonic() < _expires:
+            return _data
+        # Fresh session so the result never comes from a caller's stale transaction
+        db = SessionLocal()
+        try:
+            data = build(db)
+        finally:
+            db.close()
+        _data = data
+        _expires = time.monotonic() + DASHBOARD_CACHE_TTL
+    return data
+
+
+async def get_async() -> dict:
+    """Like get(), but a recomputation runs on the database thread pool."""
+    data = _data
+    if data is not None and time.monotonic() < _expires:
+        return data
+    return await db_async.run_sync(get)
@@ -1,16 +1,67 @@
+import logging
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# --- SQLite performance profile ---
+# WAL lets the dashboard / log pages read while the proxy path writes, and
+# synchronous=NORMAL is durable across application crashes in WAL mode (only an
+# OS crash can lose the last transactions). All values can be overridden:
+#   SQLITE_PERFORMANCE_PROFILE   "false" to leave SQLite defaults untouched
+#   SQLITE_JOURNAL_MODE          default WAL
+#   SQLITE_SYNCHRONOUS           default NORMAL
+#   SQLITE_BUSY_TIMEOUT_MS       wait for locks instead of failing (default 5000)
+#   SQLITE_CACHE_SIZE            pages, or KiB if negative (default -65536 = 64 MiB)
+#   SQLITE_MMAP_SIZE             bytes of memory-mapped I/O (default 268435456)
+#   SQLITE_TEMP_STORE            DEFAULT / FILE / MEMORY (default MEMORY)
+#   DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT   connection pool sizing
+SQLITE_PERFORMANCE_PROFILE = os.getenv("SQLITE_PERFORMANCE_PROFILE", "true").lower() in ("1", "true", "yes")
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", "268435456")),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+IS_SQLITE = bool(DATABASE_URL) and DATABASE_URL.startswith("sqlite")
+IS_SQLITE_MEMORY = IS_SQLITE and (":memory:" in DATABASE_URL or DATABASE_URL.rstrip("/") in ("sqlite:", "sqlite+pysqlite:"))
+
+engine_kwargs = {}
+if IS_SQLITE:
+    engine_kwargs["connect_args"] = {"check_same_thread": False}
+if not IS_SQLITE_MEMORY:
+    # Sync endpoints, the log writer and the NiceGUI pages all hold sessions
+    # concurrently; the SQLAlchemy default (5 + 10) makes them queue.
+    engine_kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+
+engine = create_engine(DATABASE_URL, **engine_kwargs)
+
+if IS_SQLITE and SQLITE_PERFORMANCE_PROFILE:
+    @event.listens_for(engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in SQLITE_PRAGMAS.items():
+                if name == "journal_mode" and IS_SQLITE_MEMORY:
+                    continue  # in-memory databases cannot use WAL
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -20,4 +71,25 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+_SYNCHRONOUS_NAMES = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}
+_TEMP_STORE_NAMES = {0: "DEFAULT", 1: "FILE", 2: "MEMORY"}
+
+def report_database_settings():
+    """Logs the effective SQLite pragmas and pool sizing (called at startup)."""
+    pool = engine.pool
+    pool_info = type(pool).__name__
+    if isinstance(pool, QueuePool):
+        pool_info += f" size={pool.size()} max_overflow={DB_MAX_OVERFLOW} timeout={DB_POOL_TIMEOUT}s"
+    if not IS_SQLITE:
+        logger.info(f"Database {engine.dialect.name}; pool: {pool_info}")
+        return
+    with engine.connect() as conn:
+        effective = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in SQLITE_PRAGMAS}
+    # These two are reported as numbers
+    effective["synchronous"] = _SYNCHRONOUS_NAMES.get(effective["synchronous"], effective["synchronous"])
+    effective["temp_store"] = _TEMP_STORE_NAMES.get(effective["temp_store"], effective["temp_store"])
+    profile = "on" if SQLITE_PERFORMANCE_PROFILE else "off"
+    settings = ", ".join(f"{k}={v}" for k, v in effective.items())
+    logger.info(f"SQLite performance profile {profile}: {settings}; pool: {pool_info}")
@@ -0,0 +1,55 @@
+"""Thread-pool offload for database work started from async code.
+
+The proxy handlers are `async def`, so any SQLAlchemy call made directly in
+them runs on the event loop and stalls every in-flight stream until SQLite
+answers. Database work from async code goes through this module instead: it
+runs on a dedicated pool of worker threads sized to the connection pool, so a
+slow commit only occupies a worker (and never competes with the default
+executor used by `asyncio.to_thread` for unrelated work).
+
+The in-memory caches (routing snapshot, keyword matcher, auth cache) offer
+`*_async` variants that return immediately when warm and only hop to this pool
+to rebuild.
+
+Tunable through environment variables:
+    DB_THREADPOOL_SIZE   worker threads for database calls (default DB_POOL_SIZE)
+"""
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from .database import SessionLocal, DB_POOL_SIZE
+
+DB_THREADPOOL_SIZE = int(os.getenv("DB_THREADPOOL_SIZE", str(DB_POOL_SIZE)))
+
+_executor = ThreadPoolExecutor(max_workers=max(1, DB_THREADPOOL_SIZE), thread_name_prefix="db")
+
+
+async def run_sync(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Runs a blocking function on the database thread pool."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+def _call_with_session(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+async def run_in_session(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Runs `fn(db, *args, **kwargs)` on the database thread pool with a
+    session opened and closed in the worker thread, e.g.
+    `await run_in_session(crud.update_provider, provider_id, data)`.
+    ORM objects returned are detached; return plain values where possible."""
+    return await run_sync(_call_with_session, fn, *args, **kwargs)
+
+
+def shutdown():
+    _executor.shutdown(wait=True)
@@ -0,0 +1,98 @@
+"""Per-provider sliding window of recent failures.
+
+Replaces the `COUNT(*)` over call_logs that the router used to run for every
+candidate. Failures are recorded as calls finish; the window is seeded once
+from call_logs on startup so failover state survives restarts.
+
+Failures are kept for a fixed FAILURE_WINDOW_RETENTION_MINUTES, independent of
+the failover period setting, so raising the period takes effect at once
+instead of after old failures were already dropped under the shorter one.
+
+Tunable through environment variables:
+    FAILURE_WINDOW_RETENTION_MINUTES   how long failures are remembered; longer
+                                       failover periods count only this much
+                                       (default 1440)
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict
+
+import pytz
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+TAIPEI_TZ = pytz.timezone('Asia/Taipei')
+
+# Upper bound of remembered failures per provider. Thresholds are small
+# (single digits by default), so this never limits a real check.
+MAX_EVENTS_PER_PROVIDER = 1024
+RETENTION_MINUTES = int(os.getenv("FAILURE_WINDOW_RETENTION_MINUTES", "1440"))
+
+
+class FailureWindow:
+    def __init__(self, max_events: int = MAX_EVENTS_PER_PROVIDER):
+        self._max_events = max_events
+        self._events: Dict[int, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record_failure(self, provider_id: int, timestamp: float = None):
+        if provider_id is None:
+            return
+        ts = time.time() if timestamp is None else timestamp
+        with self._lock:
+            events = self._events.get(provider_id)
+            if events is None:
+                events = self._events[provider_id] = deque(maxlen=self._max_events)
+            events.append(ts)
+            # Evict only by the fixed retention, never by a caller's period
+            retention_cutoff = time.time() - RETENTION_MINUTES * 60
+            while events and events[0] < retention_cutoff:
+                events.popleft()
+
+    def count(self, provider_id: int, minutes: int) -> int:
+        """Failures for the provider in the last N minutes. Scans from the
+        newest event back to the cutoff, so the cost is the number counted."""
+        cutoff = time.time() - minutes * 60
+        with self._lock:
+            events = self._events.get(provider_id)
+            if not events:
+                return 0
+            count = 0
+            for ts in reversed(events):
+                if ts < cutoff:
+                    break
+                count += 1
+            return count
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+    def seed_from_db(self, db: Session, minutes: int = RETENTION_MINUTES):
+        """Loads failures of the last N minutes (default: the retention) from call_logs."""
+        time_threshold = datetime.now(TAIPEI_TZ) - timedelta(minutes=minutes)
+        rows = db.query(models.CallLog.provider_id, models.CallLog.request_timestamp).filter(
+            models.CallLog.provider_id.isnot(None),
+            models.CallLog.is_success == False,
+            models.CallLog.request_timestamp >= time_threshold
+        ).order_by(models.CallLog.request_timestamp.asc()).all()
+
+        self.clear()
+        for provider_id, ts in rows:
+            if ts is None:
+                continue
+            # SQLite returns naive datetimes stored in Taipei local time
+            if ts.tzinfo is None:
+                ts = TAIPEI_TZ.localize(ts)
+            self.record_failure(provider_id, ts.timestamp())
+        logger.info(f"Failure window seeded with {len(rows)} failures from the last {minutes} minutes.")
+
+
+failure_window = FailureWindow()
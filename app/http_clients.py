@@ -0,0 +1,89 @@
+"""Shared, pooled httpx clients for upstream providers.
+
+Creating an `httpx.AsyncClient` per attempt means a fresh TCP + TLS handshake
+for every proxied request. Instead we keep one long-lived client per upstream
+origin (scheme://host:port) so connections are reused across requests.
+Clients are closed from the application's shutdown hook via `close_all()`.
+
+A client is shared by every request to its origin, whichever user or key it is
+made for, so its cookie jar never stores cookies: a Set-Cookie from one
+upstream response must not be sent along with another user's request.
+
+Tunable through environment variables:
+    UPSTREAM_MAX_CONNECTIONS            total connections per origin (default 100)
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS  idle connections kept per origin (default 20)
+    UPSTREAM_KEEPALIVE_EXPIRY           seconds an idle connection is kept (default 60)
+    UPSTREAM_HTTP2                      "true" to negotiate HTTP/2 (needs `pip install httpx[http2]`)
+"""
+import http.cookiejar
+import logging
+import os
+from typing import Dict
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "60"))
+HTTP2_ENABLED = os.getenv("UPSTREAM_HTTP2", "false").lower() in ("1", "true", "yes")
+
+# Default timeout; handlers pass their own per request (e.g. 300s for chat).
+DEFAULT_TIMEOUT = 300
+
+if HTTP2_ENABLED:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("UPSTREAM_HTTP2 is enabled but the 'h2' package is not installed; falling back to HTTP/1.1.")
+        HTTP2_ENABLED = False
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+def _no_cookies() -> http.cookiejar.CookieJar:
+    """A cookie jar that refuses every cookie (no domain is allowed). Passed to
+    the client as the jar itself: an httpx.Cookies would be copied into a new
+    jar with the default policy."""
+    return http.cookiejar.CookieJar(policy=http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+
+
+def get_client(url: str) -> httpx.AsyncClient:
+    """Returns the shared client for the origin of `url`, creating it on first use."""
+    origin = _origin(url)
+    client = _clients.get(origin)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            http2=HTTP2_ENABLED,
+            cookies=_no_cookies(),
+        )
+        _clients[origin] = client
+        logger.info(f"Created pooled upstream client for {origin} (http2={HTTP2_ENABLED}).")
+    return client
+
+
+async def close_all():
+    """Closes every pooled client. Called on application shutdown."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing upstream client: {e}")
+    if clients:
+        logger.info(f"Closed {len(clients)} pooled upstream clients.")
@@ -0,0 +1,146 @@
+"""Failure keyword matching with an Aho-Corasick automaton.
+
+The streaming proxy used to append every chunk to the accumulated response and
+search it for every keyword (`keyword in full_text`), which is O(n * k) per
+chunk and quadratic over a long response. The automaton is built once per
+keyword-set version and scans each character exactly once; a `KeywordScanner`
+carries the automaton state between chunks, so a keyword split across two
+chunks is still found.
+
+The keyword set is loaded from `ErrorMaintenance` and rebuilt lazily after the
+keyword CRUD functions call `invalidate()`.
+"""
+import logging
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from . import models, db_async
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton compiled to a DFA over the keywords' alphabet.
+    Keywords are matched case-insensitively: they are lowercased here and the
+    text passed in must already be lowercased."""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = sorted({k.lower() for k in keywords if k})
+        goto: List[Dict[str, int]] = [{}]
+        output: List[Optional[str]] = [None]
+        for keyword in self.keywords:
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    goto.append({})
+                    output.append(None)
+                    nxt = goto[state][ch] = len(goto) - 1
+                state = nxt
+            output[state] = keyword
+
+        # Breadth-first pass computing failure links, then fold them into full
+        # transitions so scanning is a single dict lookup per character.
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            if output[state] is None:
+                output[state] = output[fail[state]]
+            transitions = dict(delta[fail[state]])
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0) if state else 0
+                transitions[ch] = nxt
+                queue.append(nxt)
+            delta[state] = transitions
+
+        self._delta = delta
+        self._output = output
+
+    def __bool__(self):
+        return bool(self.keywords)
+
+    def feed(self, text: str, state: int = 0):
+        """Scans `text` from automaton `state`. Returns (new_state, keyword),
+        where keyword is the first match found or None."""
+        delta = self._delta
+        output = self._output
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if output[state] is not None:
+                return state, output[state]
+        return state, None
+
+    def search(self, text: str) -> Optional[str]:
+        """Returns the first keyword found in an already lowercased text."""
+        if not self.keywords:
+            return None
+        return self.feed(text)[1]
+
+    def scanner(self) -> "KeywordScanner":
+        return KeywordScanner(self)
+
+
+class KeywordScanner:
+    """Per-stream matcher state, fed chunk by chunk."""
+    __slots__ = ("_matcher", "_state")
+
+    def __init__(self, matcher: KeywordMatcher):
+        self._matcher = matcher
+        self._state = 0
+
+    def feed(self, text: str) -> Optional[str]:
+        if not self._matcher.keywords:
+            return None
+        self._state, keyword = self._matcher.feed(text, self._state)
+        return keyword
+
+
+_lock = threading.Lock()
+_matcher: Optional[KeywordMatcher] = None
+_version = 0
+_built_version = -1
+
+
+def invalidate():
+    """Marks the keyword set as changed. Call after committing keyword changes."""
+    global _version
+    with _lock:
+        _version += 1
+
+
+def get_matcher() -> KeywordMatcher:
+    """Returns the matcher for the active keyword set, rebuilding it if stale."""
+    global _matcher, _built_version
+    matcher = _matcher
+    if matcher is not None and _built_version == _version:
+        return matcher
+
+    with _lock:
+        if _matcher is not None and _built_version == _version:
+            return _matcher
+        target_version = _version
+
+    db = SessionLocal()
+    try:
+        keywords = [k for (k,) in db.query(models.ErrorMaintenance.keyword).filter(models.ErrorMaintenance.is_active == True).all()]
+    finally:
+        db.close()
+    matcher = KeywordMatcher(keywords)
+
+    with _lock:
+        _matcher = matcher
+        _built_version = target_version
+    logger.info(f"Failure keyword matcher rebuilt with {len(matcher.keywords)} keywords.")
+    return matcher
+
+
+async def get_matcher_async() -> KeywordMatcher:
+    """Like get_matcher(), but a rebuild runs on the database thread pool."""
+    matcher = _matcher
+    if matcher is not None and _built_version == _version:
+        return matcher
+    return await db_async.run_sync(get_matcher)
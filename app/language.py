@@ -26,6 +26,12 @@ i18n = {
     "failed": {"en": "Failed", "zh-TW": "失敗", "zh-CN": "失败", "ko": "실패", "ja": "失敗"},
     "avg_response_time_ms": {"en": "Avg. Response Time (ms)", "zh-TW": "平均回應時間 (毫秒)", "zh-CN": "平均响应时间 (毫秒)", "ko": "평균 응답 시간 (ms)", "ja": "平均応答時間 (ms)"},
     "no_successful_calls_with_response_time": {"en": "No successful calls with response time data.", "zh-TW": "沒有帶有回應時間資料的成功呼叫。", "zh-CN": "没有带有响应时间数据的成功呼叫。", "ko": "응답 시간 데이터가 있는 성공적인 호출이 없습니다.", "ja": "応答時間データのある成功した呼び出しはありません。"},
+    "streaming_performance_by_provider": {"en": "Streaming Performance by Provider", "zh-TW": "各供應商串流效能", "zh-CN": "各供应商流式性能", "ko": "공급자별 스트리밍 성능", "ja": "プロバイダー別ストリーミング性能"},
+    "avg_ttft_ms": {"en": "Avg. Time to First Token (ms)", "zh-TW": "平均首字延遲 (毫秒)", "zh-CN": "平均首字延迟 (毫秒)", "ko": "평균 첫 토큰 시간 (ms)", "ja": "平均初回トークン時間 (ms)"},
+    "inter_token_p95_ms": {"en": "P95 Inter-token Gap (ms)", "zh-TW": "P95 字間間隔 (毫秒)", "zh-CN": "P95 字间间隔 (毫秒)", "ko": "P95 토큰 간격 (ms)", "ja": "P95 トークン間隔 (ms)"},
+    "tokens_per_second": {"en": "Tokens / s", "zh-TW": "每秒 Token 數", "zh-CN": "每秒 Token 数", "ko": "초당 토큰", "ja": "トークン/秒"},
+    "no_streaming_data": {"en": "No successful streaming calls yet.", "zh-TW": "尚無成功的串流呼叫。", "zh-CN": "尚无成功的流式呼叫。", "ko": "성공한 스트리밍 호출이 아직 없습니다.", "ja": "成功したストリーミング呼び出しはまだありません。"},
+    "latency_percentiles_by_provider": {"en": "Response Time Percentiles by Provider (24h, ms)", "zh-TW": "各供應商回應時間分位數 (24 小時，毫秒)", "zh-CN": "各供应商响应时间分位数 (24 小时，毫秒)", "ko": "공급자별 응답 시간 백분위수 (24시간, ms)", "ja": "プロバイダー別応答時間パーセンタイル (24時間, ms)"},
     "api_endpoint_success_rate": {"en": "API Endpoint Success Rate", "zh-TW": "API 端點成功率", "zh-CN": "API 端点成功率", "ko": "API 엔드포인트 성공률", "ja": "APIエンドポイント成功率"},
     "no_data_for_endpoint_success_rate": {"en": "No data for endpoint success rate.", "zh-TW": "沒有端點成功率資料。", "zh-CN": "没有端点成功率数据。", "ko": "엔드포인트 성공률에 대한 데이터가 없습니다.", "ja": "エンドポイント成功率のデータがありません。"},
     "avg_response_time_by_endpoint_ms": {"en": "Avg. Response Time by Endpoint (ms)", "zh-TW": "各端點平均回應時間 (毫秒)", "zh-CN": "各端点平均响应时间 (毫秒)", "ko": "엔드포인트별 평균 응답 시간 (ms)", "ja": "エンドポイント別の平均応答時間 (ms)"},
@@ -139,6 +145,9 @@ i18n = {
     "failover_description": {"en": "Configure the conditions under which the system will automatically failover to a backup provider.", "zh-TW": "設定系統自動故障轉移到備用供應商的條件。", "zh-CN": "设置系统自动故障转移到备用供应商的条件。", "ko": "시스템이 백업 공급자로 자동 장애 조치되는 조건을 구성합니다。", "ja": "システムがバックアッププロバイダーに自動的にフェイルオーバーする条件を設定します。"},
     "failure_count_threshold": {"en": "Failure Count Threshold", "zh-TW": "失敗次數閾值", "zh-CN": "失败次数阈值", "ko": "실패 횟수 임계값", "ja": "失敗回数のしきい値"},
     "failure_period_minutes": {"en": "Failure Period (minutes)", "zh-TW": "失敗期間 (分鐘)", "zh-CN": "失败期间 (分钟)", "ko": "실패 기간 (분)", "ja": "失敗期間 (分)"},
+    "model_alias_settings": {"en": "Model Alias Rules", "zh-TW": "模型別名規則", "zh-CN": "模型别名规则", "ko": "모델 별칭 규칙", "ja": "モデルエイリアスルール"},
+    "model_alias_description": {"en": "JSON object mapping a requested model prefix to a group name prefix, e.g. {\"claude-\": \"anthropic/\"}.", "zh-TW": "JSON 物件，將請求的模型前綴對應到群組名稱前綴，例如 {\"claude-\": \"anthropic/\"}。", "zh-CN": "JSON 对象，将请求的模型前缀映射到群组名称前缀，例如 {\"claude-\": \"anthropic/\"}。", "ko": "요청된 모델 접두사를 그룹 이름 접두사에 매핑하는 JSON 객체입니다. 예: {\"claude-\": \"anthropic/\"}.", "ja": "リクエストされたモデルの接頭辞をグループ名の接頭辞に対応付ける JSON オブジェクトです。例: {\"claude-\": \"anthropic/\"}。"},
+    "invalid_alias_rules": {"en": "Alias rules must be a JSON object of string prefixes.", "zh-TW": "別名規則必須是由字串前綴組成的 JSON 物件。", "zh-CN": "别名规则必须是由字符串前缀组成的 JSON 对象。", "ko": "별칭 규칙은 문자열 접두사로 이루어진 JSON 객체여야 합니다.", "ja": "エイリアスルールは文字列の接頭辞からなる JSON オブジェクトである必要があります。"},
     "settings_saved": {"en": "Settings saved successfully.", "zh-TW": "設定已成功儲存。", "zh-CN": "设置已成功保存。", "ko": "설정이 성공적으로 저장되었습니다.", "ja": "設定が正常に保存されました。"},
     "request_body": {"en": "Request Body", "zh-TW": "請求內文", "zh-CN": "请求正文", "ko": "요청 본문", "ja": "リクエスト本文"},
     "response_body": {"en": "Response Body", "zh-TW": "回應內文", "zh-CN": "响应正文", "ko": "응답 본문", "ja": "応答本文"},
@@ -157,6 +166,13 @@ i18n = {
     "filter_by_endpoint": {"en": "Filter by Endpoint", "zh-TW": "按端點篩選", "zh-CN": "按端点筛选", "ko": "엔드포인트로 필터링", "ja": "엔드포인트로 필터링"},
     "search_models": {"en": "Search Alias or Model Name", "zh-TW": "搜尋別名或模型名稱", "zh-CN": "搜索别名或模型名称", "ko": "별칭 또는 모델 이름 검색", "ja": "エイリアスまたは模型名で検索"},
     "manage_providers": {"en": "Manage Providers", "zh-TW": "管理供應商項目", "zh-CN": "管理供应商项目", "ko": "공급자 관리", "ja": "プロバイダーの管理"},
+    "routing_strategy": {"en": "Routing Strategy", "zh-TW": "路由策略", "zh-CN": "路由策略", "ko": "라우팅 전략", "ja": "ルーティング戦略"},
+    "strategy_priority": {"en": "Strict Priority", "zh-TW": "嚴格優先級", "zh-CN": "严格优先级", "ko": "엄격한 우선순위", "ja": "厳密な優先度"},
+    "strategy_least_outstanding": {"en": "Least Outstanding Requests", "zh-TW": "最少進行中請求", "zh-CN": "最少进行中请求", "ko": "최소 진행 중 요청", "ja": "処理中リクエスト最少"},
+    "strategy_p2c": {"en": "Power of Two Choices", "zh-TW": "二選一隨機負載", "zh-CN": "二选一随机负载", "ko": "두 개 중 선택 (P2C)", "ja": "2択ランダム (P2C)"},
+    "strategy_ewma_latency": {"en": "Latency Weighted (EWMA)", "zh-TW": "延遲加權 (EWMA)", "zh-CN": "延迟加权 (EWMA)", "ko": "지연 시간 가중 (EWMA)", "ja": "レイテンシ加重 (EWMA)"},
+    "strategy_ewma_ttft": {"en": "Time to First Token (EWMA)", "zh-TW": "首字延遲加權 (EWMA)", "zh-CN": "首字延迟加权 (EWMA)", "ko": "첫 토큰 지연 가중 (EWMA)", "ja": "初回トークン遅延加重 (EWMA)"},
+    "routing_strategy_updated": {"en": "Routing strategy for '{name}' updated.", "zh-TW": "群組 '{name}' 的路由策略已更新。", "zh-CN": "群组 '{name}' 的路由策略已更新。", "ko": "'{name}'의 라우팅 전략이 업데이트되었습니다.", "ja": "'{name}' のルーティング戦略を更新しました。"},
     "selected": {"en": "Selected", "zh-TW": "已選取", "zh-CN": "已選取", "ko": "선택됨", "ja": "選択済み"},
     "search_providers": {"en": "Search providers...", "zh-TW": "搜尋供應商...", "zh-CN": "搜索供应商...", "ko": "공급자 검색...", "ja": "プロバイダーを検索..."},
     "save_success": {"en": "Saved successfully", "zh-TW": "儲存成功", "zh-CN": "保存成功", "ko": "저장 성공", "ja": "保存成功"},
@@ -182,6 +198,23 @@ i18n = {
     "all_requests": {"en": "All", "zh-TW": "所有請求", "zh-CN": "所有请求", "ko": "모든 요청", "ja": "すべてのリクエスト"},
     "successful_requests": {"en": "Successful", "zh-TW": "成功請求", "zh-CN": "成功请求", "ko": "성공한 요청", "ja": "成功したリクエスト"},
     "failed_requests": {"en": "Failed", "zh-TW": "失敗請求", "zh-CN": "失败请求", "ko": "실패한 요청", "ja": "失敗したリクエスト"},
+    "filter_provider": {"en": "Provider", "zh-TW": "供應商", "zh-CN": "供应商", "ko": "공급자", "ja": "プロバイダー"},
+    "filter_api_key": {"en": "API Key", "zh-TW": "API 金鑰", "zh-CN": "API 密钥", "ko": "API 키", "ja": "APIキー"},
+    "filter_status_code": {"en": "Status Code", "zh-TW": "狀態碼", "zh-CN": "状态码", "ko": "상태 코드", "ja": "ステータスコード"},
+    "filter_min_latency_ms": {"en": "Min. Response Time (ms)", "zh-TW": "最短回應時間 (毫秒)", "zh-CN": "最短响应时间 (毫秒)", "ko": "최소 응답 시간 (ms)", "ja": "最小応答時間 (ms)"},
+    "filter_start_time": {"en": "From (YYYY-MM-DD HH:MM)", "zh-TW": "開始 (YYYY-MM-DD HH:MM)", "zh-CN": "开始 (YYYY-MM-DD HH:MM)", "ko": "시작 (YYYY-MM-DD HH:MM)", "ja": "開始 (YYYY-MM-DD HH:MM)"},
+    "filter_end_time": {"en": "To (YYYY-MM-DD HH:MM)", "zh-TW": "結束 (YYYY-MM-DD HH:MM)", "zh-CN": "结束 (YYYY-MM-DD HH:MM)", "ko": "종료 (YYYY-MM-DD HH:MM)", "ja": "終了 (YYYY-MM-DD HH:MM)"},
+    "apply_filters": {"en": "Apply", "zh-TW": "套用", "zh-CN": "应用", "ko": "적용", "ja": "適用"},
+    "clear_filters": {"en": "Clear", "zh-TW": "清除", "zh-CN": "清除", "ko": "지우기", "ja": "クリア"},
+    "invalid_time_filter": {"en": "Invalid time, use YYYY-MM-DD HH:MM", "zh-TW": "時間格式錯誤，請使用 YYYY-MM-DD HH:MM", "zh-CN": "时间格式错误，请使用 YYYY-MM-DD HH:MM", "ko": "잘못된 시간입니다. YYYY-MM-DD HH:MM 형식을 사용하세요", "ja": "時刻が無効です。YYYY-MM-DD HH:MM を使用してください"},
+    "newer_logs": {"en": "Newer", "zh-TW": "較新", "zh-CN": "较新", "ko": "최신", "ja": "新しい"},
+    "older_logs": {"en": "Older", "zh-TW": "較舊", "zh-CN": "较旧", "ko": "이전", "ja": "古い"},
+    "logs_total": {"en": "Total", "zh-TW": "總數", "zh-CN": "总数", "ko": "전체", "ja": "合計"},
+    "search_logs": {"en": "Search request / response bodies and errors...", "zh-TW": "搜尋請求 / 回應內容與錯誤訊息...", "zh-CN": "搜索请求 / 响应内容与错误信息...", "ko": "요청 / 응답 본문과 오류 검색...", "ja": "リクエスト / レスポンス本文とエラーを検索..."},
+    "search": {"en": "Search", "zh-TW": "搜尋", "zh-CN": "搜索", "ko": "검색", "ja": "検索"},
+    "no_search_results": {"en": "No matching calls.", "zh-TW": "沒有符合的呼叫。", "zh-CN": "没有符合的调用。", "ko": "일치하는 호출이 없습니다.", "ja": "一致する呼び出しはありません。"},
+    "search_logs_hint": {"en": "Terms of 3+ characters search all logs; shorter terms (e.g. two-character CJK words) alone only search the latest logs.", "zh-TW": "3 個字元以上的詞會搜尋全部日誌；僅含較短的詞 (如兩字中文詞) 時只搜尋最近的日誌。", "zh-CN": "3 个字符以上的词会搜索全部日志；仅含较短的词 (如两字中文词) 时只搜索最近的日志。", "ko": "3자 이상의 검색어는 전체 로그를 검색합니다. 더 짧은 검색어만 있으면 최근 로그만 검색합니다.", "ja": "3文字以上の語は全ログを検索します。短い語 (2文字の漢字語など) だけの場合は最近のログのみ検索します。"},
+    "search_unavailable": {"en": "Full-text search is unavailable right now.", "zh-TW": "全文檢索目前無法使用。", "zh-CN": "全文检索目前无法使用。", "ko": "지금은 전문 검색을 사용할 수 없습니다.", "ja": "全文検索は現在利用できません。"},
     "call_details": {"en": "Call Details", "zh-TW": "呼叫詳情", "zh-CN": "呼叫详情", "ko": "호출 상세", "ja": "呼び出し詳細"},
     "request_text": {"en": "Request Text", "zh-TW": "請求文字", "zh-CN": "请求文字", "ko": "요청 텍스트", "ja": "リクエストテキスト"},
     "response_text": {"en": "Response Text", "zh-TW": "回應文字", "zh-CN": "响应文字", "ko": "응답 텍스트", "ja": "レスポンステキスト"},
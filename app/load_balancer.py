@@ -0,0 +1,110 @@
+"""Per-group routing strategies.
+
+A group's candidates come out of the routing snapshot sorted by priority then
+price. The group's `routing_strategy` decides how that list is reordered before
+the router walks it (the failure-window check and failover are unchanged):
+
+    priority            strict priority order (the original behaviour)
+    least_outstanding   fewest in-flight calls first, priority breaks ties
+    p2c                 power of two choices: pick two candidates at random and
+                        try the less loaded one first, then priority order
+    ewma_latency        lowest EWMA latency x (in-flight + 1) first; providers
+                        without samples yet are tried first so they get measured
+    ewma_ttft           like ewma_latency, but on the time to first token of
+                        streamed responses (see stream_stats); this is what
+                        users of chat streams notice, independent of answer length
+
+In-flight counts come from the in-memory concurrency counters and latency from
+the response times (and stream TTFTs) the proxy handlers log. A failed attempt
+counts as a sample of at least ROUTING_FAILURE_PENALTY_MS for both EWMAs, so a
+provider that only ever fails is not left unmeasured (and tried first) but
+sinks behind the ones that answer.
+
+Tunable through environment variables:
+    ROUTING_EWMA_ALPHA          weight of the newest latency sample (default 0.3)
+    ROUTING_FAILURE_PENALTY_MS  latency sample recorded for a failed attempt
+                                (default 30000, or the attempt's time if longer)
+"""
+import os
+import random
+import threading
+from typing import Dict, List, Optional
+
+from .concurrency import concurrency
+
+ROUTING_EWMA_ALPHA = float(os.getenv("ROUTING_EWMA_ALPHA", "0.3"))
+ROUTING_FAILURE_PENALTY_MS = float(os.getenv("ROUTING_FAILURE_PENALTY_MS", "30000"))
+
+STRATEGY_PRIORITY = "priority"
+STRATEGY_LEAST_OUTSTANDING = "least_outstanding"
+STRATEGY_P2C = "p2c"
+STRATEGY_EWMA_LATENCY = "ewma_latency"
+STRATEGY_EWMA_TTFT = "ewma_ttft"
+
+ROUTING_STRATEGIES = (STRATEGY_PRIORITY, STRATEGY_LEAST_OUTSTANDING, STRATEGY_P2C, STRATEGY_EWMA_LATENCY, STRATEGY_EWMA_TTFT)
+DEFAULT_STRATEGY = STRATEGY_PRIORITY
+
+
+class LatencyTracker:
+    """Exponentially weighted moving average of response time per provider."""
+
+    def __init__(self, alpha: float = ROUTING_EWMA_ALPHA):
+        self.alpha = alpha
+        self._ewma: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, provider_id: int, latency_ms: float):
+        if provider_id is None or latency_ms is None or latency_ms <= 0:
+            return
+        with self._lock:
+            previous = self._ewma.get(provider_id)
+            if previous is None:
+                self._ewma[provider_id] = float(latency_ms)
+            else:
+                self._ewma[provider_id] = previous + self.alpha * (latency_ms - previous)
+
+    def observe_failure(self, provider_id: int, latency_ms: Optional[float] = None):
+        """Records a failed attempt as a penalty sample."""
+        self.observe(provider_id, max(latency_ms or 0, ROUTING_FAILURE_PENALTY_MS))
+
+    def get(self, provider_id: int) -> Optional[float]:
+        return self._ewma.get(provider_id)
+
+    def snapshot(self) -> Dict[int, float]:
+        with self._lock:
+            return dict(self._ewma)
+
+
+latency_tracker = LatencyTracker()
+ttft_tracker = LatencyTracker()
+
+
+def order_candidates(strategy: Optional[str], candidates: List[tuple]) -> List[tuple]:
+    """Reorders (provider, priority, group_id) tuples according to `strategy`.
+    `candidates` must already be in priority order; sorts below are stable so
+    that order is the tie-breaker."""
+    if len(candidates) < 2 or not strategy or strategy == STRATEGY_PRIORITY:
+        return candidates
+
+    if strategy == STRATEGY_LEAST_OUTSTANDING:
+        return sorted(candidates, key=lambda c: concurrency.total_for_provider(c[0].id))
+
+    if strategy == STRATEGY_P2C:
+        first, second = random.sample(range(len(candidates)), 2)
+        a, b = candidates[first], candidates[second]
+        load_a = concurrency.total_for_provider(a[0].id)
+        load_b = concurrency.total_for_provider(b[0].id)
+        # On equal load keep the higher-priority one (lower index)
+        chosen = first if (load_a, first) <= (load_b, second) else second
+        return [candidates[chosen]] + [c for i, c in enumerate(candidates) if i != chosen]
+
+    if strategy in (STRATEGY_EWMA_LATENCY, STRATEGY_EWMA_TTFT):
+        tracker = ttft_tracker if strategy == STRATEGY_EWMA_TTFT else latency_tracker
+        def score(c):
+            ewma = tracker.get(c[0].id)
+            if ewma is None:
+                return 0.0
+            return ewma * (concurrency.total_for_provider(c[0].id) + 1)
+        return sorted(candidates, key=score)
+
+    return candidates
@@ -0,0 +1,55 @@
+"""Cheap totals for the call log list.
+
+An exact `count(*)` over call_logs is a full scan and runs on every page of
+the logs API / UI. Instead:
+
+    no filters      max(id) - min(id) + 1, two index lookups; off only by the
+                    number of deleted logs, so it is reported as an estimate
+    with filters    count(*) over at most LOG_COUNT_CAP matching rows; when the
+                    cap is hit the total is reported as "cap+" (an estimate)
+
+Filtered counts are cached per filter combination for LOG_COUNT_CACHE_TTL
+seconds, so paging through a filtered list counts once.
+
+Tunable through environment variables:
+    LOG_COUNT_CAP          most rows a filtered count visits (default 10000)
+    LOG_COUNT_CACHE_TTL    seconds a filtered count is reused (default 30)
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import crud, schemas
+
+LOG_COUNT_CAP = int(os.getenv("LOG_COUNT_CAP", "10000"))
+LOG_COUNT_CACHE_TTL = float(os.getenv("LOG_COUNT_CACHE_TTL", "30"))
+_MAX_CACHED = 256
+
+_lock = threading.Lock()
+_cache: Dict[tuple, Tuple[float, int, bool]] = {}
+
+
+def count(db: Session, filters: Optional[schemas.CallLogFilters] = None) -> Tuple[int, bool]:
+    """Returns (total, is_estimate) for the logs matching `filters`."""
+    values = filters.model_dump(exclude_none=True) if filters is not None else {}
+    if not values:
+        return crud.estimate_call_log_count(db), True
+
+    key = tuple(sorted(values.items()))
+    now = time.monotonic()
+    cached = _cache.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1], cached[2]
+
+    total = crud.count_call_logs(db, filters=filters, cap=LOG_COUNT_CAP)
+    is_estimate = total > LOG_COUNT_CAP
+    if is_estimate:
+        total = LOG_COUNT_CAP
+    with _lock:
+        if len(_cache) >= _MAX_CACHED:
+            _cache.clear()
+        _cache[key] = (now + LOG_COUNT_CACHE_TTL, total, is_estimate)
+    return total, is_estimate
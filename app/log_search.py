@@ -0,0 +1,236 @@
+"""Full-text search over call log bodies and error messages (SQLite FTS5).
+
+`call_logs_fts` is an FTS5 index over the request body, response body and
+error message of every call log. It is an external-content table: the text
+is read from the `call_logs_search_content` view (call_logs joined with
+call_log_details) when snippets are built, so the bodies are not stored a
+second time, only the index.
+
+The index is maintained with the logs: every batch written by the log writer
+adds its rows in the same transaction (`index_logs`). Deletions go through
+triggers, so every DELETE on call_logs or call_log_details (the ORM, bulk
+deletes, cleanup_db.py) removes the row from the index by replaying its
+indexed values as an FTS5 'delete'. An index that is created on an existing
+database is filled once from the view. If the index still ends up out of
+step with the logs (SQLite then reports it as malformed), `search` rebuilds
+it once and retries.
+
+The trigram tokenizer is used so any fragment of three or more characters
+matches, also inside CJK text, which has no word boundaries for the default
+tokenizer. `search` ranks hits with bm25 (error messages weigh double) and
+returns a highlighted snippet from the best matching column.
+
+Terms shorter than three characters (e.g. most two-character CJK words) have
+no trigrams, so the index cannot find them. They are matched with LIKE
+instead: as an extra condition on the index hits when the query also has a
+longer term, otherwise over the newest LOG_SEARCH_SHORT_TERM_SCAN logs only
+(newest first, no ranking), as scanning all bodies is not workable.
+
+Tunable through environment variables:
+    LOG_SEARCH_ENABLED          set to 0 to not build or maintain the index;
+                                the index is then dropped and rebuilt when
+                                re-enabled (default 1, needs SQLite >= 3.34
+                                with FTS5)
+    LOG_SEARCH_SHORT_TERM_SCAN  newest logs scanned for a query made only of
+                                short terms (default 5000)
+"""
+import json
+import logging
+import os
+from typing import Iterable, List, Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+LOG_SEARCH_ENABLED = os.getenv("LOG_SEARCH_ENABLED", "1") != "0"
+LOG_SEARCH_SHORT_TERM_SCAN = int(os.getenv("LOG_SEARCH_SHORT_TERM_SCAN", "5000"))
+MIN_TERM_LENGTH = 3
+SNIPPET_CONTEXT = 40
+
+SNIPPET_START = "**"
+SNIPPET_END = "**"
+
+_COLUMNS = "request_body, response_body, error_message"
+
+_CREATE_VIEW = text(
+    "CREATE VIEW IF NOT EXISTS call_logs_search_content AS "
+    "SELECT l.id AS id, COALESCE(d.request_body, l.request_body) AS request_body, "
+    "COALESCE(d.response_body, l.response_body) AS response_body, l.error_message AS error_message "
+    "FROM call_logs l LEFT JOIN call_log_details d ON d.id = l.id"
+)
+_CREATE_INDEX = text(
+    f"CREATE VIRTUAL TABLE call_logs_fts USING fts5({_COLUMNS}, "
+    "content='call_logs_search_content', content_rowid='id', tokenize='trigram')"
+)
+_INDEX_ROWS = text(
+    f"INSERT INTO call_logs_fts(rowid, {_COLUMNS}) "
+    f"SELECT id, {_COLUMNS} FROM call_logs_search_content WHERE id IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+# External-content rows are removed by replaying their indexed values as a 'delete'.
+# A log's indexed values come from both tables: before a details row goes the
+# log is unindexed, and re-indexed afterwards with what is left (if it still exists).
+_UNINDEX_ROW = (f"INSERT INTO call_logs_fts(call_logs_fts, rowid, {_COLUMNS}) "
+                f"SELECT 'delete', id, {_COLUMNS} FROM call_logs_search_content WHERE id = OLD.id;")
+_TRIGGERS = {
+    "call_logs_fts_log_delete": f"BEFORE DELETE ON call_logs BEGIN {_UNINDEX_ROW} END",
+    "call_logs_fts_detail_delete": f"BEFORE DELETE ON call_log_details BEGIN {_UNINDEX_ROW} END",
+    "call_logs_fts_detail_deleted": (
+        f"AFTER DELETE ON call_log_details BEGIN INSERT INTO call_logs_fts(rowid, {_COLUMNS}) "
+        f"SELECT id, {_COLUMNS} FROM call_logs_search_content WHERE id = OLD.id; END"
+    ),
+}
+_REBUILD = text("INSERT INTO call_logs_fts(call_logs_fts) VALUES ('rebuild')")
+_SEARCH = (
+    "SELECT call_logs_fts.rowid AS id, bm25(call_logs_fts, 1.0, 1.0, 2.0) AS rank, "
+    "snippet(call_logs_fts, -1, :start, :end, '…', 64) AS snippet FROM call_logs_fts{join} "
+    "WHERE call_logs_fts MATCH :query{where} ORDER BY rank LIMIT :limit OFFSET :offset"
+)
+_SEARCH_RECENT = (
+    f"SELECT c.id AS id, {_COLUMNS} FROM (SELECT id FROM call_logs ORDER BY id DESC LIMIT :scan) recent "
+    "JOIN call_logs_search_content c ON c.id = recent.id WHERE {where} ORDER BY c.id DESC LIMIT :limit OFFSET :offset"
+)
+
+_enabled = False
+
+
+class SearchUnavailable(Exception):
+    """The index could not be queried, even after a rebuild."""
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def ensure_index(conn):
+    """Creates the view and the index (filling it from existing logs) or, when
+    disabled, drops the index. Called by the migrations at startup."""
+    global _enabled
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'call_logs_fts'"
+    )).first() is not None
+
+    if not LOG_SEARCH_ENABLED:
+        # The triggers write to the index, so they go with it
+        for name in _TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        if exists:
+            logger.info("LOG_SEARCH_ENABLED=0: dropping the full-text index call_logs_fts.")
+            conn.execute(text("DROP TABLE call_logs_fts"))
+        _enabled = False
+        return
+
+    conn.execute(_CREATE_VIEW)
+    if not exists:
+        conn.execute(_CREATE_INDEX)
+        if conn.execute(text("SELECT 1 FROM call_logs LIMIT 1")).first() is not None:
+            logger.info("Building the full-text index call_logs_fts from existing call logs...")
+            conn.execute(_REBUILD)
+    for name, body in _TRIGGERS.items():
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {body}"))
+    _enabled = True
+
+
+def index_logs(db: Session, log_ids: Iterable[int]):
+    """Adds freshly flushed call logs to the index, in the caller's transaction."""
+    ids = [i for i in log_ids if i is not None]
+    if _enabled and ids:
+        db.execute(_INDEX_ROWS, {"ids": ids})
+
+
+def _variants(term: str) -> List[str]:
+    """Request bodies are logged as ASCII JSON, so a term with non-ASCII
+    characters or quotes is also looked for in its JSON escaped form."""
+    escaped = json.dumps(term)[1:-1]
+    return [term] if escaped == term else [term, escaped]
+
+
+def _phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def match_query(query: str) -> Optional[str]:
+    """Turns the terms of `query` long enough for the trigram index into an
+    FTS5 query: every term is a quoted phrase (or its JSON escaped form) and
+    all must match. Returns None when there is no such term."""
+    parts = []
+    for term in query.split():
+        if len(term) < MIN_TERM_LENGTH:
+            continue
+        variants = [_phrase(v) for v in _variants(term)]
+        parts.append(variants[0] if len(variants) == 1 else f"({' OR '.join(variants)})")
+    return " ".join(parts) if parts else None
+
+
+def _like_condition(terms: List[str], params: dict) -> str:
+    """SQL requiring every term in one of the view's columns (alias c)."""
+    conditions = []
+    for i, term in enumerate(terms):
+        alternatives = []
+        for j, variant in enumerate(_variants(term)):
+            name = f"like_{i}_{j}"
+            params[name] = "%" + variant.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            alternatives += [f"c.{column} LIKE :{name} ESCAPE '\\'" for column in _COLUMNS.split(", ")]
+        conditions.append("(" + " OR ".join(alternatives) + ")")
+    return " AND ".join(conditions)
+
+
+def _snippet(row, terms: List[str], start: str, end: str) -> Optional[str]:
+    """Text around the first occurrence of a term, for hits found with LIKE."""
+    for column in _COLUMNS.split(", "):
+        value = row[column]
+        if not value:
+            continue
+        lowered = value.lower()
+        for term in terms:
+            for variant in _variants(term):
+                pos = lowered.find(variant.lower())
+                if pos < 0:
+                    continue
+                stop = pos + len(variant)
+                left, right = max(0, pos - SNIPPET_CONTEXT), stop + SNIPPET_CONTEXT
+                return ("…" if left else "") + value[left:pos] + start + value[pos:stop] + end \
+                    + value[stop:right] + ("…" if right < len(value) else "")
+    return None
+
+
+def _search(db: Session, query: str, limit: int, offset: int, start: str, end: str) -> List[dict]:
+    short_terms = [t for t in query.split() if len(t) < MIN_TERM_LENGTH]
+    fts_query = match_query(query)
+    params = {"limit": limit, "offset": offset}
+    like = _like_condition(short_terms, params) if short_terms else None
+
+    if fts_query is not None:
+        params.update(query=fts_query, start=start, end=end)
+        sql = _SEARCH.format(join=" JOIN call_logs_search_content c ON c.id = call_logs_fts.rowid" if like else "",
+                             where=f" AND {like}" if like else "")
+        return [dict(r) for r in db.execute(text(sql), params).mappings().all()]
+
+    if like is None:
+        return []
+    params["scan"] = LOG_SEARCH_SHORT_TERM_SCAN
+    rows = db.execute(text(_SEARCH_RECENT.format(where=like)), params).mappings().all()
+    return [{"id": r["id"], "rank": 0.0, "snippet": _snippet(r, short_terms, start, end)} for r in rows]
+
+
+def search(db: Session, query: str, limit: int = 20, offset: int = 0,
+           start: str = SNIPPET_START, end: str = SNIPPET_END) -> List[dict]:
+    """Best matching logs first: [{"id", "rank", "snippet"}]. A lower rank is
+    a better match (bm25); hits of short-term-only queries all rank 0.
+    `start` / `end` surround the matched text."""
+    try:
+        return _search(db, query, limit, offset, start, end)
+    except DatabaseError as e:
+        # Usually the index no longer matches the logs (e.g. rows removed with
+        # the triggers dropped); rebuild it from the view and try once more.
+        db.rollback()
+        logger.error(f"Full-text search failed ({e}); rebuilding call_logs_fts.")
+        try:
+            db.execute(_REBUILD)
+            db.commit()
+            return _search(db, query, limit, offset, start, end)
+        except DatabaseError as e:
+            db.rollback()
+            raise SearchUnavailable(str(e)) from e
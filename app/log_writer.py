@@ -0,0 +1,199 @@
+"""Write-behind pipeline for call logs.
+
+Handlers put `CallLogCreate` records on a bounded in-process queue with
+`await log_writer.submit(...)`; a background task drains the queue and writes
+each batch (logs, details and aggregated provider counters) in a single
+transaction on a worker thread. Under SQLite this replaces one commit per
+request with one commit per batch.
+
+Tunable through environment variables:
+    LOG_QUEUE_MAX_SIZE     queue capacity before backpressure kicks in (default 10000)
+    LOG_BATCH_SIZE         maximum records per transaction (default 200)
+    LOG_FLUSH_INTERVAL     seconds to wait for a batch to fill up (default 1.0)
+    LOG_ENQUEUE_TIMEOUT    seconds `submit` waits for room before dropping (default 0.5)
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import List
+
+from . import crud, schemas, db_async, proxy_metrics, request_timing
+from .database import SessionLocal
+from .failure_window import failure_window
+from .circuit_breaker import circuit_breakers
+from .load_balancer import latency_tracker, ttft_tracker
+
+logger = logging.getLogger(__name__)
+
+LOG_QUEUE_MAX_SIZE = int(os.getenv("LOG_QUEUE_MAX_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+LOG_ENQUEUE_TIMEOUT = float(os.getenv("LOG_ENQUEUE_TIMEOUT", "0.5"))
+
+
+class CallLogWriter:
+    def __init__(self, max_size: int = LOG_QUEUE_MAX_SIZE, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL, enqueue_timeout: float = LOG_ENQUEUE_TIMEOUT):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        # Metrics
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Starts the background flush task on the running event loop."""
+        if self.running:
+            return
+        self._stopping = False
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"Call log writer started (queue={self.max_size}, batch={self.batch_size}, interval={self.flush_interval}s).")
+
+    async def stop(self):
+        """Stops accepting new records and flushes everything still queued."""
+        if not self.running:
+            return
+        self._stopping = True
+        await self._queue.put(None)  # Wake the flush loop
+        await self._task
+        self._task = None
+        logger.info(f"Call log writer stopped. Written={self.written}, dropped={self.dropped}, failed={self.failed}.")
+
+    async def submit(self, log: schemas.CallLogCreate):
+        """Queues a call log. Applies backpressure when the queue is full by
+        waiting up to `enqueue_timeout` seconds, then drops the record."""
+        # Routing must see failures and latency immediately, not when the batch lands.
+        if log.provider_id and not log.is_success:
+            failure_window.record_failure(log.provider_id)
+            latency_tracker.observe_failure(log.provider_id, log.response_time_ms)
+            ttft_tracker.observe_failure(log.provider_id, log.response_time_ms)
+        elif log.provider_id:
+            latency_tracker.observe(log.provider_id, log.response_time_ms)
+            if log.ttft_ms is not None:
+                ttft_tracker.observe(log.provider_id, log.ttft_ms)
+        circuit_breakers.record_status(log.provider_id, log.is_success, log.status_code)
+        proxy_metrics.record_attempt(log.provider_id, log.is_success, log.status_code, log.response_time_ms,
+                                     log.prompt_tokens, log.completion_tokens)
+
+        timer = request_timing.current()
+        if timer is not None:
+            if log.provider_id and log.response_time_ms:
+                timer.add("upstream" if log.is_success else "failed_attempts", log.response_time_ms)
+            # Snapshot before enqueueing: the queued log may be written at any
+            # moment, so its own "log" phase cannot be part of it (see request_timing)
+            if log.timings is None:
+                log.timings = json.dumps(timer.snapshot())
+
+        with request_timing.phase("log"):
+            await self._enqueue(log)
+
+    async def _enqueue(self, log: schemas.CallLogCreate):
+        if not self.running or self._stopping:
+            # No background task (e.g. during startup or scripts): write inline.
+            await db_async.run_sync(self._write_batch, [log])
+            return
+
+        try:
+            self._queue.put_nowait(log)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(log), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.warning(f"Call log queue full ({self.max_size}); dropped log for provider {log.provider_id}. Total dropped: {self.dropped}")
+                return
+        self.enqueued += 1
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_max_size": self.max_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+    async def _run(self):
+        done = False
+        while not done:
+            item = await self._queue.get()
+            batch = []
+            if item is None:
+                done = True
+            else:
+                batch.append(item)
+                # Give the batch a short time to fill up
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is None:
+                        done = True
+                        break
+                    batch.append(item)
+
+            if done:
+                # Drain whatever is left before shutting down
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not None:
+                        batch.append(item)
+
+            for start in range(0, len(batch), self.batch_size):
+                chunk = batch[start:start + self.batch_size]
+                try:
+                    await db_async.run_sync(self._write_batch, chunk)
+                except Exception as e:
+                    logger.error(f"Unexpected error in call log writer: {e}")
+
+    def _write_batch(self, batch: List[schemas.CallLogCreate]):
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            try:
+                crud.create_call_logs_batch(db, batch)
+                self.written += len(batch)
+            except Exception as e:
+                logger.error(f"Failed to write batch of {len(batch)} call logs, retrying one by one: {e}")
+                # Isolate the bad record(s) instead of losing the whole batch
+                for log in batch:
+                    try:
+                        crud.create_call_logs_batch(db, [log])
+                        self.written += 1
+                    except Exception as single_err:
+                        self.failed += 1
+                        logger.error(f"Dropped call log that could not be written: {single_err}")
+        finally:
+            db.close()
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+
+log_writer = CallLogWriter()
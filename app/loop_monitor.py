@@ -0,0 +1,143 @@
+"""Event-loop lag sampling and blocking-call detection.
+
+Anything that runs synchronously on the event loop (a query, a large JSON
+dump, a regex over a long body) delays every other stream until it returns.
+Two tools make that visible:
+
+  * The lag sampler is a background task that sleeps for a fixed interval and
+    records how late it woke up, as a histogram in milliseconds. On an idle,
+    healthy loop the lag stays near zero.
+
+  * The blocking-call detector (optional) is a watchdog thread that posts a
+    no-op callback to the loop and waits for it. If the loop does not run it
+    within LOOP_BLOCK_THRESHOLD_MS, the watchdog logs the loop thread's current
+    stack, which is the code that is blocking it, and then records how long
+    the stall lasted. This is like asyncio debug mode's slow-callback warning,
+    but it also reports where the time went and costs one callback per probe.
+
+Both are exposed through `/api/metrics/loop`.
+
+Tunable through environment variables:
+    LOOP_LAG_INTERVAL          seconds between lag samples (default 0.5)
+    LOOP_BLOCK_DETECTOR        "true" to enable the blocking-call detector (default false)
+    LOOP_BLOCK_THRESHOLD_MS    stall length that triggers a stack dump (default 100)
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Optional
+
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+LOOP_BLOCK_DETECTOR = os.getenv("LOOP_BLOCK_DETECTOR", "false").lower() in ("1", "true", "yes")
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+
+# Milliseconds
+LAG_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_MAX_RECENT_STALLS = 20
+_STACK_LIMIT = 25
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL,
+                 block_detector: bool = LOOP_BLOCK_DETECTOR,
+                 block_threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS):
+        self.interval = interval
+        self.block_detector = block_detector
+        self.block_threshold_ms = block_threshold_ms
+        self.lag = Histogram(LAG_BUCKETS)
+        self.stalls = Histogram(LAG_BUCKETS)
+        self.recent_stalls: Deque[dict] = deque(maxlen=_MAX_RECENT_STALLS)
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Starts the sampler (and the watchdog if enabled) for the running loop."""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._sample())
+        if self.block_detector:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+            logger.info(f"Event loop blocking-call detector enabled (threshold {self.block_threshold_ms:.0f} ms).")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _sample(self):
+        interval = self.interval
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            self.lag.observe(max(0.0, (time.perf_counter() - expected) * 1000))
+
+    def _watch(self):
+        threshold = self.block_threshold_ms / 1000
+        while not self._stop.is_set():
+            ran = threading.Event()
+            started = time.perf_counter()
+            try:
+                self._loop.call_soon_threadsafe(ran.set)
+            except RuntimeError:
+                return  # loop closed
+            if not ran.wait(threshold):
+                stack = self._loop_stack()
+                # Wait for the loop to come back to measure the whole stall
+                while not ran.wait(1.0):
+                    if self._stop.is_set():
+                        return
+                stalled_ms = (time.perf_counter() - started) * 1000
+                self.stalls.observe(stalled_ms)
+                self.recent_stalls.append({
+                    "at": time.time(),
+                    "duration_ms": round(stalled_ms, 1),
+                    "stack": stack,
+                })
+                logger.warning(f"Event loop blocked for {stalled_ms:.0f} ms. Stack while blocked:\n{''.join(stack)}")
+            self._stop.wait(threshold)
+
+    def _loop_stack(self) -> list:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return []
+        return traceback.format_stack(frame, limit=_STACK_LIMIT)
+
+    def stats(self) -> dict:
+        return {
+            "sample_interval_seconds": self.interval,
+            "lag_ms": self.lag.snapshot(),
+            "block_detector": {
+                "enabled": self.block_detector,
+                "threshold_ms": self.block_threshold_ms,
+                "stalls_ms": self.stalls.snapshot(),
+                "recent": list(self.recent_stalls),
+            },
+        }
+
+
+loop_monitor = LoopMonitor()
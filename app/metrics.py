@@ -0,0 +1,159 @@
+"""Small in-process metric primitives shared by the monitoring modules."""
+import bisect
+import math
+import threading
+from typing import Dict, Optional, Sequence
+
+
+class Histogram:
+    """Fixed-bucket histogram. `buckets` are inclusive upper bounds in
+    ascending order; values above the last one land in the +Inf bucket."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+            if value > self._max:
+                self._max = value
+
+    def snapshot(self) -> Dict:
+        """Cumulative bucket counts keyed by upper bound ("+Inf" last), plus
+        count, sum and max."""
+        with self._lock:
+            counts = list(self._counts)
+            total, value_sum, value_max = self._count, self._sum, self._max
+        cumulative = {}
+        running = 0
+        for bound, c in zip(self.buckets, counts):
+            running += c
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = running + counts[-1]
+        return {"buckets": cumulative, "count": total, "sum": value_sum, "max": value_max}
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with bounded relative error (DDSketch-style).
+
+    A value v > 0 is counted in bucket ceil(log_gamma(v)) with
+    gamma = (1 + a) / (1 - a), so any quantile is returned within relative
+    accuracy `a` of a value that was observed. Two sketches with the same
+    accuracy merge by adding bucket counts, which is what lets per-minute
+    sketches be combined into hours, days or a whole provider. Values below
+    `min_value` (e.g. sub-millisecond) share one zero bucket.
+
+    `to_bytes` / `from_bytes` give a compact encoding (delta + varint) for
+    storing sketches in the database: typically a few hundred bytes.
+    """
+
+    _FORMAT_VERSION = 1
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1.0):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1):
+        if value is None:
+            return
+        if value < self.min_value:
+            self.zero_count += count
+        else:
+            i = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[i] = self.buckets.get(i, 0) + count
+        self.count += count
+
+    def merge(self, other: "QuantileSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        buckets = self.buckets
+        for i, c in other.buckets.items():
+            buckets[i] = buckets.get(i, 0) + c
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile `q` (0..1), or None if the sketch is empty."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen > rank:
+                return 2 * self._gamma ** i / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.buckets) / (self._gamma + 1)
+
+    def to_bytes(self) -> bytes:
+        out = bytearray([self._FORMAT_VERSION])
+        _put_varint(out, self.zero_count)
+        _put_varint(out, len(self.buckets))
+        previous = 0
+        for i in sorted(self.buckets):
+            _put_varint(out, _zigzag(i - previous))
+            _put_varint(out, self.buckets[i])
+            previous = i
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes], relative_accuracy: float = 0.01, min_value: float = 1.0) -> "QuantileSketch":
+        sketch = cls(relative_accuracy, min_value)
+        if not data:
+            return sketch
+        if data[0] != cls._FORMAT_VERSION:
+            raise ValueError(f"Unknown sketch format {data[0]}")
+        pos = 1
+        sketch.zero_count, pos = _get_varint(data, pos)
+        n, pos = _get_varint(data, pos)
+        index = 0
+        total = sketch.zero_count
+        for _ in range(n):
+            delta, pos = _get_varint(data, pos)
+            c, pos = _get_varint(data, pos)
+            index += _unzigzag(delta)
+            sketch.buckets[index] = c
+            total += c
+        sketch.count = total
+        return sketch
+
+
+def _zigzag(n: int) -> int:
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+
+def _unzigzag(n: int) -> int:
+    return n // 2 if n % 2 == 0 else -(n + 1) // 2
+
+
+def _put_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(data: bytes, pos: int):
+    result = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
@@ -1,6 +1,7 @@
 import logging
 from sqlalchemy import inspect, text
 from .database import engine
+from . import stats_rollup, log_search
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +30,46 @@ def run_migrations():
                     logger.info("遷移成功：已添加 request_body 欄位。")
                 except Exception as e:
                     logger.error(f"遷移失敗 (request_body): {e}")
+
+            # 遷移 2.1: 添加 timings 欄位 (各階段耗時 JSON)
+            if 'timings' not in columns:
+                try:
+                    logger.info("正在遷移：為 call_logs 添加 timings 欄位...")
+                    conn.execute(text("ALTER TABLE call_logs ADD COLUMN timings TEXT"))
+                    logger.info("遷移成功：已添加 timings 欄位。")
+                except Exception as e:
+                    logger.error(f"遷移失敗 (timings): {e}")
+
+            # 遷移 2.2: 添加串流效能欄位 (首字延遲、字間間隔、吞吐量)
+            for column, column_type in (("ttft_ms", "INTEGER"), ("inter_token_mean_ms", "FLOAT"),
+                                        ("inter_token_p95_ms", "FLOAT"), ("tokens_per_second", "FLOAT")):
+                if column not in columns:
+                    try:
+                        logger.info(f"正在遷移：為 call_logs 添加 {column} 欄位...")
+                        conn.execute(text(f"ALTER TABLE call_logs ADD COLUMN {column} {column_type}"))
+                        logger.info(f"遷移成功：已添加 {column} 欄位。")
+                    except Exception as e:
+                        logger.error(f"遷移失敗 ({column}): {e}")
+
+            # 遷移 2.3: 添加 requested_model 欄位並從請求內容回填 (日誌列表不再需要讀取 Body)
+            if 'requested_model' not in columns:
+                try:
+                    logger.info("正在遷移：為 call_logs 添加 requested_model 欄位...")
+                    conn.execute(text("ALTER TABLE call_logs ADD COLUMN requested_model VARCHAR"))
+                    conn.execute(text(
+                        "UPDATE call_logs SET requested_model = CASE WHEN json_valid(request_body) "
+                        "THEN json_extract(request_body, '$.model') END WHERE request_body IS NOT NULL"
+                    ))
+                    if 'call_log_details' in inspector.get_table_names():
+                        conn.execute(text(
+                            "UPDATE call_logs SET requested_model = ("
+                            "SELECT json_extract(d.request_body, '$.model') FROM call_log_details d "
+                            "WHERE d.id = call_logs.id AND json_valid(d.request_body)) "
+                            "WHERE requested_model IS NULL"
+                        ))
+                    logger.info("遷移成功：已添加並回填 requested_model 欄位。")
+                except Exception as e:
+                    logger.error(f"遷移失敗 (requested_model): {e}")
     else:
         logger.info("call_logs 表不存在，將由 create_all 建立。")
 
@@ -58,6 +99,14 @@ def run_migrations():
                 if 'ix_call_logs_api_key_id' not in indexes:
                     logger.info("正在遷移：為 call_logs 添加 api_key_id 索引...")
                     conn.execute(text("CREATE INDEX ix_call_logs_api_key_id ON call_logs (api_key_id)"))
+
+                # 添加 status_code 與 response_time_ms 索引 (用於日誌篩選)
+                if 'ix_call_logs_status_code' not in indexes:
+                    logger.info("正在遷移：為 call_logs 添加 status_code 索引...")
+                    conn.execute(text("CREATE INDEX ix_call_logs_status_code ON call_logs (status_code)"))
+                if 'ix_call_logs_response_time_ms' not in indexes:
+                    logger.info("正在遷移：為 call_logs 添加 response_time_ms 索引...")
+                    conn.execute(text("CREATE INDEX ix_call_logs_response_time_ms ON call_logs (response_time_ms)"))
                     
                 logger.info("索引遷移檢查完成。")
             except Exception as e:
@@ -94,6 +143,18 @@ def run_migrations():
                 except Exception as e:
                     logger.error(f"遷移失敗 (active_calls): {e}")
 
+    # Migration for groups to add routing_strategy
+    if 'groups' in inspector.get_table_names():
+        group_columns = [c['name'] for c in inspector.get_columns('groups')]
+        if 'routing_strategy' not in group_columns:
+            with engine.begin() as conn:
+                try:
+                    logger.info("正在遷移：為 groups 添加 routing_strategy 欄位...")
+                    conn.execute(text("ALTER TABLE groups ADD COLUMN routing_strategy VARCHAR DEFAULT 'priority'"))
+                    logger.info("遷移成功：已添加 routing_strategy 欄位。")
+                except Exception as e:
+                    logger.error(f"遷移失敗 (groups.routing_strategy): {e}")
+
     # Migration for api_keys to add name column
     if 'api_keys' in inspector.get_table_names():
         api_key_columns = [c['name'] for c in inspector.get_columns('api_keys')]
@@ -108,4 +169,39 @@ def run_migrations():
 
     # Ensure CallLogDetail table exists (though create_all handles new tables, we log it)
     if 'call_log_details' not in inspector.get_table_names():
-        logger.info("正在遷移：call_log_details 表不存在，將由 create_all 建立。")
\ No newline at end of file
+        logger.info("正在遷移：call_log_details 表不存在，將由 create_all 建立。")
+
+    # 遷移 4: 以現有 call_logs 回填統計彙總表 (call_stats_rollups)
+    if 'call_stats_rollups' in inspector.get_table_names() and 'call_logs' in inspector.get_table_names():
+        with engine.begin() as conn:
+            try:
+                has_rollups = conn.execute(text("SELECT 1 FROM call_stats_rollups LIMIT 1")).first() is not None
+                has_logs = conn.execute(text("SELECT 1 FROM call_logs WHERE provider_id IS NOT NULL LIMIT 1")).first() is not None
+                if has_logs and not has_rollups:
+                    logger.info("正在遷移：以 call_logs 回填 call_stats_rollups...")
+                    stats_rollup.rebuild(conn)
+                    logger.info("遷移成功：已回填 call_stats_rollups。")
+            except Exception as e:
+                logger.error(f"遷移失敗 (call_stats_rollups): {e}")
+
+    # 遷移 5: 為 call_stats_rollups 添加延遲分位數 sketch 欄位並回填
+    if 'call_stats_rollups' in inspector.get_table_names():
+        rollup_columns = [c['name'] for c in inspector.get_columns('call_stats_rollups')]
+        if 'response_time_sketch' not in rollup_columns:
+            with engine.begin() as conn:
+                try:
+                    logger.info("正在遷移：為 call_stats_rollups 添加 response_time_sketch / ttft_sketch 欄位...")
+                    conn.execute(text("ALTER TABLE call_stats_rollups ADD COLUMN response_time_sketch BLOB"))
+                    conn.execute(text("ALTER TABLE call_stats_rollups ADD COLUMN ttft_sketch BLOB"))
+                    stats_rollup.rebuild_sketches(conn)
+                    logger.info("遷移成功：已添加並回填延遲 sketch 欄位。")
+                except Exception as e:
+                    logger.error(f"遷移失敗 (call_stats_rollups sketches): {e}")
+
+    # 遷移 6: 建立 (或在停用時移除) 日誌全文檢索索引 call_logs_fts
+    if 'call_logs' in inspector.get_table_names():
+        with engine.begin() as conn:
+            try:
+                log_search.ensure_index(conn)
+            except Exception as e:
+                logger.error(f"遷移失敗 (call_logs_fts): {e}")
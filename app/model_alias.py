@@ -0,0 +1,111 @@
+"""Resolution of a requested model name to a group name.
+
+Clients send a group name as the `model`, but usually in a shorter or
+vendor-specific spelling. The proxy handlers each used to scan the key's
+authorized groups per request with slightly different rules. `AliasIndex` is
+built once per routing snapshot from all group names and tries, in order:
+
+    1. the exact group name
+    2. alias rules: a request starting with a rule's prefix is rewritten
+       (default "claude-" -> "anthropic/" and "gpt-" -> "openai/")
+    3. groups whose name ends with "/<model>" ("gemini" -> "google/gemini")
+    4. the part of the model after a "/" ("openrouter/gpt-4o" -> "gpt-4o")
+
+Each step is a dict or set lookup, and the first candidate the API key is
+authorized for wins. When several groups share an alias, the older group
+(lower id) comes first.
+
+Rules are configurable through the `model_alias_rules` setting, a JSON object
+mapping request prefixes to group prefixes, e.g. {"claude-": "anthropic/"}.
+"""
+import json
+import logging
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ALIAS_RULES_SETTING = "model_alias_rules"
+DEFAULT_ALIAS_RULES: Tuple[Tuple[str, str], ...] = (("claude-", "anthropic/"), ("gpt-", "openai/"))
+
+# Resolved candidate lists are memoized per requested model; cap the memo so
+# random model names cannot grow it without bound.
+_MAX_MEMO_ENTRIES = 4096
+
+
+def parse_alias_rules(value: Optional[str]) -> Tuple[Tuple[str, str], ...]:
+    """Parses the `model_alias_rules` setting. Falls back to the defaults when
+    it is unset or invalid."""
+    if not value:
+        return DEFAULT_ALIAS_RULES
+    try:
+        data = json.loads(value)
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+        return tuple((str(k), str(v)) for k, v in data.items() if k)
+    except ValueError as e:
+        logger.error(f"Invalid {ALIAS_RULES_SETTING} setting, using defaults: {e}")
+        return DEFAULT_ALIAS_RULES
+
+
+def format_alias_rules(rules: Iterable[Tuple[str, str]]) -> str:
+    return json.dumps(dict(rules), ensure_ascii=False)
+
+
+class AliasIndex:
+    def __init__(self, group_names: Iterable[str], rules: Iterable[Tuple[str, str]] = DEFAULT_ALIAS_RULES):
+        """`group_names` should be in group id order; it sets the preference
+        between groups that share an alias."""
+        names: List[str] = list(dict.fromkeys(group_names))
+        self.rules: Tuple[Tuple[str, str], ...] = tuple(rules)
+        self._names: FrozenSet[str] = frozenset(names)
+        by_suffix: Dict[str, List[str]] = {}
+        for name in names:
+            # Every tail after a "/" is an alias: "a/b/c" -> "b/c", "c"
+            pos = name.find("/")
+            while pos != -1:
+                by_suffix.setdefault(name[pos + 1:], []).append(name)
+                pos = name.find("/", pos + 1)
+        self._by_suffix: Dict[str, Tuple[str, ...]] = {k: tuple(v) for k, v in by_suffix.items()}
+        self._memo: Dict[str, Tuple[str, ...]] = {}
+        self._memo_lock = threading.Lock()
+
+    def candidates(self, model: str) -> Tuple[str, ...]:
+        """Group names `model` may refer to, most specific first."""
+        cached = self._memo.get(model)
+        if cached is not None:
+            return cached
+
+        found: List[str] = []
+        if model in self._names:
+            found.append(model)
+        for prefix, replacement in self.rules:
+            if model.startswith(prefix):
+                rewritten = replacement + model[len(prefix):]
+                if rewritten in self._names:
+                    found.append(rewritten)
+        found.extend(self._by_suffix.get(model, ()))
+        pos = model.find("/")
+        while pos != -1:
+            tail = model[pos + 1:]
+            if tail in self._names:
+                found.append(tail)
+            pos = model.find("/", pos + 1)
+
+        result = tuple(dict.fromkeys(found))
+        with self._memo_lock:
+            if len(self._memo) >= _MAX_MEMO_ENTRIES:
+                self._memo.clear()
+            self._memo[model] = result
+        return result
+
+    def resolve(self, model: Optional[str], authorized: FrozenSet[str]) -> Optional[str]:
+        """Returns the group `model` maps to among the `authorized` names, or None."""
+        if not model:
+            return None
+        if model in authorized:
+            return model
+        for name in self.candidates(model):
+            if name in authorized:
+                return name
+        return None
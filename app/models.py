@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, ForeignKey, Table, Text
+from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, ForeignKey, Table, Text, UniqueConstraint, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import pytz
@@ -25,6 +25,8 @@ api_key_group_association = Table('api_key_group_association', Base.metadata,
 
 class ApiProvider(Base):
     __tablename__ = "api_providers"
+    # Never reuse the id of a deleted provider: call_stats_rollups rows are keyed by it
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False)
@@ -50,6 +52,7 @@ class Group(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True, nullable=False)
+    routing_strategy = Column(String, default="priority") # priority, least_outstanding, p2c, ewma_latency, ewma_ttft
     
     providers = relationship("ApiProvider",
                              secondary="provider_group_association",
@@ -85,8 +88,8 @@ class CallLog(Base):
     request_timestamp = Column(DateTime(timezone=True), default=lambda: datetime.now(TAIPEI_TZ), index=True)
     response_timestamp = Column(DateTime(timezone=True), nullable=True)
     is_success = Column(Boolean, nullable=False, index=True)
-    status_code = Column(Integer)
-    response_time_ms = Column(Integer)
+    status_code = Column(Integer, index=True)
+    response_time_ms = Column(Integer, index=True)
     error_message = Column(String, nullable=True)
     # Legacy body columns - kept for compatibility with existing data
     request_body = Column(Text, nullable=True)
@@ -95,6 +98,15 @@ class CallLog(Base):
     completion_tokens = Column(Integer, nullable=True)
     total_tokens = Column(Integer, nullable=True)
     cost = Column(Float, nullable=True)
+    # Per-phase timing breakdown in ms (JSON), see request_timing
+    timings = Column(Text, nullable=True)
+    # Streaming only, see stream_stats
+    ttft_ms = Column(Integer, nullable=True)
+    inter_token_mean_ms = Column(Float, nullable=True)
+    inter_token_p95_ms = Column(Float, nullable=True)
+    tokens_per_second = Column(Float, nullable=True)
+    # Model name the client asked for, taken from the request body when the log is written
+    requested_model = Column(String, nullable=True)
 
     provider = relationship("ApiProvider", back_populates="call_logs")
     api_key = relationship("APIKey", back_populates="call_logs")
@@ -109,6 +121,40 @@ class CallLogDetail(Base):
 
     call_log = relationship("CallLog", back_populates="details")
 
+class CallStatsRollup(Base):
+    """Call counters per time bucket, maintained with the call logs (see stats_rollup)."""
+    __tablename__ = "call_stats_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket_start", "provider_id", "api_key_id", "model", "endpoint",
+                         name="uq_call_stats_rollups_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String, nullable=False)  # minute, hour, day
+    bucket_start = Column(DateTime, nullable=False, index=True)
+    provider_id = Column(Integer, nullable=False, index=True)
+    api_key_id = Column(Integer, nullable=False, default=0)  # 0 = no API key
+    model = Column(String, nullable=False, default="")
+    endpoint = Column(String, nullable=False, default="")
+    calls = Column(Integer, nullable=False, default=0)
+    successes = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0)
+    # Successful calls only
+    response_time_sum_ms = Column(Float, nullable=False, default=0)
+    response_time_count = Column(Integer, nullable=False, default=0)
+    # Successful streams only
+    ttft_sum_ms = Column(Float, nullable=False, default=0)
+    ttft_count = Column(Integer, nullable=False, default=0)
+    inter_token_mean_sum_ms = Column(Float, nullable=False, default=0)
+    inter_token_p95_sum_ms = Column(Float, nullable=False, default=0)
+    tokens_per_second_sum = Column(Float, nullable=False, default=0)
+    # Encoded QuantileSketch (see metrics) of successful response times / stream TTFTs
+    response_time_sketch = Column(LargeBinary, nullable=True)
+    ttft_sketch = Column(LargeBinary, nullable=True)
+
 class ErrorMaintenance(Base):
     __tablename__ = "error_maintenance"
 
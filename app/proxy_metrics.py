@@ -0,0 +1,274 @@
+"""Prometheus-style metrics for the proxy.
+
+Collectors are plain dicts keyed by label tuples and are only updated from the
+event loop thread (the ASGI middleware and the async proxy handlers), so they
+need no locks: recording a sample is a dict lookup and a few integer adds.
+`/metrics` is served from the loop as well, so it always reads a consistent
+state. Values that already live elsewhere - active calls, log queue depth,
+event-loop lag, circuit state - are read at scrape time instead of being
+duplicated.
+
+Per-request context (endpoint, matched group, number of upstream attempts)
+is carried in a contextvar set by `ProxyMetricsMiddleware`, so the call log
+writer can label upstream attempts without every handler passing it along.
+
+Set METRICS_TOKEN to require `Authorization: Bearer <token>` on `/metrics`.
+"""
+import bisect
+import contextvars
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from . import routing_cache
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TTFB_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 30)
+TOKEN_RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 100, 200, 500)
+RETRY_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        values = self.values
+        values[labels] = values.get(labels, 0) + amount
+
+
+class LabeledHistogram:
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.values: Dict[tuple, List[float]] = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        row = self.values.get(labels)
+        if row is None:
+            row = self.values[labels] = [0] * (len(self.buckets) + 2)
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+
+requests_total = Counter("niceapi_requests_total", "Client requests to the proxy endpoints.", ("endpoint", "group", "status"))
+request_duration = LabeledHistogram("niceapi_request_duration_seconds", "Client request duration, until the last byte for streams.", LATENCY_BUCKETS, ("endpoint",))
+failover_retries = LabeledHistogram("niceapi_failover_retries", "Extra upstream attempts per client request.", RETRY_BUCKETS, ("endpoint",))
+upstream_requests = Counter("niceapi_upstream_requests_total", "Upstream attempts by outcome status.", ("provider_id", "group", "endpoint", "status"))
+upstream_failures = Counter("niceapi_upstream_failures_total", "Failed upstream attempts by status.", ("provider_id", "group", "endpoint", "status"))
+upstream_latency = LabeledHistogram("niceapi_upstream_latency_seconds", "Upstream response time per attempt.", LATENCY_BUCKETS, ("provider_id", "group"))
+stream_ttfb = LabeledHistogram("niceapi_stream_ttfb_seconds", "Time to the first upstream event of a stream.", TTFB_BUCKETS, ("provider_id", "group"))
+tokens_per_second = LabeledHistogram("niceapi_tokens_per_second", "Completion tokens per second of response time.", TOKEN_RATE_BUCKETS, ("provider_id", "group"))
+tokens_total = Counter("niceapi_tokens_total", "Tokens reported by upstream usage.", ("provider_id", "group", "type"))
+
+_COLLECTORS = (requests_total, request_duration, failover_retries, upstream_requests, upstream_failures,
+               upstream_latency, stream_ttfb, tokens_per_second, tokens_total)
+
+
+class RequestState:
+    __slots__ = ("scope", "group", "attempts")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.group = ""
+        self.attempts = 0
+
+    @property
+    def endpoint(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+
+_current: contextvars.ContextVar[Optional[RequestState]] = contextvars.ContextVar("proxy_metrics_request", default=None)
+
+
+def set_group(group_name: Optional[str]):
+    """Labels the current request with the group it was routed to."""
+    state = _current.get()
+    if state is not None and group_name:
+        state.group = group_name
+
+
+def record_attempt(provider_id: Optional[int], is_success: bool, status_code: Optional[int],
+                   response_time_ms: Optional[int], prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+    """Called by the call log writer for every logged call. Logs without a
+    provider (auth errors, no provider available) never reached an upstream
+    and only show up in niceapi_requests_total."""
+    if provider_id is None:
+        return
+    state = _current.get()
+    group = state.group if state is not None else ""
+    endpoint = state.endpoint if state is not None else ""
+    status = str(status_code) if status_code is not None else "error"
+    pid = str(provider_id)
+
+    upstream_requests.inc((pid, group, endpoint, status))
+    if not is_success:
+        upstream_failures.inc((pid, group, endpoint, status))
+    if state is not None:
+        state.attempts += 1
+    if response_time_ms:
+        upstream_latency.observe(response_time_ms / 1000, (pid, group))
+        if is_success and completion_tokens:
+            tokens_per_second.observe(completion_tokens / (response_time_ms / 1000), (pid, group))
+    if prompt_tokens:
+        tokens_total.inc((pid, group, "prompt"), prompt_tokens)
+    if completion_tokens:
+        tokens_total.inc((pid, group, "completion"), completion_tokens)
+
+
+def observe_ttfb(provider_id: int, seconds: float):
+    state = _current.get()
+    stream_ttfb.observe(seconds, (str(provider_id), state.group if state is not None else ""))
+
+
+class ProxyMetricsMiddleware:
+    """Pure ASGI middleware (it must not buffer streaming responses) that
+    counts and times requests to the `/v1/` proxy endpoints."""
+
+    def __init__(self, app, path_prefix: str = "/v1/"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope.get("path", "").startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        state = RequestState(scope)
+        token = _current.set(state)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            endpoint = state.endpoint
+            requests_total.inc((endpoint, state.group, str(status[0])))
+            request_duration.observe(time.perf_counter() - started, (endpoint,))
+            if state.attempts:
+                failover_retries.observe(state.attempts - 1, (endpoint,))
+
+
+# --- Exposition ---
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _with_provider_name(labelnames: tuple, labels: tuple, provider_names: Dict[str, str]) -> Tuple[tuple, tuple]:
+    """Adds a `provider` (name) label next to `provider_id`."""
+    if "provider_id" not in labelnames:
+        return labelnames, labels
+    i = labelnames.index("provider_id")
+    name = provider_names.get(labels[i], "")
+    return labelnames + ("provider",), labels + (name,)
+
+
+def _render_counter(out: List[str], c: Counter, provider_names: Dict[str, str], metric_type: str = "counter"):
+    out.append(f"# HELP {c.name} {c.help}")
+    out.append(f"# TYPE {c.name} {metric_type}")
+    for labels, value in list(c.values.items()):
+        names, values = _with_provider_name(c.labelnames, labels, provider_names)
+        out.append(f"{c.name}{_labels(names, values)} {value:g}")
+
+
+def _render_histogram(out: List[str], h: LabeledHistogram, provider_names: Dict[str, str]):
+    out.append(f"# HELP {h.name} {h.help}")
+    out.append(f"# TYPE {h.name} histogram")
+    for labels, row in list(h.values.items()):
+        names, values = _with_provider_name(h.labelnames, labels, provider_names)
+        running = 0
+        for bound, count in zip(h.buckets, row):
+            running += count
+            le = f'le="{bound:g}"'
+            out.append(f"{h.name}_bucket{_labels(names, values, le)} {running}")
+        running += row[len(h.buckets)]
+        le = 'le="+Inf"'
+        out.append(f"{h.name}_bucket{_labels(names, values, le)} {running}")
+        out.append(f"{h.name}_sum{_labels(names, values)} {row[-1]:g}")
+        out.append(f"{h.name}_count{_labels(names, values)} {running}")
+
+
+def render(snapshot) -> str:
+    """Prometheus text exposition of all proxy metrics. `snapshot` is the
+    routing snapshot, used to label providers and groups by name."""
+    from .concurrency import concurrency
+    from .log_writer import log_writer
+    from .loop_monitor import loop_monitor
+    from .circuit_breaker import circuit_breakers, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+
+    provider_names = {str(pid): p.name for pid, p in snapshot.providers.items()}
+    group_names = {g.id: name for name, g in snapshot.groups_by_name.items()}
+
+    out: List[str] = []
+    for collector in _COLLECTORS:
+        if isinstance(collector, Counter):
+            _render_counter(out, collector, provider_names)
+        else:
+            _render_histogram(out, collector, provider_names)
+
+    active = Counter("niceapi_active_calls", "In-flight upstream calls.", ("provider_id", "group"))
+    for (provider_id, group_id), count in concurrency.snapshot().items():
+        active.inc((str(provider_id), group_names.get(group_id, str(group_id))), count)
+    _render_counter(out, active, provider_names, "gauge")
+
+    writer = log_writer.stats()
+    out.append("# HELP niceapi_log_queue_depth Call logs waiting to be written.")
+    out.append("# TYPE niceapi_log_queue_depth gauge")
+    out.append(f"niceapi_log_queue_depth {writer['queue_depth']}")
+    out.append("# HELP niceapi_log_records_dropped_total Call logs dropped because the queue was full.")
+    out.append("# TYPE niceapi_log_records_dropped_total counter")
+    out.append(f"niceapi_log_records_dropped_total {writer['dropped']}")
+
+    state_values = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+    circuit = Counter("niceapi_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open).", ("provider_id",))
+    for item in circuit_breakers.status():
+        circuit.inc((str(item["provider_id"]),), state_values.get(item["state"], 0))
+    _render_counter(out, circuit, provider_names, "gauge")
+
+    # Loop lag is kept in milliseconds; expose it in seconds
+    lag = loop_monitor.lag.snapshot()
+    out.append("# HELP niceapi_event_loop_lag_seconds Delay between scheduled and actual wake-up of the lag sampler.")
+    out.append("# TYPE niceapi_event_loop_lag_seconds histogram")
+    for bound, count in lag["buckets"].items():
+        le = bound if bound == "+Inf" else f"{float(bound) / 1000:g}"
+        out.append(f'niceapi_event_loop_lag_seconds_bucket{{le="{le}"}} {count}')
+    out.append(f"niceapi_event_loop_lag_seconds_sum {lag['sum'] / 1000:g}")
+    out.append(f"niceapi_event_loop_lag_seconds_count {lag['count']}")
+    return "\n".join(out) + "\n"
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    snapshot = await routing_cache.get_snapshot_async()
+    return PlainTextResponse(render(snapshot), media_type="text/plain; version=0.0.4")
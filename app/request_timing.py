@@ -0,0 +1,114 @@
+"""Per-phase timing of proxied requests.
+
+`response_time_ms` only covers the upstream call. A `RequestTimer` is attached
+to each `/v1/` request (through a contextvar, like the metrics request state)
+and the code on the request path adds the time it spends to named phases:
+
+    auth              API key lookup
+    alias             model -> group resolution
+    select            provider selection (summed over failover retries)
+    keywords          loading the failure keyword matcher
+    failed_attempts   upstream attempts that failed before the one that answered
+    upstream          the attempt that answered (= its response_time_ms)
+    connect           streams: until the upstream response headers arrived
+    ttfb              streams: until the first upstream event
+    stream            streams: from the first event to the end of the stream
+    post              post-processing of a non-streaming response
+    log               handing call logs to the log writer
+
+`connect`, `ttfb` and `stream` are subdivisions of the upstream attempts, not
+additions; like `select` they are summed when a request fails over.
+Each call log stores the phases measured so far (plus `total`) as JSON in
+`call_logs.timings`. That snapshot is taken before the log itself is handed to
+the writer (once queued, the writer may serialize it at any moment), so the
+stored `log` phase only covers the logs of earlier failed attempts and never
+the log being stored; a backpressure wait on a full queue shows up only in
+Server-Timing and in the request's own duration.
+With SERVER_TIMING_DEBUG=true the same phases are sent in a `Server-Timing`
+response header; for streams the header goes out with the first byte, so only
+the phases before the stream are included.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+SERVER_TIMING_DEBUG = os.getenv("SERVER_TIMING_DEBUG", "false").lower() in ("1", "true", "yes")
+
+
+class RequestTimer:
+    __slots__ = ("started", "phases")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def add(self, phase: str, ms: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + ms
+
+    def snapshot(self) -> Dict[str, float]:
+        result = {k: round(v, 2) for k, v in self.phases.items()}
+        result["total"] = round((time.perf_counter() - self.started) * 1000, 2)
+        return result
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={ms}" for name, ms in self.snapshot().items()]
+        return ", ".join(parts)
+
+
+_current: contextvars.ContextVar[Optional[RequestTimer]] = contextvars.ContextVar("request_timer", default=None)
+
+
+def current() -> Optional[RequestTimer]:
+    return _current.get()
+
+
+def add(phase: str, ms: float):
+    timer = _current.get()
+    if timer is not None:
+        timer.add(phase, ms)
+
+
+@contextmanager
+def phase(name: str):
+    """Adds the wall time of the block (including awaits inside it) to `name`."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, (time.perf_counter() - started) * 1000)
+
+
+class RequestTimingMiddleware:
+    """Pure ASGI middleware: starts a timer for each `/v1/` request and, in
+    debug mode, adds the `Server-Timing` header."""
+
+    def __init__(self, app, path_prefix: str = "/v1/", debug: bool = SERVER_TIMING_DEBUG):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.debug = debug
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope.get("path", "").startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        timer = RequestTimer()
+        token = _current.set(timer)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timer.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper if self.debug else send)
+        finally:
+            _current.reset(token)
@@ -0,0 +1,183 @@
+"""In-process routing snapshot used by the smart router.
+
+Provider selection runs on every proxy attempt (including each failover retry),
+so instead of querying providers, groups and settings each time we keep an
+immutable snapshot in memory and rebuild it lazily after the admin CRUD
+functions report a change via `invalidate()`.
+"""
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models, db_async
+from .model_alias import AliasIndex, ALIAS_RULES_SETTING, parse_alias_rules
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 2
+DEFAULT_FAILURE_PERIOD_MINUTES = 5
+
+
+@dataclass(frozen=True)
+class ProviderRoute:
+    """Detached copy of an ApiProvider row, safe to share across requests."""
+    id: int
+    name: str
+    api_endpoint: str
+    api_key: str
+    model: Optional[str]
+    price_per_million_tokens: Optional[float]
+    input_price_per_million_tokens: Optional[float]
+    output_price_per_million_tokens: Optional[float]
+    type: Optional[str]
+    is_active: bool
+    total_calls: int
+    successful_calls: int
+
+
+@dataclass(frozen=True)
+class GroupRoute:
+    id: int
+    name: str
+    # (provider_id, priority), sorted by priority ASC then price ASC
+    members: Tuple[Tuple[int, int], ...] = ()
+    routing_strategy: str = "priority"
+
+
+@dataclass
+class RoutingSnapshot:
+    providers: Dict[int, ProviderRoute] = field(default_factory=dict)
+    groups_by_name: Dict[str, GroupRoute] = field(default_factory=dict)
+    # Active provider ids per model, sorted by price ASC
+    providers_by_model: Dict[str, Tuple[int, ...]] = field(default_factory=dict)
+    failure_threshold: int = DEFAULT_FAILURE_THRESHOLD
+    failure_period_minutes: int = DEFAULT_FAILURE_PERIOD_MINUTES
+    # Requested model name -> group name lookups
+    alias_index: AliasIndex = field(default_factory=lambda: AliasIndex(()))
+
+
+def price_sort_key(provider: ProviderRoute):
+    # Mirror SQLite's "ORDER BY price ASC" where NULLs sort first
+    price = provider.price_per_million_tokens
+    return (price is not None, price or 0)
+
+
+def _int_setting(settings: Dict[str, str], key: str, default: int) -> int:
+    try:
+        return int(settings[key])
+    except (KeyError, TypeError, ValueError):
+        return default
+
+
+def build_snapshot(db: Session) -> RoutingSnapshot:
+    """Loads providers, group associations and failover settings in one pass."""
+    providers = {}
+    for p in db.query(models.ApiProvider).all():
+        providers[p.id] = ProviderRoute(
+            id=p.id,
+            name=p.name,
+            api_endpoint=p.api_endpoint,
+            api_key=p.api_key,
+            model=p.model,
+            price_per_million_tokens=p.price_per_million_tokens,
+            input_price_per_million_tokens=p.input_price_per_million_tokens,
+            output_price_per_million_tokens=p.output_price_per_million_tokens,
+            type=p.type,
+            is_active=bool(p.is_active),
+            total_calls=p.total_calls or 0,
+            successful_calls=p.successful_calls or 0,
+        )
+
+    members: Dict[int, List[Tuple[int, int]]] = {}
+    for assoc in db.query(models.ProviderGroupAssociation.provider_id,
+                          models.ProviderGroupAssociation.group_id,
+                          models.ProviderGroupAssociation.priority).all():
+        if assoc.provider_id in providers:
+            members.setdefault(assoc.group_id, []).append((assoc.provider_id, assoc.priority or 0))
+
+    groups_by_name = {}
+    for g in db.query(models.Group.id, models.Group.name, models.Group.routing_strategy).order_by(models.Group.id).all():
+        group_members = sorted(
+            members.get(g.id, []),
+            key=lambda m: (m[1], price_sort_key(providers[m[0]]))
+        )
+        groups_by_name[g.name] = GroupRoute(
+            id=g.id, name=g.name, members=tuple(group_members),
+            routing_strategy=g.routing_strategy or "priority"
+        )
+
+    by_model: Dict[str, List[ProviderRoute]] = {}
+    for p in providers.values():
+        if p.is_active and p.model:
+            by_model.setdefault(p.model, []).append(p)
+    providers_by_model = {
+        model: tuple(p.id for p in sorted(plist, key=price_sort_key))
+        for model, plist in by_model.items()
+    }
+
+    settings = {s.key: s.value for s in db.query(models.Setting).all()}
+
+    return RoutingSnapshot(
+        providers=providers,
+        groups_by_name=groups_by_name,
+        providers_by_model=providers_by_model,
+        failure_threshold=_int_setting(settings, 'failover_threshold_count', DEFAULT_FAILURE_THRESHOLD),
+        failure_period_minutes=_int_setting(settings, 'failover_threshold_period_minutes', DEFAULT_FAILURE_PERIOD_MINUTES),
+        alias_index=AliasIndex(groups_by_name.keys(), parse_alias_rules(settings.get(ALIAS_RULES_SETTING))),
+    )
+
+
+_lock = threading.Lock()
+_snapshot: Optional[RoutingSnapshot] = None
+_version = 0
+_built_version = -1
+
+
+def invalidate():
+    """Marks the snapshot as stale. Call after committing changes to providers,
+    groups, group associations or settings."""
+    global _version
+    with _lock:
+        _version += 1
+
+
+def get_snapshot() -> RoutingSnapshot:
+    """Returns the current snapshot, rebuilding it first if it is stale."""
+    global _snapshot, _built_version
+    snapshot = _snapshot
+    if snapshot is not None and _built_version == _version:
+        return snapshot
+
+    with _lock:
+        if _snapshot is not None and _built_version == _version:
+            return _snapshot
+        target_version = _version
+
+    # Always use a fresh session so we never read through a caller's
+    # long-lived transaction.
+    db = SessionLocal()
+    try:
+        snapshot = build_snapshot(db)
+    finally:
+        db.close()
+
+    with _lock:
+        # If something was invalidated while we were loading, _version has moved
+        # past target_version and the next call rebuilds again.
+        _snapshot = snapshot
+        _built_version = target_version
+    logger.info(f"Routing snapshot rebuilt: {len(snapshot.providers)} providers, {len(snapshot.groups_by_name)} groups.")
+    return snapshot
+
+
+async def get_snapshot_async() -> RoutingSnapshot:
+    """Like get_snapshot(), but a rebuild runs on the database thread pool
+    instead of the event loop."""
+    snapshot = _snapshot
+    if snapshot is not None and _built_version == _version:
+        return snapshot
+    return await db_async.run_sync(get_snapshot)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List, Any, Union
+from pydantic import AliasChoices, BaseModel, Field
+from typing import Optional, List, Any, Union, Literal
 from datetime import datetime
 
 # Base schema for ApiProvider
@@ -46,10 +46,15 @@ class ProviderListResponse(BaseModel):
 # Schemas for Group
 class GroupBase(BaseModel):
     name: str
+    routing_strategy: Optional[Literal["priority", "least_outstanding", "p2c", "ewma_latency", "ewma_ttft"]] = "priority"
 
 class GroupCreate(GroupBase):
     pass
 
+class GroupUpdate(BaseModel):
+    name: Optional[str] = None
+    routing_strategy: Optional[Literal["priority", "least_outstanding", "p2c", "ewma_latency", "ewma_ttft"]] = None
+
 class ApiProviderInGroup(ApiProviderBase):
     id: int
     priority: Optional[int] = 99
@@ -161,7 +166,8 @@ class APIKeySlim(APIKeyBase):
 
 class APIKey(APIKeySlim):
     created_at: datetime
-    last_used_at: Optional[datetime] = None
+    # crud.get_api_keys sets live_last_used_at (includes uses not yet flushed to the column)
+    last_used_at: Optional[datetime] = Field(None, validation_alias=AliasChoices("live_last_used_at", "last_used_at"))
     groups: List[Group] = []
     call_count: Optional[int] = None
 
@@ -181,6 +187,12 @@ class CallLogBase(BaseModel):
     completion_tokens: Optional[int] = None
     total_tokens: Optional[int] = None
     cost: Optional[float] = None
+    timings: Optional[str] = None
+    ttft_ms: Optional[int] = None
+    inter_token_mean_ms: Optional[float] = None
+    inter_token_p95_ms: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+    requested_model: Optional[str] = None
 
 class CallLogDetailBase(BaseModel):
     request_body: Optional[str] = None
@@ -221,15 +233,40 @@ class CallLogSummary(BaseModel):
     completion_tokens: Optional[int] = None
     total_tokens: Optional[int] = None
     cost: Optional[float] = None
+    requested_model: Optional[str] = None
     provider: Optional[ApiProviderSlim] = None
     api_key: Optional[APIKeySlim] = None
 
     class Config:
         from_attributes = True
 
+class CallLogFilters(BaseModel):
+    """Server-side filters of the call log list; each maps to an indexed column."""
+    is_success: Optional[bool] = None
+    provider_id: Optional[int] = None
+    api_key_id: Optional[int] = None
+    status_code: Optional[int] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    min_latency_ms: Optional[int] = None
+
 class CallLogResponse(BaseModel):
     items: List[CallLogSummary]
     total: int
+    # True when `total` is an estimate (unfiltered) or capped (filtered), see log_count
+    total_is_estimate: bool = False
+    # Cursors: pass as before_id for the next (older) page, after_id for the previous one.
+    # The cursor in the direction just paged is None when the page was short (no more logs that way)
+    next_before_id: Optional[int] = None
+    prev_after_id: Optional[int] = None
+
+class CallLogSearchHit(CallLogSummary):
+    # bm25 score, lower is a better match; snippet marks matches with ** (see log_search)
+    rank: float
+    snippet: Optional[str] = None
+
+class CallLogSearchResponse(BaseModel):
+    items: List[CallLogSearchHit]
 
 # Schemas for OpenAI-compatible model list
 class ModelResponse(BaseModel):
@@ -264,10 +301,19 @@ class GroupSimple(BaseModel):
     class Config:
         from_attributes = True
 
+class ProviderCircuitStatus(BaseModel):
+    provider_id: int
+    state: str  # closed, open, half_open
+    consecutive_failures: int
+    trips: int
+    last_failure_reason: Optional[str] = None
+    retry_after_seconds: Optional[float] = None
+
 class SystemStatusResponse(BaseModel):
     Groups: List[GroupSimple]
     Models: List[ApiProviderSimple]
     Association: List[ProviderConcurrencyStatus]
+    CircuitBreakers: List[ProviderCircuitStatus] = []
 
 # Schemas for Settings
 class SettingBase(BaseModel):
@@ -0,0 +1,129 @@
+"""Incremental parser for upstream Server-Sent Events streams.
+
+Upstream chunks from `aiter_bytes()` do not line up with SSE events: an event
+can span several TCP chunks and one chunk can hold several events. `SSEParser`
+buffers bytes across chunk boundaries and hands out complete events, scanning
+for the blank-line delimiter at the bytes level. Each event keeps its original
+bytes so it can be forwarded untouched; JSON is only decoded on demand, e.g.
+for the final usage chunk or when an event has to be rewritten.
+"""
+import json
+import re
+from typing import Any, List, Optional
+
+# An event ends with a blank line; accept LF, CRLF and CR line endings.
+_EVENT_DELIMITER = re.compile(rb"\r\n\r\n|\n\n|\r\r")
+_LINE_SPLIT = re.compile(rb"\r\n|\n|\r")
+
+_UNPARSED = object()
+
+
+class SSEEvent:
+    __slots__ = ("raw", "data", "event", "_json")
+
+    def __init__(self, raw: bytes, data: Optional[bytes], event: Optional[bytes] = None):
+        self.raw = raw      # the event exactly as received, including its delimiter
+        self.data = data    # joined `data:` field, or None if the event has none
+        self.event = event  # `event:` field, if any
+        self._json = _UNPARSED
+
+    @property
+    def is_done(self) -> bool:
+        """True for OpenAI's `data: [DONE]` terminator."""
+        data = self.data
+        return data is not None and len(data) < 16 and data.strip() == b"[DONE]"
+
+    def json(self) -> Optional[Any]:
+        """Decodes the data field as JSON (cached). Returns None if it is not JSON."""
+        if self._json is _UNPARSED:
+            try:
+                self._json = json.loads(self.data) if self.data and not self.is_done else None
+            except ValueError:
+                self._json = None
+        return self._json
+
+    def has_field(self, name: bytes) -> bool:
+        """Cheap bytes-level check for a JSON key (e.g. b'usage') before parsing."""
+        return self.data is not None and b'"' + name + b'"' in self.data
+
+    def text(self) -> str:
+        return self.raw.decode("utf-8", errors="replace")
+
+
+def _parse_event(raw: bytes) -> SSEEvent:
+    # Fast path for the usual single-line "data: ...\n\n" event
+    if raw.startswith(b"data: ") and raw.endswith(b"\n\n") and raw.find(b"\n", 6) == len(raw) - 2:
+        return SSEEvent(raw, raw[6:-2])
+
+    data_lines = []
+    event_name = None
+    for line in _LINE_SPLIT.split(raw):
+        if not line or line.startswith(b":"):
+            continue  # blank line or comment
+        field, sep, value = line.partition(b":")
+        if sep and value.startswith(b" "):
+            value = value[1:]
+        if field == b"data":
+            data_lines.append(value)
+        elif field == b"event":
+            event_name = value
+    data = b"\n".join(data_lines) if data_lines else None
+    return SSEEvent(raw, data, event_name)
+
+
+class SSEParser:
+    def __init__(self):
+        self._buffer = b""
+        self._crlf = False  # switch to the slower delimiter regex once a CR is seen
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """Adds a chunk and returns the events it completed (possibly none)."""
+        if not chunk:
+            return []
+        # A delimiter may straddle the previous chunk, so re-scan a few bytes back
+        scan_from = max(0, len(self._buffer) - 3)
+        buffer = self._buffer + chunk if self._buffer else chunk
+        if not self._crlf and b"\r" in chunk:
+            self._crlf = True
+
+        events = []
+        start = 0
+        if self._crlf:
+            while True:
+                match = _EVENT_DELIMITER.search(buffer, max(start, scan_from))
+                if match is None:
+                    break
+                end = match.end()
+                events.append(_parse_event(buffer[start:end]))
+                start = end
+        else:
+            find = buffer.find
+            while True:
+                idx = find(b"\n\n", max(start, scan_from))
+                if idx == -1:
+                    break
+                end = idx + 2
+                events.append(_parse_event(buffer[start:end]))
+                start = end
+        self._buffer = buffer[start:] if start else buffer
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """Returns whatever is left in the buffer as a final event (streams that
+        end without a trailing blank line)."""
+        raw, self._buffer = self._buffer, b""
+        if not raw.strip():
+            return []
+        return [_parse_event(raw)]
+
+
+async def aiter_events(byte_iterator):
+    """Yields complete SSE events from an async iterator of bytes (or str) chunks."""
+    parser = SSEParser()
+    async for chunk in byte_iterator:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.flush():
+        yield event
@@ -0,0 +1,479 @@
+"""Pre-aggregated call statistics for the dashboards.
+
+Scanning `call_logs` makes the dashboards slower the more history there is.
+Instead, every batch of call logs also updates `call_stats_rollups`: one row
+per (granularity, bucket, provider, API key, model, endpoint) holding counts,
+token and cost sums and latency / streaming sums. Rows are upserted in the
+same transaction as the logs, so the rollups never disagree with the logs
+that were written. Dashboards read only from here.
+
+Granularities:
+    minute   kept for ROLLUP_MINUTE_RETENTION_HOURS (default 48)
+    hour     kept for ROLLUP_HOUR_RETENTION_DAYS (default 90)
+    day      kept forever; all-time totals are summed from it
+
+Only calls that reached a provider are rolled up (the dashboards never
+counted auth errors). Latency sums cover successful calls only, and the
+streaming sums successful streams with a TTFT (see stream_stats). Model and
+endpoint are those of the provider when the call was made.
+
+For tail latency each row also keeps mergeable quantile sketches (see
+metrics.QuantileSketch) of response time and TTFT. SQL cannot add those up in
+an upsert, so after the counters are upserted the touched rows' sketches are
+read, merged and written back in the same transaction; the upsert has already
+taken SQLite's write lock, so concurrent writers cannot interleave.
+`latency_percentiles` merges the sketches of a time window per provider.
+
+Existing logs are rolled up once by the migration that creates the table
+(see `rebuild`).
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+from sqlalchemy import bindparam, func, select, text, tuple_, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .metrics import QuantileSketch
+
+ROLLUP_MINUTE_RETENTION_HOURS = int(os.getenv("ROLLUP_MINUTE_RETENTION_HOURS", "48"))
+ROLLUP_HOUR_RETENTION_DAYS = int(os.getenv("ROLLUP_HOUR_RETENTION_DAYS", "90"))
+# Pruning piggybacks on log batches, at most this often (seconds)
+_PRUNE_INTERVAL = 600
+
+MINUTE = "minute"
+HOUR = "hour"
+DAY = "day"
+GRANULARITIES = (MINUTE, HOUR, DAY)
+
+# SQLite strftime formats matching how SQLAlchemy stores DateTime values
+_SQL_BUCKET_FORMATS = {
+    MINUTE: "%Y-%m-%d %H:%M:00.000000",
+    HOUR: "%Y-%m-%d %H:00:00.000000",
+    DAY: "%Y-%m-%d 00:00:00.000000",
+}
+
+_SUM_COLUMNS = (
+    "calls", "successes", "prompt_tokens", "completion_tokens", "total_tokens", "cost",
+    "response_time_sum_ms", "response_time_count",
+    "ttft_sum_ms", "ttft_count", "inter_token_mean_sum_ms", "inter_token_p95_sum_ms", "tokens_per_second_sum",
+)
+
+_KEY_COLUMNS = ("granularity", "bucket_start", "provider_id", "api_key_id", "model", "endpoint")
+
+_next_prune = 0.0
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Start of the bucket containing `ts` (naive Taipei local time, like the
+    timestamps SQLite stores)."""
+    ts = ts.replace(tzinfo=None, second=0, microsecond=0)
+    if granularity == MINUTE:
+        return ts
+    ts = ts.replace(minute=0)
+    if granularity == HOUR:
+        return ts
+    return ts.replace(hour=0)
+
+
+def _local_now() -> datetime:
+    return datetime.now(models.TAIPEI_TZ).replace(tzinfo=None)
+
+
+def _log_time(log: schemas.CallLogCreate) -> datetime:
+    ts = log.request_timestamp
+    if ts is None:
+        return _local_now()
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(models.TAIPEI_TZ)
+    return ts.replace(tzinfo=None)
+
+
+def _accumulate(row: dict, log: schemas.CallLogCreate):
+    row["calls"] += 1
+    row["prompt_tokens"] += log.prompt_tokens or 0
+    row["completion_tokens"] += log.completion_tokens or 0
+    row["total_tokens"] += log.total_tokens or 0
+    row["cost"] += log.cost or 0
+    if not log.is_success:
+        return
+    row["successes"] += 1
+    if log.response_time_ms is not None:
+        row["response_time_sum_ms"] += log.response_time_ms
+        row["response_time_count"] += 1
+    if log.ttft_ms is not None:
+        row["ttft_sum_ms"] += log.ttft_ms
+        row["ttft_count"] += 1
+        row["inter_token_mean_sum_ms"] += log.inter_token_mean_ms or 0
+        row["inter_token_p95_sum_ms"] += log.inter_token_p95_ms or 0
+        row["tokens_per_second_sum"] += log.tokens_per_second or 0
+
+
+class _Sketches:
+    """Response time and TTFT sketches of one rollup row."""
+    __slots__ = ("response_time", "ttft")
+
+    def __init__(self, response_time: QuantileSketch = None, ttft: QuantileSketch = None):
+        self.response_time = response_time or QuantileSketch()
+        self.ttft = ttft or QuantileSketch()
+
+    @classmethod
+    def for_key(cls, sketches: Dict[tuple, "_Sketches"], key: tuple) -> "_Sketches":
+        entry = sketches.get(key)
+        if entry is None:
+            entry = sketches[key] = cls()
+        return entry
+
+    def add(self, response_time_ms, ttft_ms):
+        if response_time_ms is not None:
+            self.response_time.add(response_time_ms)
+        if ttft_ms is not None:
+            self.ttft.add(ttft_ms)
+
+    def merge_encoded(self, response_time: bytes, ttft: bytes):
+        self.response_time.merge(QuantileSketch.from_bytes(response_time))
+        self.ttft.merge(QuantileSketch.from_bytes(ttft))
+
+    def encoded(self) -> dict:
+        return {
+            "response_time_sketch": self.response_time.to_bytes() if self.response_time.count else None,
+            "ttft_sketch": self.ttft.to_bytes() if self.ttft.count else None,
+        }
+
+
+def _merge_sketches(db: Session, sketches: Dict[tuple, _Sketches]):
+    """Merges `sketches` into the stored sketches of their (existing) rows."""
+    Rollup = models.CallStatsRollup
+    key_columns = [getattr(Rollup, c) for c in _KEY_COLUMNS]
+    stored = db.query(Rollup.id, *key_columns, Rollup.response_time_sketch, Rollup.ttft_sketch)\
+        .filter(tuple_(*key_columns).in_(list(sketches))).all()
+    updates = []
+    for r in stored:
+        entry = sketches[tuple(getattr(r, c) for c in _KEY_COLUMNS)]
+        entry.merge_encoded(r.response_time_sketch, r.ttft_sketch)
+        updates.append({"id": r.id, **entry.encoded()})
+    if updates:
+        db.execute(update(Rollup), updates)
+
+
+def apply_logs(db: Session, logs: Iterable[schemas.CallLogCreate]):
+    """Adds `logs` to the rollups. Does not commit; the caller commits it
+    together with the logs themselves."""
+    logs = [log for log in logs if log.provider_id]
+    if not logs:
+        return
+    provider_ids = {log.provider_id for log in logs}
+    providers = {
+        r.id: (r.model or "", r.api_endpoint or "")
+        for r in db.query(models.ApiProvider.id, models.ApiProvider.model, models.ApiProvider.api_endpoint)
+                   .filter(models.ApiProvider.id.in_(provider_ids))
+    }
+
+    rows: Dict[tuple, dict] = {}
+    sketches: Dict[tuple, _Sketches] = {}
+    for log in logs:
+        ts = _log_time(log)
+        model, endpoint = providers.get(log.provider_id, ("", ""))
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(ts, granularity), log.provider_id, log.api_key_id or 0, model, endpoint)
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = dict.fromkeys(_SUM_COLUMNS, 0)
+                row.update(zip(_KEY_COLUMNS, key))
+            _accumulate(row, log)
+            if log.is_success:
+                _Sketches.for_key(sketches, key).add(log.response_time_ms, log.ttft_ms)
+
+    table = models.CallStatsRollup.__table__
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(_KEY_COLUMNS),
+        set_={c: table.c[c] + stmt.excluded[c] for c in _SUM_COLUMNS},
+    )
+    db.execute(stmt, list(rows.values()))
+    if sketches:
+        _merge_sketches(db, sketches)
+
+    global _next_prune
+    now = time.monotonic()
+    if now >= _next_prune:
+        _next_prune = now + _PRUNE_INTERVAL
+        prune(db)
+
+
+def prune(db: Session):
+    """Drops minute and hour buckets past their retention. Does not commit."""
+    Rollup = models.CallStatsRollup
+    now = _local_now()
+    db.query(Rollup).filter(
+        Rollup.granularity == MINUTE,
+        Rollup.bucket_start < now - timedelta(hours=ROLLUP_MINUTE_RETENTION_HOURS)
+    ).delete(synchronize_session=False)
+    db.query(Rollup).filter(
+        Rollup.granularity == HOUR,
+        Rollup.bucket_start < now - timedelta(days=ROLLUP_HOUR_RETENTION_DAYS)
+    ).delete(synchronize_session=False)
+
+
+def delete_for_providers(db: Session, provider_ids: List[int]):
+    """Removes the rollups of providers that are being deleted, so totals and
+    percentiles never include a provider that no longer exists. Does not commit."""
+    db.query(models.CallStatsRollup).filter(
+        models.CallStatsRollup.provider_id.in_(provider_ids)
+    ).delete(synchronize_session=False)
+
+
+def rebuild(conn):
+    """Recomputes all rollups from `call_logs` with one INSERT ... SELECT per
+    granularity. Runs on a Core connection (used by the migrations)."""
+    conn.execute(text("DELETE FROM call_stats_rollups"))
+    minute_cutoff = bucket_start(_local_now() - timedelta(hours=ROLLUP_MINUTE_RETENTION_HOURS), MINUTE)
+    hour_cutoff = bucket_start(_local_now() - timedelta(days=ROLLUP_HOUR_RETENTION_DAYS), HOUR)
+    cutoffs = {MINUTE: minute_cutoff, HOUR: hour_cutoff, DAY: None}
+    for granularity in GRANULARITIES:
+        bucket = f"strftime('{_SQL_BUCKET_FORMATS[granularity]}', l.request_timestamp)"
+        cutoff = cutoffs[granularity]
+        where = "l.provider_id IS NOT NULL"
+        params = {"granularity": granularity}
+        if cutoff is not None:
+            where += " AND l.request_timestamp >= :cutoff"
+            params["cutoff"] = cutoff.strftime("%Y-%m-%d %H:%M:%S.%f")
+        conn.execute(text(f"""
+            INSERT INTO call_stats_rollups (
+                granularity, bucket_start, provider_id, api_key_id, model, endpoint,
+                calls, successes, prompt_tokens, completion_tokens, total_tokens, cost,
+                response_time_sum_ms, response_time_count,
+                ttft_sum_ms, ttft_count, inter_token_mean_sum_ms, inter_token_p95_sum_ms, tokens_per_second_sum)
+            SELECT
+                :granularity, {bucket}, l.provider_id, COALESCE(l.api_key_id, 0),
+                COALESCE(p.model, ''), COALESCE(p.api_endpoint, ''),
+                COUNT(*),
+                SUM(CASE WHEN l.is_success THEN 1 ELSE 0 END),
+                COALESCE(SUM(l.prompt_tokens), 0), COALESCE(SUM(l.completion_tokens), 0),
+                COALESCE(SUM(l.total_tokens), 0), COALESCE(SUM(l.cost), 0),
+                COALESCE(SUM(CASE WHEN l.is_success THEN l.response_time_ms END), 0),
+                COUNT(CASE WHEN l.is_success THEN l.response_time_ms END),
+                COALESCE(SUM(CASE WHEN l.is_success THEN l.ttft_ms END), 0),
+                COUNT(CASE WHEN l.is_success THEN l.ttft_ms END),
+                COALESCE(SUM(CASE WHEN l.is_success AND l.ttft_ms IS NOT NULL THEN l.inter_token_mean_ms END), 0),
+                COALESCE(SUM(CASE WHEN l.is_success AND l.ttft_ms IS NOT NULL THEN l.inter_token_p95_ms END), 0),
+                COALESCE(SUM(CASE WHEN l.is_success AND l.ttft_ms IS NOT NULL THEN l.tokens_per_second END), 0)
+            FROM call_logs l
+            LEFT JOIN api_providers p ON p.id = l.provider_id
+            WHERE {where}
+            GROUP BY 2, 3, 4, 5, 6
+        """), params)
+    rebuild_sketches(conn)
+
+
+def rebuild_sketches(conn, chunk_size: int = 5000):
+    """Recomputes the quantile sketches of all rollup rows from `call_logs`,
+    reading the logs in chunks. Rows must already exist (see `rebuild`)."""
+    rollups = models.CallStatsRollup.__table__
+    logs = models.CallLog.__table__
+    providers = models.ApiProvider.__table__
+    row_ids = {
+        tuple(r[1:]): r[0]
+        for r in conn.execute(select(rollups.c.id, *[rollups.c[c] for c in _KEY_COLUMNS]))
+    }
+
+    sketches: Dict[tuple, _Sketches] = {}
+    query = select(
+        logs.c.id, logs.c.request_timestamp, logs.c.provider_id, logs.c.api_key_id,
+        func.coalesce(providers.c.model, ""), func.coalesce(providers.c.api_endpoint, ""),
+        logs.c.response_time_ms, logs.c.ttft_ms
+    ).select_from(logs.outerjoin(providers, providers.c.id == logs.c.provider_id))\
+     .where(logs.c.provider_id.isnot(None), logs.c.is_success == True)\
+     .order_by(logs.c.id).limit(chunk_size)
+    last_id = 0
+    while True:
+        chunk = conn.execute(query.where(logs.c.id > last_id)).all()
+        if not chunk:
+            break
+        for log_id, ts, provider_id, api_key_id, model, endpoint, response_time_ms, ttft_ms in chunk:
+            if ts is None:
+                continue
+            for granularity in GRANULARITIES:
+                key = (granularity, bucket_start(ts, granularity), provider_id, api_key_id or 0, model, endpoint)
+                if key in row_ids:  # minute / hour buckets outside retention have no row
+                    _Sketches.for_key(sketches, key).add(response_time_ms, ttft_ms)
+        last_id = chunk[-1][0]
+
+    updates = [{"row_id": row_ids[key], **entry.encoded()} for key, entry in sketches.items()]
+    if updates:
+        conn.execute(
+            rollups.update().where(rollups.c.id == bindparam("row_id")),
+            updates
+        )
+
+
+# --- Dashboard queries ---
+
+def _avg(total, count, digits: int = 0):
+    if not count:
+        return 0
+    return round(total / count, digits) if digits else round(total / count)
+
+
+def endpoint_name(api_endpoint: str) -> str:
+    try:
+        return urlparse(api_endpoint).netloc or api_endpoint
+    except Exception:
+        return api_endpoint
+
+
+def totals(db: Session) -> dict:
+    """All-time calls, successes, tokens and cost."""
+    Rollup = models.CallStatsRollup
+    r = db.query(
+        func.sum(Rollup.calls).label('calls'),
+        func.sum(Rollup.successes).label('successes'),
+        func.sum(Rollup.total_tokens).label('total_tokens'),
+        func.sum(Rollup.cost).label('cost')
+    ).filter(Rollup.granularity == DAY).first()
+    return {
+        "calls": int(r.calls or 0),
+        "successes": int(r.successes or 0),
+        "total_tokens": int(r.total_tokens or 0),
+        "cost": float(r.cost or 0),
+    }
+
+
+def by_model(db: Session) -> List[dict]:
+    """Per model: calls, average successful response time and cost, sorted by model."""
+    Rollup = models.CallStatsRollup
+    rows = db.query(
+        Rollup.model,
+        func.sum(Rollup.calls).label('calls'),
+        func.sum(Rollup.response_time_sum_ms).label('rt_sum'),
+        func.sum(Rollup.response_time_count).label('rt_count'),
+        func.sum(Rollup.cost).label('cost')
+    ).filter(Rollup.granularity == DAY, Rollup.model != "")\
+     .group_by(Rollup.model).order_by(Rollup.model).all()
+    return [{
+        "model": r.model,
+        "calls": int(r.calls or 0),
+        "avg_time_ms": _avg(r.rt_sum or 0, r.rt_count),
+        "successful_calls_with_time": int(r.rt_count or 0),
+        "cost": round(r.cost or 0, 4),
+    } for r in rows]
+
+
+def by_endpoint(db: Session) -> List[dict]:
+    """Per endpoint host: calls, success rate and average successful response
+    time, sorted by host."""
+    Rollup = models.CallStatsRollup
+    rows = db.query(
+        Rollup.endpoint,
+        func.sum(Rollup.calls).label('calls'),
+        func.sum(Rollup.successes).label('successes'),
+        func.sum(Rollup.response_time_sum_ms).label('rt_sum'),
+        func.sum(Rollup.response_time_count).label('rt_count')
+    ).filter(Rollup.granularity == DAY).group_by(Rollup.endpoint).all()
+
+    merged: Dict[str, list] = {}
+    for r in rows:
+        entry = merged.setdefault(endpoint_name(r.endpoint), [0, 0, 0, 0])
+        entry[0] += int(r.calls or 0)
+        entry[1] += int(r.successes or 0)
+        entry[2] += r.rt_sum or 0
+        entry[3] += int(r.rt_count or 0)
+    return [{
+        "name": name,
+        "calls": calls,
+        "success_rate": round(successes / calls * 100) if calls else 0,
+        "avg_time_ms": _avg(rt_sum, rt_count),
+        "successful_calls_with_time": rt_count,
+    } for name, (calls, successes, rt_sum, rt_count) in sorted(merged.items())]
+
+
+def daily_calls(db: Session, days: int = 7) -> dict:
+    """Calls per day for the last `days` days (oldest first, zero-filled)."""
+    Rollup = models.CallStatsRollup
+    start = bucket_start(_local_now() - timedelta(days=days - 1), DAY)
+    rows = db.query(Rollup.bucket_start, func.sum(Rollup.calls).label('calls'))\
+        .filter(Rollup.granularity == DAY, Rollup.bucket_start >= start)\
+        .group_by(Rollup.bucket_start).all()
+    counts = {r.bucket_start.strftime('%Y-%m-%d'): int(r.calls or 0) for r in rows}
+    dates = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+    return {"dates": dates, "values": [counts.get(d, 0) for d in dates]}
+
+
+def stream_stats_by_provider(db: Session) -> List[dict]:
+    """Per provider: averages of TTFT, inter-token gaps and tokens/s over
+    successful streams, sorted by provider name."""
+    Rollup = models.CallStatsRollup
+    rows = db.query(
+        models.ApiProvider.name,
+        func.sum(Rollup.ttft_count).label('streams'),
+        func.sum(Rollup.ttft_sum_ms).label('ttft'),
+        func.sum(Rollup.inter_token_mean_sum_ms).label('gap_mean'),
+        func.sum(Rollup.inter_token_p95_sum_ms).label('gap_p95'),
+        func.sum(Rollup.tokens_per_second_sum).label('tps')
+    ).join(models.ApiProvider, Rollup.provider_id == models.ApiProvider.id)\
+     .filter(Rollup.granularity == DAY, Rollup.ttft_count > 0)\
+     .group_by(models.ApiProvider.name).order_by(models.ApiProvider.name).all()
+    return [{
+        "name": r.name,
+        "streams": int(r.streams),
+        "ttft_ms": _avg(r.ttft, r.streams),
+        "inter_token_mean_ms": _avg(r.gap_mean, r.streams, 1),
+        "inter_token_p95_ms": _avg(r.gap_p95, r.streams, 1),
+        "tokens_per_second": _avg(r.tps, r.streams, 1),
+    } for r in rows]
+
+
+LATENCY_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def _granularity_for_window(hours: Optional[float]) -> str:
+    """Finest granularity still retained for the whole window."""
+    if hours is None:
+        return DAY
+    if hours <= min(6, ROLLUP_MINUTE_RETENTION_HOURS):
+        return MINUTE
+    if hours <= ROLLUP_HOUR_RETENTION_DAYS * 24:
+        return HOUR
+    return DAY
+
+
+def latency_percentiles(db: Session, window_hours: Optional[float] = 24) -> List[dict]:
+    """p50 / p90 / p99 / p99.9 of successful response time and stream TTFT per
+    provider over the last `window_hours` (all time if None), merged from the
+    rollup sketches. Sorted by provider name."""
+    Rollup = models.CallStatsRollup
+    granularity = _granularity_for_window(window_hours)
+    query = db.query(Rollup.provider_id, Rollup.response_time_sketch, Rollup.ttft_sketch)\
+        .filter(Rollup.granularity == granularity)
+    if window_hours is not None:
+        query = query.filter(Rollup.bucket_start >= bucket_start(_local_now() - timedelta(hours=window_hours), granularity))
+
+    merged: Dict[int, _Sketches] = {}
+    for provider_id, response_time, ttft in query:
+        if response_time is None and ttft is None:
+            continue
+        _Sketches.for_key(merged, provider_id).merge_encoded(response_time, ttft)
+    if not merged:
+        return []
+
+    names = dict(db.query(models.ApiProvider.id, models.ApiProvider.name)
+                 .filter(models.ApiProvider.id.in_(list(merged))).all())
+
+    def summarize(sketch: QuantileSketch) -> dict:
+        result = {"count": sketch.count}
+        for q in LATENCY_QUANTILES:
+            value = sketch.quantile(q)
+            result[f"p{q * 100:g}"] = round(value) if value is not None else None
+        return result
+
+    rows = [{
+        "provider_id": provider_id,
+        "name": names.get(provider_id, str(provider_id)),
+        "response_time_ms": summarize(entry.response_time),
+        "ttft_ms": summarize(entry.ttft),
+    } for provider_id, entry in merged.items()]
+    return sorted(rows, key=lambda r: r["name"])
@@ -0,0 +1,71 @@
+"""Time-to-first-token and inter-token timing for streamed chat completions.
+
+`response_time_ms` of a stream is the time until its last byte, which mixes
+how fast a provider starts answering with how long the answer is. For chat
+UX what matters is time to first token (TTFT) and how smoothly tokens follow.
+`StreamStats` is fed every upstream SSE event and tracks:
+
+    ttft_ms               request start -> first event carrying content
+    inter_token_mean_ms   mean gap between consecutive content events
+    inter_token_p95_ms    95th percentile of those gaps
+    tokens_per_second     completion tokens / (end - first content event)
+
+A "content event" is a chunk whose `delta.content` or `delta.reasoning_content`
+is a non-empty string; it is detected at the bytes level, so events are not
+decoded for this. Upstreams usually send one token per chunk; when they batch,
+the gaps are per chunk rather than per token.
+"""
+import re
+import time
+from typing import List, Optional
+
+from .sse import SSEEvent
+
+_CONTENT_FIELD = re.compile(rb'"(?:reasoning_)?content"\s*:\s*"(?!")')
+
+
+class StreamStats:
+    __slots__ = ("started", "first_content", "last_content", "_gaps")
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.time()
+        self.first_content: Optional[float] = None
+        self.last_content: Optional[float] = None
+        self._gaps: List[float] = []
+
+    def feed(self, event: SSEEvent, now: Optional[float] = None):
+        data = event.data
+        if data is None or _CONTENT_FIELD.search(data) is None:
+            return
+        if now is None:
+            now = time.time()
+        if self.first_content is None:
+            self.first_content = now
+        else:
+            self._gaps.append(now - self.last_content)
+        self.last_content = now
+
+    @property
+    def ttft_ms(self) -> Optional[int]:
+        if self.first_content is None:
+            return None
+        return int((self.first_content - self.started) * 1000)
+
+    def summary(self, completion_tokens: Optional[int] = None, ended: Optional[float] = None) -> dict:
+        """Values for the matching CallLog columns. Without upstream usage the
+        number of content events stands in for the completion tokens."""
+        result = {"ttft_ms": self.ttft_ms, "inter_token_mean_ms": None,
+                  "inter_token_p95_ms": None, "tokens_per_second": None}
+        gaps = self._gaps
+        if gaps:
+            ordered = sorted(gaps)
+            result["inter_token_mean_ms"] = round(sum(gaps) / len(gaps) * 1000, 2)
+            result["inter_token_p95_ms"] = round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2)
+        if self.first_content is not None:
+            if ended is None:
+                ended = time.time()
+            generation = ended - self.first_content
+            tokens = completion_tokens if completion_tokens else len(gaps) + 1
+            if generation > 0:
+                result["tokens_per_second"] = round(tokens / generation, 2)
+        return result
@@ -0,0 +1,208 @@
+"""Removal of <think>...</think> reasoning blocks from model output.
+
+`ThinkFilter` is a small state machine over plain text (the parsed
+`delta.content` of each event, not raw SSE bytes). It carries its state across
+calls, so a tag split over several events - or a block spanning hundreds of
+events - is handled, and it holds back only the few characters that could be
+the start of a tag.
+
+`ThinkStreamFilter` applies it to an OpenAI chat completion SSE stream: events
+that cannot contain a tag while no block is open are forwarded as the original
+bytes; only events whose content changes are re-serialized.
+
+`strip_think_tags` is the one-shot variant used by `sanitize_openai_response`.
+"""
+import json
+import re
+from typing import Dict, Optional
+
+from .sse import SSEEvent
+
+OPEN_TAG = "<think>"
+CLOSE_TAG = "</think>"
+
+# Delta fields that keep an event alive even when its content is hidden
+_NON_CONTENT_MARKERS = (b'"role"', b'"tool_calls"', b'"function_call"', b'"usage"', b'"reasoning_content"')
+_FINISH_REASON_SET = re.compile(rb'"finish_reason"\s*:\s*"')
+
+
+def _partial_tag_suffix(text: str, start: int, tag: str) -> int:
+    """Length of the longest suffix of text[start:] that is a proper prefix of `tag`."""
+    window_start = max(start, len(text) - len(tag) + 1)
+    # Tags contain a single '<', so only the last '<' can start a partial tag
+    i = text.rfind("<", window_start)
+    if i != -1 and tag.startswith(text[i:]):
+        return len(text) - i
+    return 0
+
+
+class ThinkFilter:
+    __slots__ = ("in_think", "_pending", "_after_block")
+
+    def __init__(self):
+        self.in_think = False
+        self._pending = ""        # possible start of a tag, held back until resolved
+        self._after_block = False  # drop whitespace right after a closed block
+
+    @property
+    def idle(self) -> bool:
+        """True when the next text passes through unchanged unless it contains '<'."""
+        return not self.in_think and not self._pending and not self._after_block
+
+    def feed(self, text: str) -> str:
+        """Returns the visible part of `text`."""
+        if not text:
+            return ""
+        if self.idle and "<" not in text:
+            return text
+        if self._pending:
+            text = self._pending + text
+            self._pending = ""
+
+        out = []
+        pos = 0
+        length = len(text)
+        while pos < length:
+            if self.in_think:
+                idx = text.find(CLOSE_TAG, pos)
+                if idx == -1:
+                    keep = _partial_tag_suffix(text, pos, CLOSE_TAG)
+                    if keep:
+                        self._pending = text[length - keep:]
+                    break
+                pos = idx + len(CLOSE_TAG)
+                self.in_think = False
+                self._after_block = True
+            else:
+                idx = text.find(OPEN_TAG, pos)
+                end = idx if idx != -1 else length
+                if idx == -1:
+                    keep = _partial_tag_suffix(text, pos, OPEN_TAG)
+                    if keep:
+                        end = length - keep
+                        self._pending = text[end:]
+                visible = text[pos:end]
+                if self._after_block and visible:
+                    visible = visible.lstrip()
+                    if visible:
+                        self._after_block = False
+                if visible:
+                    out.append(visible)
+                if idx == -1:
+                    break
+                pos = idx + len(OPEN_TAG)
+                self.in_think = True
+        return "".join(out)
+
+    def flush(self) -> str:
+        """Ends the stream: a held-back partial tag outside a block was just text."""
+        pending, self._pending = self._pending, ""
+        if self.in_think:
+            return ""
+        if self._after_block:
+            pending = pending.lstrip()
+        return pending
+
+
+def strip_think_tags(text: str) -> str:
+    """Removes complete and unterminated <think> blocks from a full text."""
+    if not text or "<think>" not in text:
+        return text
+    f = ThinkFilter()
+    return (f.feed(text) + f.flush()).strip()
+
+
+class ThinkStreamFilter:
+    """Filters think blocks out of an OpenAI-style chat completion SSE stream."""
+
+    def __init__(self):
+        self._filters: Dict[int, ThinkFilter] = {}
+        self._template: Optional[dict] = None
+
+    def _filter_for(self, index: int) -> ThinkFilter:
+        f = self._filters.get(index)
+        if f is None:
+            f = self._filters[index] = ThinkFilter()
+        return f
+
+    def _all_idle(self) -> bool:
+        for f in self._filters.values():
+            if not f.idle:
+                return False
+        return True
+
+    def _inside_block_only(self, data: bytes) -> bool:
+        """True if `data` is a single-choice content delta while that choice is
+        inside a think block with nothing held back, so the whole event is hidden."""
+        if len(self._filters) != 1:
+            return False
+        f = next(iter(self._filters.values()))
+        if not f.in_think or f._pending:
+            return False
+        for marker in _NON_CONTENT_MARKERS:
+            if marker in data:
+                return False
+        return _FINISH_REASON_SET.search(data) is None
+
+    def process(self, event: SSEEvent) -> Optional[bytes]:
+        """Returns the bytes to forward for `event` (None to drop it)."""
+        data = event.data
+        if event.is_done:
+            # Release held-back text before the terminator
+            tail = self.finish()
+            return tail + event.raw if tail else event.raw
+        if data is None:
+            return event.raw
+        # Some upstreams JSON-escape '<' as \u003c, so look for that too.
+        may_have_tag = b"<" in data or b"\\u003c" in data or b"\\u003C" in data
+        if not may_have_tag:
+            # Fast path: nothing open and no tag in this event - forward as is.
+            if self._all_idle():
+                return event.raw
+            # Fast path: plain content inside an open block - drop it unparsed.
+            if self._inside_block_only(data):
+                return None
+
+        payload = event.json()
+        if not isinstance(payload, dict) or not isinstance(payload.get("choices"), list):
+            return event.raw
+        self._template = payload
+
+        changed = False
+        keep_event = False
+        for choice in payload["choices"]:
+            delta = choice.get("delta") if isinstance(choice, dict) else None
+            if not isinstance(delta, dict) or not isinstance(delta.get("content"), str):
+                keep_event = True
+                continue
+            original = delta["content"]
+            visible = self._filter_for(choice.get("index", 0)).feed(original)
+            if visible != original:
+                delta["content"] = visible
+                changed = True
+            # An event is still worth sending if it carries anything besides empty content
+            if visible or choice.get("finish_reason") is not None or any(k != "content" for k in delta):
+                keep_event = True
+        if payload.get("usage"):
+            keep_event = True
+
+        if not changed:
+            return event.raw
+        if not keep_event:
+            return None
+        return b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n"
+
+    def finish(self) -> Optional[bytes]:
+        """Emits text held back at the end of the stream (an unfinished '<thi...'
+        that turned out not to be a tag), as one extra chunk."""
+        choices = []
+        for index, f in self._filters.items():
+            rest = f.flush()
+            if rest:
+                choices.append({"index": index, "delta": {"content": rest}, "finish_reason": None})
+        if not choices:
+            return None
+        template = self._template or {}
+        payload = {k: template[k] for k in ("id", "object", "created", "model") if k in template}
+        payload["choices"] = choices
+        return b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n"
@@ -1,13 +1,14 @@
 from nicegui import ui
 from sqlalchemy.orm import Session
 from .. import crud, schemas
+from ..api_key_usage import api_key_usage
 from ..language import get_text
 from .common import loading_animation
 
 def render_api_keys(db: Session, container: ui.element, panel: ui.tab_panel):
     def get_all_api_keys():
         db.expire_all()
-        keys = crud.get_api_keys(db)
+        keys = crud.get_api_keys(db, live_last_used=api_key_usage.snapshot())
         return [{
             "id": key.id,
             "name": key.name or "",
@@ -15,7 +16,7 @@ def render_api_keys(db: Session, container: ui.element, panel: ui.tab_panel):
             "key": key.key,
             "is_active": key.is_active,
             "created_at": key.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            "last_used_at": key.last_used_at.strftime("%Y-%m-%d %H:%M:%S") if key.last_used_at else get_text('never'),
+            "last_used_at": key.live_last_used_at.strftime("%Y-%m-%d %H:%M:%S") if key.live_last_used_at else get_text('never'),
             "groups": ", ".join([g.name for g in key.groups]),
             "group_ids": [g.id for g in key.groups],
             "call_count": key.call_count
@@ -1,9 +1,6 @@
 from nicegui import ui
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-import pytz
-from urllib.parse import urlparse
-from .. import crud, models
+from .. import dashboard_data
 from ..language import get_text
 from .common import loading_animation
 
@@ -17,41 +14,30 @@ def render_dashboard(db: Session, container: ui.element, panel: ui.tab_panel):
                     ui.label(label).classes('text-xs text-slate-500 font-medium')
                     ui.label(value).classes('text-2xl font-bold text-slate-800')
 
-    def build_dashboard_content():
+    def build_dashboard_content(data: dict):
         with container:
             with ui.row().classes('w-full items-center mb-4'):
                 ui.label(get_text('dashboard')).classes('text-h6')
                 ui.space()
-                ui.button(get_text('refresh_data'), on_click=refresh_dashboard, icon='refresh', color='primary').props('flat')
+                ui.button(get_text('refresh_data'), on_click=lambda: refresh_dashboard(force=True), icon='refresh', color='primary').props('flat')
             
             with ui.element('div').classes('flex flex-wrap w-full gap-6'):
                 # Quick Stats
                 with ui.row().classes('w-full gap-6 mb-2'):
-                    db.expire_all()
-                    # 只統計有分配到 provider 的請求
-                    logs_recent = [l for l in crud.get_call_logs(db, limit=10000) if l.provider_id is not None]
-                    total_calls = len(logs_recent)
-                    success_rate = sum(1 for l in logs_recent if l.is_success) / total_calls * 100 if total_calls > 0 else 0
-                    total_tokens = sum(l.total_tokens or 0 for l in logs_recent)
+                    # 所有圖表共用 dashboard_data 一次算出的數據，只統計有分配到 provider 的請求
+                    summary = data['summary']
+                    total_calls = summary['total_calls']
                     
                     stat_card(get_text('api_calls'), str(total_calls), 'bolt', 'blue')
-                    stat_card(get_text('api_call_success_rate'), f'{success_rate:.1f}%', 'check_circle', 'green')
-                    stat_card(get_text('total_tokens'), f'{total_tokens:,}', 'toll', 'orange')
-                    stat_card(get_text('api_keys'), str(len(crud.get_api_keys(db))), 'vpn_key', 'purple')
+                    stat_card(get_text('api_call_success_rate'), f"{summary['success_rate']:.1f}%", 'check_circle', 'green')
+                    stat_card(get_text('total_tokens'), f"{summary['total_tokens']:,}", 'toll', 'orange')
+                    stat_card(get_text('api_keys'), str(summary['api_keys']), 'vpn_key', 'purple')
 
                 # Chart 1: Model Usage Distribution
                 with ui.element('div').classes('w-full md:w-[calc(50%-0.75rem)] glass-card p-6'):
                     ui.label(get_text('model_usage_distribution')).classes('text-lg font-bold text-slate-700 mb-4')
                     with ui.element('div').classes('w-full h-64'):
-                        db.expire_all()
-                        logs = [l for l in crud.get_call_logs(db, limit=10000) if l.provider_id is not None]
-                        model_counts = {}
-                        for log in logs:
-                            if log.provider and log.provider.model:
-                                model_name = log.provider.model
-                                model_counts[model_name] = model_counts.get(model_name, 0) + 1
-                        
-                        chart_data = [{'name': k, 'value': v} for k,v in model_counts.items()]
+                        chart_data = data['model_distribution']
                         if chart_data:
                             ui.echart({
                                 'tooltip': {'trigger': 'item'},
@@ -78,20 +64,9 @@ def render_dashboard(db: Session, container: ui.element, panel: ui.tab_panel):
                 with ui.element('div').classes('w-full md:w-[calc(50%-0.75rem)] glass-card p-6'):
                     ui.label(get_text('daily_api_calls')).classes('text-lg font-bold text-slate-700 mb-4')
                     with ui.element('div').classes('w-full h-64'):
-                        TAIPEI_TZ = pytz.timezone('Asia/Taipei')
-                        logs = [l for l in crud.get_call_logs(db, limit=10000) if l.provider_id is not None]
-                        daily_counts = {}
-                        for i in range(7):
-                            date = (datetime.now(TAIPEI_TZ) - timedelta(days=i)).strftime('%Y-%m-%d')
-                            daily_counts[date] = 0
-                        
-                        for log in logs:
-                            date_str = log.request_timestamp.astimezone(TAIPEI_TZ).strftime('%Y-%m-%d')
-                            if date_str in daily_counts:
-                                daily_counts[date_str] += 1
-                        
-                        sorted_dates = sorted(daily_counts.keys())
-                        chart_data = [daily_counts[d] for d in sorted_dates]
+                        daily = data['daily_calls']
+                        sorted_dates = daily['dates']
+                        chart_data = daily['values']
 
                         if any(c > 0 for c in chart_data):
                             ui.echart({
@@ -106,11 +81,10 @@ def render_dashboard(db: Session, container: ui.element, panel: ui.tab_panel):
                 with ui.element('div').classes('w-full md:w-[calc(50%-0.75rem)] border rounded-lg p-4 shadow-md bg-white'):
                     ui.label(get_text('api_call_success_rate')).classes('text-h6')
                     with ui.element('div').classes('w-full h-64'):
-                        logs = [l for l in crud.get_call_logs(db, limit=10000) if l.provider_id is not None]
-                        success_count = sum(1 for log in logs if log.is_success)
-                        failure_count = len(logs) - success_count
+                        success_count = summary['success_calls']
+                        failure_count = total_calls - success_count
                         
-                        if logs:
+                        if total_calls:
                             ui.echart({
                                 'tooltip': {'trigger': 'item'},
                                 'legend': {'top': '5%', 'left': 'center'},
@@ -136,18 +110,10 @@ def render_dashboard(db: Session, container: ui.element, panel: ui.tab_panel):
                 with ui.element('div').classes('w-full md:w-[calc(50%-0.75rem)] border rounded-lg p-4 shadow-md bg-white'):
                     ui.label(get_text('avg_response_time_ms')).classes('text-h6')
                     with ui.element('div').classes('w-full h-64'):
-                        logs = crud.get_call_logs(db, limit=None)
-                        model_times = {}
-                        model_counts = {}
-                        for log in logs:
-                            if log.is_success and log.response_time_ms is not None:
-                                model = log.provider.model
-                                model_times[model] = model_times.get(model, 0) + log.response_time_ms
-                                model_counts[model] = model_counts.get(model, 0) + 1
-                        
-                        avg_times = {m: model_times[m]/model_counts[m] for m in model_times}
-                        sorted_models = sorted(avg_times.keys())
-                        chart_data = [round(avg_times[m]) for m in sorted_models]
+                        # Models without successful timed calls average to 0; leave them out
+                        timed_models = [(m, t) for m, t in zip(data['model_stats']['names'], data['model_stats']['avg_times']) if t]
+                        sorted_models = [m for m, _ in timed_models]
+                        chart_data = [t for _, t in timed_models]
 
                         if chart_data:
                             ui.echart({
@@ -163,24 +129,9 @@ def render_dashboard(db: Session, container: ui.element, panel: ui.tab_panel):
                 with ui.element('div').classes('w-full md:w-[calc(50%-0.75rem)] border rounded-lg p-4 shadow-md bg-white'):
                     ui.label(get_text('api_endpoint_success_rate')).classes('text-h6')
                     with ui.element('div').classes('w-full h-64'):
-                        logs = crud.get_call_logs(db, limit=None)
-                        endpoint_stats = {}
-                        for log in logs:
-                            if log.provider:
-                                try:
-                                    parsed_url = urlparse(log.provider.api_endpoint)
-                                    endpoint = parsed_url.netloc
-                                except Exception:
-                                    endpoint = log.provider.api_endpoint
-                                if endpoint not in endpoint_stats:
-                                    endpoint_stats[endpoint] = {'success': 0, 'total': 0}
-                                endpoint_stats[endpoint]['total'] += 1
-                                if log.is_success:
-                                    endpoint_stats[endpoint]['success'] += 1
-                        
-                        endpoint_rates = {e: (s['success']/s['total'])*100 for e, s in endpoint_stats.items() if s['total'] > 0}
-                        sorted_endpoints = sorted(endpoint_rates.keys())
-                        chart_data = [round(endpoint_rates[e]) for e in sorted_endpoints]
+                        endpoint_stats = data['endpoint_stats']
+                        sorted_endpoints = endpoint_stats['names']
+                        chart_data = endpoint_stats['success_rates']
                         if chart_data:
                             ui.echart({
                                 'xAxis': {'type': 'category', 'data': sorted_endpoints, 'axisLabel': {'interval': 0, 'rotate': 15}},
@@ -195,22 +146,9 @@ def render_dashboard(db: Session, container: ui.element, panel: ui.tab_panel):
                 with ui.element('div').classes('w-full md:w-[calc(50%-0.75rem)] border rounded-lg p-4 shadow-md bg-white'):
                     ui.label(get_text('avg_response_time_by_endpoint_ms')).classes('text-h6')
                     with ui.element('div').classes('w-full h-64'):
-                        logs = crud.get_call_logs(db, limit=None)
-                        endpoint_times = {}
-                        endpoint_counts = {}
-                        for log in logs:
-                            if log.provider and log.is_success and log.response_time_ms is not None:
-                                try:
-                                    parsed_url = urlparse(log.provider.api_endpoint)
-                                    endpoint = parsed_url.netloc
-                                except Exception:
-                                    endpoint = log.provider.api_endpoint
-                                endpoint_times[endpoint] = endpoint_times.get(endpoint, 0) + log.response_time_ms
-                                endpoint_counts[endpoint] = endpoint_counts.get(endpoint, 0) + 1
-                        
-                        avg_times = {e: endpoint_times[e]/endpoint_counts[e] for e in endpoint_times}
-                        sorted_endpoints = sorted(avg_times.keys())
-                        chart_data = [round(avg_times[e]) for e in sorted_endpoints]
+                        timed_endpoints = [(e, t) for e, t in zip(endpoint_stats['names'], endpoint_stats['avg_times']) if t]
+                        sorted_endpoints = [e for e, _ in timed_endpoints]
+                        chart_data = [t for _, t in timed_endpoints]
                         if chart_data:
                             ui.echart({
                                 'xAxis': {'type': 'category', 'data': sorted_endpoints, 'axisLabel': {'interval': 0, 'rotate': 15}},
@@ -225,18 +163,8 @@ def render_dashboard(db: Session, container: ui.element, panel: ui.tab_panel):
                 with ui.element('div').classes('w-full md:w-[calc(50%-0.75rem)] border rounded-lg p-4 shadow-md bg-white'):
                     ui.label(get_text('total_api_calls_by_endpoint')).classes('text-h6')
                     with ui.element('div').classes('w-full h-64'):
-                        logs = crud.get_call_logs(db, limit=None)
-                        endpoint_counts = {}
-                        for log in logs:
-                            if log.provider:
-                                try:
-                                    parsed_url = urlparse(log.provider.api_endpoint)
-                                    endpoint = parsed_url.netloc
-                                except Exception:
-                                    endpoint = log.provider.api_endpoint
-                                endpoint_counts[endpoint] = endpoint_counts.get(endpoint, 0) + 1
-                        sorted_endpoints = sorted(endpoint_counts.keys())
-                        chart_data = [endpoint_counts[e] for e in sorted_endpoints]
+                        sorted_endpoints = endpoint_stats['names']
+                        chart_data = endpoint_stats['total_calls']
                         if chart_data:
                             ui.echart({
                                 'xAxis': {'type': 'category', 'data': sorted_endpoints, 'axisLabel': {'interval': 0, 'rotate': 15}},
@@ -251,14 +179,9 @@ def render_dashboard(db: Session, container: ui.element, panel: ui.tab_panel):
                 with ui.element('div').classes('w-full md:w-[calc(50%-0.75rem)] border rounded-lg p-4 shadow-md bg-white'):
                     ui.label(get_text('total_cost_by_model')).classes('text-h6')
                     with ui.element('div').classes('w-full h-64'):
-                        logs = crud.get_call_logs(db, limit=None)
-                        model_costs = {}
-                        for log in logs:
-                            if log.provider and log.provider.model and log.cost is not None:
-                                model_name = log.provider.model
-                                model_costs[model_name] = model_costs.get(model_name, 0) + log.cost
-                        sorted_models = sorted(model_costs.keys())
-                        chart_data = [round(model_costs[m], 4) for m in sorted_models]
+                        costed_models = [(m, c) for m, c in zip(data['cost_stats']['names'], data['cost_stats']['values']) if c]
+                        sorted_models = [m for m, _ in costed_models]
+                        chart_data = [c for _, c in costed_models]
                         if chart_data:
                             ui.echart({
                                 'xAxis': {'type': 'category', 'data': sorted_models, 'axisLabel': {'interval': 0, 'rotate': 30}},
@@ -269,11 +192,59 @@ def render_dashboard(db: Session, container: ui.element, panel: ui.tab_panel):
                         else:
                             ui.label(get_text('no_cost_data')).classes('flex-center')
 
-    async def refresh_dashboard():
+                # Chart 9: Streaming Performance by Provider (TTFT / inter-token gap / tokens per second)
+                with ui.element('div').classes('w-full md:w-[calc(50%-0.75rem)] border rounded-lg p-4 shadow-md bg-white'):
+                    ui.label(get_text('streaming_performance_by_provider')).classes('text-h6')
+                    with ui.element('div').classes('w-full h-64'):
+                        stream_stats = data['stream_stats']
+                        if stream_stats['names']:
+                            ui.echart({
+                                'legend': {'top': 0},
+                                'xAxis': {'type': 'category', 'data': stream_stats['names'], 'axisLabel': {'interval': 0, 'rotate': 30}},
+                                'yAxis': [{'type': 'value', 'name': 'ms'}, {'type': 'value', 'name': 'tok/s'}],
+                                'series': [
+                                    {'name': get_text('avg_ttft_ms'), 'data': stream_stats['ttft_ms'], 'type': 'bar', 'itemStyle': {'color': '#2F6BFF'}},
+                                    {'name': get_text('inter_token_p95_ms'), 'data': stream_stats['inter_token_p95_ms'], 'type': 'bar', 'itemStyle': {'color': '#F59E0B'}},
+                                    {'name': get_text('tokens_per_second'), 'data': stream_stats['tokens_per_second'], 'type': 'line', 'yAxisIndex': 1, 'itemStyle': {'color': '#14B8A6'}},
+                                ],
+                                'tooltip': {'trigger': 'axis'}
+                            })
+                        else:
+                            ui.label(get_text('no_streaming_data')).classes('flex-center')
+
+                # Chart 10: Response Time Percentiles by Provider (last 24h, from the rollup sketches)
+                with ui.element('div').classes('w-full md:w-[calc(50%-0.75rem)] border rounded-lg p-4 shadow-md bg-white'):
+                    ui.label(get_text('latency_percentiles_by_provider')).classes('text-h6')
+                    with ui.element('div').classes('w-full h-64'):
+                        latency_rows = [r for r in data['latency_percentiles'] if r['response_time_ms']['count']]
+                        if latency_rows:
+                            colors = {'p50': '#14B8A6', 'p90': '#2F6BFF', 'p99': '#F59E0B', 'p99.9': '#EF4444'}
+                            ui.echart({
+                                'legend': {'top': 0},
+                                'xAxis': {'type': 'category', 'data': [r['name'] for r in latency_rows], 'axisLabel': {'interval': 0, 'rotate': 30}},
+                                'yAxis': {'type': 'value', 'name': 'ms'},
+                                'series': [
+                                    {'name': p, 'data': [r['response_time_ms'][p] for r in latency_rows], 'type': 'bar', 'itemStyle': {'color': color}}
+                                    for p, color in colors.items()
+                                ],
+                                'tooltip': {'trigger': 'axis'}
+                            })
+                        else:
+                            ui.label(get_text('no_successful_calls_with_response_time')).classes('flex-center')
+
+    async def refresh_dashboard(force: bool = False, notify: bool = True):
         async with loading_animation():
+            if force:
+                dashboard_data.invalidate()
+            data = await dashboard_data.get_async()
             container.clear()
-            build_dashboard_content()
-        ui.notify(get_text('dashboard_refreshed'), color='positive')
+            build_dashboard_content(data)
+        if notify:
+            ui.notify(get_text('dashboard_refreshed'), color='positive')
 
     panel.on('show', refresh_dashboard)
-    build_dashboard_content()
\ No newline at end of file
+    # 首次渲染先顯示佔位，數據在資料庫線程池中計算，避免卡住事件循環 (代理請求也在其上)
+    with container:
+        with ui.row().classes('w-full justify-center p-8'):
+            ui.spinner(size='lg')
+    ui.timer(0.1, lambda: refresh_dashboard(notify=False), once=True)
@@ -2,8 +2,12 @@ from nicegui import ui
 from sqlalchemy.orm import Session
 from .. import crud, models, schemas
 from ..language import get_text
+from ..load_balancer import ROUTING_STRATEGIES
 from .common import loading_animation
 
+def strategy_options():
+    return {s: get_text(f'strategy_{s}') for s in ROUTING_STRATEGIES}
+
 def render_groups(db: Session, container: ui.element, panel: ui.tab_panel):
     def get_groups_with_providers():
         db.commit() # 結束當前事務，確保讀取到最新數據
@@ -15,7 +19,7 @@ def render_groups(db: Session, container: ui.element, panel: ui.tab_panel):
         for group in groups:
             associations = db.query(models.ProviderGroupAssociation).filter_by(group_id=group.id).all()
             group_providers = {assoc.provider_id: {"priority": assoc.priority} for assoc in associations}
-            group_data.append({'id': group.id, 'name': group.name, 'providers': group_providers})
+            group_data.append({'id': group.id, 'name': group.name, 'routing_strategy': group.routing_strategy or 'priority', 'providers': group_providers})
         return group_data, providers_dicts
 
     def build_groups_view():
@@ -32,7 +36,9 @@ def render_groups(db: Session, container: ui.element, panel: ui.tab_panel):
                         ui.label(group['name']).classes('text-h6')
                         ui.label(f"{get_text('id')}: {group['id']} | {len(group['providers'])} {get_text('providers')}").classes('text-caption text-gray-500')
                     ui.space()
-                    with ui.row().classes('gap-2'):
+                    with ui.row().classes('gap-2 items-center'):
+                        ui.select(strategy_options(), value=group['routing_strategy'], label=get_text('routing_strategy'),
+                                  on_change=lambda e, g=group: handle_strategy_change(g, e.value)).props('dense outlined').classes('min-w-[220px]')
                         ui.button(get_text('manage_providers'), icon='settings', on_click=lambda g=group: open_manage_dialog(g)).props('outline color="primary"')
                         ui.button(icon='delete', on_click=lambda g=group: open_delete_group_dialog(g['id'], g['name']), color='negative').props('flat round')
                 if group['providers']:
@@ -115,6 +121,12 @@ def render_groups(db: Session, container: ui.element, panel: ui.tab_panel):
                 ui.button(get_text('save'), on_click=save_management, color='primary').props('unelevated')
         manage_dialog.open()
 
+    def handle_strategy_change(group, value):
+        if not value or value == group['routing_strategy']: return
+        crud.update_group(db, group['id'], {'routing_strategy': value})
+        group['routing_strategy'] = value
+        ui.notify(get_text('routing_strategy_updated').format(name=group['name']), color='positive')
+
     def handle_priority_change(args, rows, update_view):
         target = next(r for r in rows if r['id'] == args['row']['id'])
         val = args['val']
@@ -153,10 +165,11 @@ def render_groups(db: Session, container: ui.element, panel: ui.tab_panel):
         with ui.dialog() as add_group_dialog, ui.card().classes('w-[95vw] md:w-[60vw] max-w-[800px] min-h-[250px]'):
             ui.label(get_text('create_new_group')).classes('text-h6')
             name_input = ui.input(get_text('group_name')).props('filled').classes('w-full')
+            strategy_input = ui.select(strategy_options(), value='priority', label=get_text('routing_strategy')).props('filled').classes('w-full')
             async def handle_add_group():
                 if not name_input.value: ui.notify(get_text('group_name_empty_error'), color='negative'); return
                 if crud.get_group_by_name(db, name_input.value): ui.notify(get_text('group_exists_error').format(name=name_input.value), color='negative'); return
-                crud.create_group(db, schemas.GroupCreate(name=name_input.value)); ui.notify(get_text('group_created').format(name=name_input.value), color='positive'); add_group_dialog.close(); await refresh_groups_view()
+                crud.create_group(db, schemas.GroupCreate(name=name_input.value, routing_strategy=strategy_input.value or 'priority')); ui.notify(get_text('group_created').format(name=name_input.value), color='positive'); add_group_dialog.close(); await refresh_groups_view()
             with ui.row():
                 ui.button(get_text('create'), on_click=handle_add_group, color='primary')
                 ui.button(get_text('cancel'), on_click=add_group_dialog.close)
@@ -1,37 +1,104 @@
 from nicegui import ui
 from sqlalchemy.orm import Session
+import html
 import json
+from datetime import datetime
 import re
-from .. import crud
+from .. import crud, models, schemas, log_count, log_search
 from ..language import get_text
 from .common import loading_animation
 
+PAGE_SIZE = 50
+# Columns loaded by crud.get_call_logs (load_only); touching any other column would lazy-load it per row
+SUMMARY_FIELDS = ('id', 'provider_id', 'api_key_id', 'request_timestamp', 'is_success', 'status_code',
+                  'response_time_ms', 'prompt_tokens', 'completion_tokens', 'total_tokens', 'cost',
+                  'error_message', 'requested_model')
+
 def render_logs(db: Session, container: ui.element, panel: ui.tab_panel):
+    # 翻頁游標 (keyset)：before_id 往較舊翻，after_id 往較新翻，兩者皆空時為最新一頁
+    page = {'before_id': None, 'after_id': None, 'first_id': None, 'last_id': None}
+
+    def parse_time(value):
+        value = (value or '').strip()
+        if not value:
+            return None
+        return datetime.strptime(value, '%Y-%m-%d %H:%M')
+
+    def current_filters(filter_mode):
+        def as_int(value):
+            return int(value) if value not in (None, '') else None
+        return schemas.CallLogFilters(
+            is_success={'successful': True, 'failed': False}.get(filter_mode),
+            provider_id=provider_filter.value,
+            api_key_id=api_key_filter.value,
+            status_code=as_int(status_filter.value),
+            min_latency_ms=as_int(latency_filter.value),
+            start_time=parse_time(start_filter.value),
+            end_time=parse_time(end_filter.value),
+        )
+
     def get_logs_with_provider_info(filter_mode='all'):
         db.commit()
         db.expire_all()
-        filter_success = {'successful': True, 'failed': False}.get(filter_mode)
-        logs = crud.get_call_logs(db, limit=50, filter_success=filter_success)
+        filters = current_filters(filter_mode)
+        logs = crud.get_call_logs(db, limit=PAGE_SIZE, filters=filters,
+                                  before_id=page['before_id'], after_id=page['after_id'])
+        if logs:
+            page['first_id'], page['last_id'] = logs[0].id, logs[-1].id
+        elif page['before_id'] is None and page['after_id'] is None:
+            # 新的篩選條件沒有結果：清掉上一組條件的游標 (翻頁到盡頭時則保留目前頁面)
+            page['first_id'] = page['last_id'] = None
+        total, is_estimate = log_count.count(db, filters)
+        total_label.text = f"{get_text('logs_total')}: {'~' if is_estimate else ''}{total}"
         log_data = []
         for log in logs:
-            data = {key: getattr(log, key) for key in log.__table__.columns.keys()}
-            # Prefer data from details table, fallback to legacy columns
-            data['request_body'] = log.details.request_body if log.details else log.request_body
-            data['response_body'] = log.details.response_body if log.details else log.response_body
-            
+            # 只取列表欄位；Body 在打開詳情對話框時才從 call_log_details 讀取
+            data = {key: getattr(log, key) for key in SUMMARY_FIELDS}
             data['api_endpoint'] = log.provider.api_endpoint if log.provider else "N/A"
-            data['model'] = log.provider.model if log.provider else (log.request_body.split('"model": "')[1].split('"')[0] if log.request_body and '"model": "' in log.request_body else "N/A")
+            data['model'] = log.provider.model if log.provider else (log.requested_model or "N/A")
             data['api_key_display'] = f"{log.api_key.key[:5]}...{log.api_key.key[-4:]}" if log.api_key else "N/A"
             if data.get('request_timestamp'):
                 data['request_timestamp'] = data['request_timestamp'].strftime('%Y-%m-%d %H:%M:%S')
             log_data.append(data)
         return log_data
 
+    def load_filter_options():
+        provider_filter.options = {p.id: f"{p.name} ({p.model})" for p in crud.get_providers(db, limit=None)}
+        provider_filter.update()
+        api_key_filter.options = {k.id: k.name or f"{k.key[:5]}...{k.key[-4:]}" for k in db.query(models.APIKey).all()}
+        api_key_filter.update()
+
+    def load_page(before_id=None, after_id=None):
+        page['before_id'], page['after_id'] = before_id, after_id
+        try:
+            rows = get_logs_with_provider_info(log_filter_tabs.value)
+        except ValueError:
+            ui.notify(get_text('invalid_time_filter'), color='negative')
+            return
+        if not rows and (before_id is not None or after_id is not None):
+            # 已到盡頭，保留目前這一頁
+            return
+        logs_table.update_rows(rows)
+
+    def show_newer():
+        if page['first_id'] is not None:
+            load_page(after_id=page['first_id'])
+
+    def show_older():
+        if page['last_id'] is not None:
+            load_page(before_id=page['last_id'])
+
     async def refresh_logs_table():
         async with loading_animation():
-            logs_table.update_rows(get_logs_with_provider_info(log_filter_tabs.value))
+            load_filter_options()
+            load_page()
         ui.notify(get_text('logs_refreshed'), color='positive')
 
+    def clear_filters():
+        for field in (provider_filter, api_key_filter, status_filter, latency_filter, start_filter, end_filter):
+            field.value = None
+        load_page()
+
     with container:
         with ui.row().classes('w-full items-center mb-4'):
             ui.label(get_text('call_logs')).classes('text-h6')
@@ -42,7 +109,56 @@ def render_logs(db: Session, container: ui.element, panel: ui.tab_panel):
             ui.tab('all', label=get_text('all_requests'))
             ui.tab('successful', label=get_text('successful_requests'))
             ui.tab('failed', label=get_text('failed_requests'))
-        log_filter_tabs.on('update:model-value', lambda: logs_table.update_rows(get_logs_with_provider_info(log_filter_tabs.value)))
+        log_filter_tabs.on('update:model-value', lambda: load_page())
+
+        with ui.row().classes('w-full items-center gap-2 mb-4'):
+            provider_filter = ui.select({}, label=get_text('filter_provider'), clearable=True, with_input=True).props('dense outlined').classes('w-48')
+            api_key_filter = ui.select({}, label=get_text('filter_api_key'), clearable=True).props('dense outlined').classes('w-40')
+            status_filter = ui.number(label=get_text('filter_status_code'), format='%d').props('dense outlined').classes('w-32')
+            latency_filter = ui.number(label=get_text('filter_min_latency_ms'), min=0, format='%d').props('dense outlined').classes('w-44')
+            start_filter = ui.input(label=get_text('filter_start_time')).props('dense outlined').classes('w-48')
+            end_filter = ui.input(label=get_text('filter_end_time')).props('dense outlined').classes('w-48')
+            ui.button(get_text('apply_filters'), on_click=lambda: load_page(), icon='filter_alt').props('flat')
+            ui.button(get_text('clear_filters'), on_click=clear_filters, icon='clear').props('flat')
+
+        if log_search.enabled():
+            with ui.row().classes('w-full items-center gap-2 mb-2'):
+                search_input = ui.input(placeholder=get_text('search_logs')).props('dense outlined clearable icon="search"').classes('flex-grow') \
+                    .tooltip(get_text('search_logs_hint'))
+                ui.button(get_text('search'), on_click=lambda: run_search(), icon='search').props('flat')
+            search_results = ui.column().classes('w-full gap-1 mb-4')
+            search_input.on('keydown.enter', lambda: run_search())
+            search_input.on('clear', lambda: search_results.clear())
+
+            def run_search():
+                search_results.clear()
+                query = (search_input.value or '').strip()
+                if not query:
+                    return
+                # 先以控制字元標記命中位置，轉義 HTML 後再換成 <mark>，避免 Body 內容被當作 HTML
+                try:
+                    hits = log_search.search(db, query, limit=20, start='\x02', end='\x03')
+                except log_search.SearchUnavailable:
+                    ui.notify(get_text('search_unavailable'), color='negative')
+                    return
+                logs = {log.id: log for log in crud.get_call_logs_by_ids(db, [hit['id'] for hit in hits])}
+                with search_results:
+                    if not hits:
+                        ui.label(get_text('no_search_results')).classes('text-grey-7')
+                    for hit in hits:
+                        log = logs.get(hit['id'])
+                        if log is None:
+                            continue
+                        model = log.provider.model if log.provider else (log.requested_model or "N/A")
+                        timestamp = log.request_timestamp.strftime('%Y-%m-%d %H:%M:%S') if log.request_timestamp else ''
+                        snippet = html.escape(hit['snippet'] or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+                        with ui.row().classes('w-full no-wrap items-center gap-2 border-b py-1'):
+                            ui.label(f"#{log.id}").classes('font-mono text-grey-7')
+                            ui.label(timestamp).classes('text-grey-7 mobile-hide')
+                            ui.label(model).classes('font-bold')
+                            ui.icon('check_circle' if log.is_success else 'error', color='positive' if log.is_success else 'negative')
+                            ui.html(snippet).classes('flex-grow font-mono text-sm break-all')
+                            ui.button(icon='visibility', on_click=lambda log_id=log.id: show_details({'id': log_id})).props('flat dense color=primary')
 
         # Dialog for error details
         with ui.dialog() as error_dialog, ui.card().style('min-width: 400px;'):
@@ -96,10 +212,16 @@ def render_logs(db: Session, container: ui.element, panel: ui.tab_panel):
                 return body_str
 
         def show_details(row):
-            req_body_area.text = format_body(row.get('request_body'))
-            resp_body_area.text = format_body(row.get('response_body'))
-            req_text_area.text = extract_text(row.get('request_body'), True)
-            resp_text_area.text = extract_text(row.get('response_body'), False)
+            log = crud.get_call_log(db, log_id=row['id'])
+            if log is None:
+                return
+            # Prefer data from details table, fallback to legacy columns
+            request_body = log.details.request_body if log.details else log.request_body
+            response_body = log.details.response_body if log.details else log.response_body
+            req_body_area.text = format_body(request_body)
+            resp_body_area.text = format_body(response_body)
+            req_text_area.text = extract_text(request_body, True)
+            resp_text_area.text = extract_text(response_body, False)
             response_dialog.open()
 
         logs_table = ui.table(columns=[
@@ -114,7 +236,17 @@ def render_logs(db: Session, container: ui.element, panel: ui.tab_panel):
             {'name': 'cost', 'label': get_text('cost'), 'field': 'cost', 'sortable': True, 'classes': 'mobile-hide', 'headerClasses': 'mobile-hide'},
             {'name': 'error_message', 'label': get_text('error'), 'field': 'error_message', 'style': 'max-width: 100px;', 'classes': 'mobile-hide', 'headerClasses': 'mobile-hide'},
             {'name': 'actions', 'label': get_text('actions'), 'field': 'actions'},
-        ], rows=get_logs_with_provider_info(), row_key='id').classes('w-full')
+        ], rows=[], row_key='id').classes('w-full')
+
+        with ui.row().classes('w-full items-center justify-end mt-2'):
+            total_label = ui.label('').classes('text-grey-7')
+            ui.button(get_text('newer_logs'), icon='chevron_left',
+                      on_click=lambda: show_newer()).props('flat dense')
+            ui.button(get_text('older_logs'), icon='chevron_right',
+                      on_click=lambda: show_older()).props('flat dense')
+
+        load_filter_options()
+        load_page()
 
         logs_table.add_slot('body-cell-error_message', f'''
             <q-td :props="props">
@@ -1,7 +1,9 @@
+import json
 from nicegui import ui
 from sqlalchemy.orm import Session
 from .. import crud
 from ..language import get_text
+from ..model_alias import ALIAS_RULES_SETTING, DEFAULT_ALIAS_RULES, format_alias_rules
 
 def render_settings(db: Session, container: ui.element, panel: ui.tab_panel):
     def build_settings():
@@ -39,6 +41,31 @@ def render_settings(db: Session, container: ui.element, panel: ui.tab_panel):
                         ui.notify(f"Error saving settings: {e}", color='negative')
 
                 ui.button(get_text('save'), on_click=save_settings, color='primary').classes('mt-4')
+
+            with ui.card().classes('w-full mt-4'):
+                ui.label(get_text('model_alias_settings')).classes('text-lg font-medium')
+                ui.label(get_text('model_alias_description')).classes('text-sm text-gray-500 mb-4')
+
+                alias_setting = crud.get_setting(db, ALIAS_RULES_SETTING)
+                alias_input = ui.textarea(
+                    value=alias_setting.value if alias_setting and alias_setting.value else format_alias_rules(DEFAULT_ALIAS_RULES)
+                ).props('filled autogrow').classes('w-full font-mono')
+
+                def save_alias_rules():
+                    try:
+                        rules = json.loads(alias_input.value or "{}")
+                        if not isinstance(rules, dict) or not all(isinstance(k, str) and isinstance(v, str) for k, v in rules.items()):
+                            raise ValueError
+                    except ValueError:
+                        ui.notify(get_text('invalid_alias_rules'), color='negative')
+                        return
+                    try:
+                        crud.update_setting(db, ALIAS_RULES_SETTING, format_alias_rules(rules.items()))
+                        ui.notify(get_text('settings_saved'), color='positive')
+                    except Exception as e:
+                        ui.notify(f"Error saving settings: {e}", color='negative')
+
+                ui.button(get_text('save'), on_click=save_alias_rules, color='primary').classes('mt-4')
     
     panel.on('show', build_settings)
     build_settings()
\ No newline at end of file
@@ -1,4 +1,3 @@
-import re
 import json
 import logging
 import os
@@ -6,6 +5,7 @@ from datetime import datetime, timezone, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from .think_filter import strip_think_tags
 
 logger = logging.getLogger(__name__)
 
@@ -36,28 +36,13 @@ def sanitize_openai_response(response_dict: dict) -> dict:
                 
                 content = choice["message"].get("content")
                 if isinstance(content, str) and content:
-                    # Remove <think>...</think> blocks
-                    content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL).strip()
-                    choice["message"]["content"] = content
+                    # Remove <think>...</think> blocks (same state machine as the stream filter)
+                    choice["message"]["content"] = strip_think_tags(content)
             
-            # OpenAI standard for delta in streaming
-            if "delta" in choice and "content" in choice["delta"]:
-                # For streaming, we might not want to filter <think> tags here because it's partial
-                # But if a whole tag is present in one chunk (rare), we could.
-                # Usually filtering <think> in streaming requires a state machine.
-                pass
+            # Streaming deltas are filtered by think_filter.ThinkStreamFilter in the stream generator
 
     return sanitized
 
-def filter_think_tag_from_chunk(chunk_text: str) -> str:
-    """
-    A simple attempt to filter <think> tags from streaming chunks.
-    This is limited as tags might be split across chunks.
-    """
-    # If the chunk contains the whole tag, remove it.
-    # For more robust filtering, a state machine in the stream generator is needed.
-    return re.sub(r'<think>.*?</think>', '', chunk_text, flags=re.DOTALL)
-
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
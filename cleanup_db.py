@@ -15,7 +15,9 @@ def cleanup():
         print("--- 開始資料庫清理程序 ---")
 
         # 需要清空的資料表
-        tables_to_clear = ['call_logs', 'provider_group_association', 'api_providers']
+        # call_log_details 隨 call_logs 一併清空，否則重新從 1 開始的日誌 ID 會撞上舊的詳情資料
+        # call_stats_rollups 以 provider_id 為鍵，不清空的話儀表板會保留舊數據並算到沿用 ID 的新供應商上
+        tables_to_clear = ['call_logs', 'call_log_details', 'call_stats_rollups', 'provider_group_association', 'api_providers']
 
         for table in tables_to_clear:
             try:
@@ -32,6 +34,14 @@ def cleanup():
             # 某些環境可能沒有 sqlite_sequence 表
             pass
 
+        # 重建全文檢索索引 (若已啟用)，確保索引與清空後的日誌一致
+        try:
+            cursor.execute("INSERT INTO call_logs_fts(call_logs_fts) VALUES ('rebuild');")
+            print("已重建全文檢索索引: call_logs_fts")
+        except sqlite3.OperationalError:
+            # 未啟用全文檢索 (LOG_SEARCH_ENABLED=0) 時沒有此表
+            pass
+
         conn.commit()
         print("\n資料庫清理成功完成。")
         
@@ -4,8 +4,13 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 import logging
-from app import models, crud, migrations
-from app.database import engine, SessionLocal
+from app import models, crud, migrations, routing_cache, http_clients, db_async, proxy_metrics, request_timing
+from app.failure_window import failure_window
+from app.log_writer import log_writer
+from app.concurrency import concurrency
+from app.api_key_usage import api_key_usage
+from app.loop_monitor import loop_monitor
+from app.database import engine, SessionLocal, report_database_settings
 from app.ui import create_ui
 from nicegui import ui
 
@@ -42,6 +47,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Count and time proxy requests for /metrics
+app.add_middleware(proxy_metrics.ProxyMetricsMiddleware)
+# Per-phase timing of proxy requests (Server-Timing header with SERVER_TIMING_DEBUG=true)
+app.add_middleware(request_timing.RequestTimingMiddleware)
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     body = await request.body()
@@ -80,6 +90,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 from app.api import router as api_router, proxy_router
 app.include_router(api_router, prefix="/api")
 app.include_router(proxy_router) # Mount proxy routes at root for compatibility
+app.include_router(proxy_metrics.router)  # Prometheus scrape endpoint
 
 # Serve frontend static files if built (mounted at /admin)
 import os
@@ -115,15 +126,41 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 async def on_startup():
     init_db()
     migrations.run_migrations()
+    report_database_settings()
     
     # Reset active calls to 0 on startup
     db = SessionLocal()
     try:
         crud.reset_all_active_calls(db)
+        concurrency.reset()
         print("Active calls reset to 0.")
+
+        # Restore recent failures so failover state survives restarts
+        failure_window.seed_from_db(db)
     finally:
         db.close()
 
+    # Start the background call log writer
+    log_writer.start()
+    # Periodically persist the in-memory active call counters
+    concurrency.start()
+    # Batch API key last_used_at updates
+    api_key_usage.start()
+    # Sample event loop lag (and optionally detect blocking calls)
+    loop_monitor.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await loop_monitor.stop()
+    # Flush queued call logs before the process exits
+    await log_writer.stop()
+    await concurrency.stop()
+    await api_key_usage.stop()
+    # Close pooled upstream connections
+    await http_clients.close_all()
+    # Background writers have flushed; release the database worker threads
+    db_async.shutdown()
+
 # API routes should be included before NiceGUI
 # (They are already included above)
 